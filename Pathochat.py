@@ -1,10 +1,15 @@
+import functools
+import html
 import os
+import threading
+import time
 import streamlit as st
-from langchain_huggingface import HuggingFaceEndpoint, HuggingFaceEmbeddings
-from langchain_core.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import FAISS
 from datetime import datetime
+from api_client import API_URL, PathochatClient
+from metrics import CACHE_RESOURCE, LOADS, open_metrics_server, record_query, watch_vector_store
+from tracing import get_tracer
+# Langchain, FAISS and the models load on the warmup thread, not at import
+from warmup import start_warmup
 
 # Configure page
 st.set_page_config(
@@ -23,6 +28,10 @@ st.set_page_config(
 # st.write(f"File size: {size_mb:.2f} MB")
 # Vector DB path
 db_path = os.path.join(os.getcwd(), "faiss_database")
+# Model of the single endpoint; PATHOCHAT_LLM_ENDPOINTS spreads generation over a pool instead
+hf_rep_id = os.getenv("PATHOCHAT_HF_REPO_ID", "mistralai/Mistral-7B-Instruct-v0.3")
+# Sidebar panel with per-stage latency histograms for operators
+ADMIN_PANEL = os.getenv("PATHOCHAT_ADMIN", "").lower() in ("1", "true", "yes")
 # st.write("Current dir:", os.getcwd())
 # st.write("Files in dir:", os.listdir("faiss_database"))
 
@@ -238,6 +247,23 @@ st.markdown("""
         animation: slideInRight 0.3s ease-out;
     }
     
+    .passage-card {
+        background: rgba(30, 41, 59, 0.6);
+        color: #e2e8f0;
+        padding: 0.8rem 1.4rem;
+        border-radius: 12px;
+        margin: 0.5rem 15% 0.5rem 0;
+        border-left: 3px solid #38bdf8;
+        word-wrap: break-word;
+    }
+    
+    .passage-card mark {
+        background: rgba(250, 204, 21, 0.35);
+        color: inherit;
+        padding: 0 2px;
+        border-radius: 3px;
+    }
+    
     .assistant-message {
         background: linear-gradient(145deg, rgba(15, 23, 42, 0.9) 0%, rgba(30, 41, 59, 0.8) 100%);
         color: #f1f5f9;
@@ -420,7 +446,7 @@ st.markdown("""
     /* Responsive design */
     @media (max-width: 768px) {
         .medical-title { font-size: 2rem; }
-        .user-message, .assistant-message { 
+        .user-message, .assistant-message, .passage-card { 
             margin-left: 5%; 
             margin-right: 5%; 
         }
@@ -429,61 +455,164 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+_cache_miss = threading.local()
+
+def cache_resource(fn):
+    """st.cache_resource that counts hits and misses per function for /metrics."""
+    @functools.wraps(fn)
+    def load(*args, **kwargs):
+        # Only runs when Streamlit has nothing cached for these arguments; set
+        # after fn so cached functions it calls don't reset the flag
+        result = fn(*args, **kwargs)
+        _cache_miss.value = True
+        return result
+
+    cached = st.cache_resource(load)
+
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        _cache_miss.value = False
+        try:
+            return cached(*args, **kwargs)
+        finally:
+            CACHE_RESOURCE.inc(function=fn.__name__, result="miss" if _cache_miss.value else "hit")
+
+    return call
+
+# Vector store, endpoint, reranker, answer cache and engine load on one
+# background thread per server process, started by the first page view
+def get_warmup():
+    return start_warmup(db_path, k=4, hf_rep_id=hf_rep_id)
+
 # Cache the vector store loading
-@st.cache_resource
+@cache_resource
 def load_vector_store():
     try:
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
         st.write("🔍 Loading vector store from:", db_path)
-        db = FAISS.load_local(db_path,embeddings=embeddings, allow_dangerous_deserialization=True)
+        # Waits for the warmup if the index is still loading
+        db = get_warmup().wait("vector_store")
         st.success("✅ Vector store loaded successfully.")
+        LOADS.inc(resource="vector_store", outcome="ok")
+        watch_vector_store(db, db_path)
         return db
     except Exception as e:
+        LOADS.inc(resource="vector_store", outcome="error")
         st.write(f"Loading from: {db_path}")
         st.error(f"Failed to load vector store: {str(e)}")
         return None
 
-# Prompt template
-PROMPT_TEMPLATE = """
-You are a focused assistant. Your task is to generate accurate answers using only the context provided.
-- Do not include external knowledge.
-- Do not speculate. If the context lacks the answer, respond with: "I don't know."
-- No fluff, greetings, or commentary — jump straight to the answer.
-
-[Context]
-{context}
-
-[Question]
-{question}
-
-[Answer]
-"""
-
-def get_prompt(template):
-    return PromptTemplate(
-        template=template,
-        input_variables=["context", "question"]
-    )
-
-# HF token
-HF_TOKEN = os.getenv("HF_TOKEN")
-
 # LLM Endpoint config
-@st.cache_resource
+@cache_resource
 def get_hf_endpoint(hf_rep_id):
     try:
-        llm = HuggingFaceEndpoint(
-            repo_id=hf_rep_id,
-            temperature=0.5,
-            provider="hf-inference",
-            max_new_tokens=1024,
-            huggingfacehub_api_token=HF_TOKEN
-        )
+        llm = start_warmup(db_path, k=4, hf_rep_id=hf_rep_id).wait("llm")
+        LOADS.inc(resource="llm", outcome="ok")
         return llm
     except Exception as e:
+        LOADS.inc(resource="llm", outcome="error")
         st.error(f"Failed to initialize LLM: {str(e)}")
         return None
 
+# Optional cross-encoder reranker (PATHOCHAT_RERANKER)
+@cache_resource
+def get_reranker():
+    try:
+        return get_warmup().wait("reranker")
+    except Exception as e:
+        st.error(f"Failed to load reranker, using retrieval order: {str(e)}")
+        return None
+
+# Semantic answer cache shared by all sessions of this server; None until warm
+def get_answer_cache():
+    return get_warmup().get("answer_cache")
+
+# Query engine: retriever, prompt and chain are built once per process
+@cache_resource
+def get_query_engine(_db, _llm):
+    # Near-identical questions are answered from the semantic answer cache
+    # Exact terms (eponyms, genes, stains) are caught by the BM25 index
+    get_reranker()
+    return get_warmup().wait("engine")
+
+# Retrieval-only engine for "Find Passages": ready before the LLM, never calls it
+@cache_resource
+def get_search_engine(_db):
+    return get_warmup().wait("retriever")
+
+# Thin-client mode: queries go to api_server.py over a keep-alive session
+@cache_resource
+def get_api_client():
+    return PathochatClient(API_URL)
+
+def show_cache_metrics():
+    if API_URL:
+        return
+    cache = get_answer_cache()
+    if cache is None:
+        return
+    metrics = cache.metrics()
+    with st.sidebar:
+        st.markdown("### ♻️ Answer Cache")
+        st.metric("Hit rate", f"{metrics['hit_rate']:.0%}", help=f"{metrics['hits']} hits, {metrics['misses']} misses")
+        st.metric("Generation time saved", f"{metrics['saved_seconds']:.1f} s")
+        st.caption(f"{metrics['entries']} cached answers")
+
+def show_trace_panel():
+    if not ADMIN_PANEL:
+        return
+    tracer = get_tracer()
+    stages = tracer.stages()
+    with st.sidebar:
+        st.markdown("### ⏱️ Latency by Stage")
+        if not stages:
+            st.caption("No traced queries yet")
+            return
+        rows = [
+            {"stage": stage, "count": summary["count"], "p50 ms": round(summary["p50_ms"], 1),
+             "p95 ms": round(summary["p95_ms"], 1), "p99 ms": round(summary["p99_ms"], 1)}
+            for stage, summary in sorted(stages.items(), key=lambda item: -item[1]["p95_ms"])
+        ]
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        stage = st.selectbox("Histogram", [row["stage"] for row in rows])
+        buckets = tracer.buckets(stage)
+        filled = [i for i, (_, count) in enumerate(buckets) if count]
+        if filled:
+            buckets = buckets[filled[0]:filled[-1] + 1]
+            st.dataframe(
+                [{"≤ ms": "∞" if bound == float("inf") else f"{bound:g}", "samples": count} for bound, count in buckets],
+                hide_index=True,
+                use_container_width=True,
+                column_config={"samples": st.column_config.ProgressColumn(
+                    "samples", format="%d", min_value=0, max_value=max(count for _, count in buckets)
+                )},
+            )
+        counters = tracer.counters
+        st.caption(
+            f"Cache {counters.get('cache_hits', 0)} hits / {counters.get('cache_misses', 0)} misses · "
+            f"{counters.get('prompt_tokens', 0)} prompt / {counters.get('completion_tokens', 0)} completion tokens · "
+            f"{counters.get('errors', 0)} errors"
+        )
+
+def show_startup_panel():
+    if not ADMIN_PANEL or API_URL:
+        return
+    profile = get_warmup().profile()
+    with st.sidebar:
+        st.markdown("### 🚀 Startup")
+        if profile["ready_s"] is None:
+            st.caption(f"Warming up: {get_warmup().current_step()}")
+        else:
+            st.caption(f"Ready {profile['ready_s']:.1f} s after first page view ({profile['status']})")
+        steps = [{"step": step, "ms": round(seconds * 1000, 1)} for step, seconds in profile["steps_s"].items()]
+        imports = [{"import": module, "ms": round(seconds * 1000, 1)}
+                   for module, seconds in sorted(profile["imports_s"].items(), key=lambda item: -item[1])]
+        if steps:
+            st.dataframe(steps, hide_index=True, use_container_width=True)
+        if imports:
+            st.dataframe(imports, hide_index=True, use_container_width=True)
+        for step, error in profile["errors"].items():
+            st.caption(f"⚠️ {step}: {error}")
+
 def display_chat_message(role, content):
     """Display a chat message with enhanced slate styling"""
     if role == "user":
@@ -510,7 +639,34 @@ def display_chat_message(role, content):
             with st.expander("📚 View Medical Literature Sources", expanded=False):
                 st.text(sources)
 
+def display_passages(message, index):
+    """Ranked passages with highlighted query terms; True when an answer from them is requested"""
+    passages = message['passages']
+    st.markdown(f"""
+    <div class="assistant-message">
+        <strong>🔬 PathoCare AI:</strong><br>
+        {len(passages)} textbook passages for "{html.escape(message['query'])}"
+    </div>
+    """, unsafe_allow_html=True)
+    for p in passages:
+        where = [p['source'], p['chapter'], p['section'], p['page'] and f"page {p['page']}"]
+        st.markdown(f"""
+        <div class="passage-card">
+            <strong>#{p['rank']}</strong> <small>{html.escape(" · ".join(str(part) for part in where if part))}</small><br>
+            {p['snippet_html']}
+        </div>
+        """, unsafe_allow_html=True)
+    st.caption(f"📖 {len(passages)} passages in {message['search_ms']:.0f} ms")
+    return st.button("✍️ Generate an answer from these passages", key=f"generate_{index}")
+
 def main():
+    # Time of the whole script run, i.e. one Streamlit rerender
+    render_started = time.perf_counter()
+    # Start loading models now so the first query doesn't wait for them
+    warmup = None if API_URL else get_warmup()
+    # Counters and gauges on PATHOCHAT_METRICS_PORT, started once per server process
+    open_metrics_server()
+    
     # Enhanced medical header
     st.markdown("""
     <div class="medical-header">
@@ -528,18 +684,27 @@ def main():
     
     col1, col2, col3 = st.columns(3)
     
+    # Readiness of the background warmup; the thin client is always ready
+    status = "ready" if warmup is None else warmup.status()
+    if status == "ready":
+        icon, label, detail = "🟢", "Online & Active", "Real-time diagnostics ready"
+    elif status == "warming":
+        icon, label, detail = "🟡", "Warming Up", f"Loading {warmup.current_step() or 'models'}..."
+    else:
+        icon, label, detail = "🔴", "Degraded", "Knowledge base failed to load"
+    
     with col1:
-        st.markdown("""
+        st.markdown(f"""
         <div class="status-card">
-            <div class="status-icon">🟢</div>
+            <div class="status-icon">{icon}</div>
             <div class="status-title">System Status</div>
             <div class="status-value">
                 <div class="status-indicator">
                     <div class="indicator-dot"></div>
-                    Online & Active
+                    {label}
                 </div>
             </div>
-            <small style="color: #94a3b8;">Real-time diagnostics ready</small>
+            <small style="color: #94a3b8;">{detail}</small>
         </div>
         """, unsafe_allow_html=True)
     
@@ -585,8 +750,22 @@ def main():
         """, unsafe_allow_html=True)
     
     # Show previous messages
-    for message in st.session_state.messages:
+    generate_request = None
+    for index, message in enumerate(st.session_state.messages):
+        if message.get('passages') is not None:
+            if display_passages(message, index):
+                generate_request = (message['query'], message['docs'])
+            continue
         display_chat_message(message['role'], message['content'])
+        if message.get('fallback') == 'cache':
+            st.caption("⚠️ AI model unavailable: answer to a similar earlier question")
+        elif message.get('fallback') == 'retrieval':
+            st.caption("⚠️ AI model unavailable: most relevant textbook passages")
+        elif message.get('cached'):
+            st.caption("♻️ Answered from cache")
+        elif message.get('ttft_ms') is not None:
+            total = f", full answer in {message['total_ms']:.0f} ms" if message.get('total_ms') else ""
+            st.caption(f"⚡ First token after {message['ttft_ms']:.0f} ms{total}")
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -604,7 +783,7 @@ def main():
 )
     
     # Add submit button with medical styling
-    submit_col1, submit_col2, submit_col3 = st.columns([1, 2, 1])
+    submit_col1, submit_col2, submit_col3, submit_col4 = st.columns([1, 2, 2, 1])
     
     with submit_col2:
         submit_button = st.button(
@@ -613,15 +792,71 @@ def main():
             type="primary"
         )
     
+    # Passages only, no generation: answers in milliseconds
+    with submit_col3:
+        search_button = st.button(
+            "📖 Find Passages",
+            use_container_width=True
+        )
+    
     st.markdown('</div>', unsafe_allow_html=True)
     
-    # Process query when submitted
+    # Retrieval-only search: ranked, highlighted passages without the LLM
+    if search_button and user_query.strip():
+        st.session_state.messages.append({'role': 'user', 'content': user_query})
+        tracer = get_tracer()
+        trace = tracer.begin("search")
+        trace_token = tracer.activate(trace)
+        try:
+            if API_URL:
+                with tracer.span("api"):
+                    response = get_api_client().search(user_query)
+            else:
+                db = load_vector_store()
+                if db is None:
+                    trace.set(error="db_unavailable")
+                    error_msg = "❌ Medical database unavailable. Please ensure the pathology knowledge base is properly loaded."
+                    st.error(error_msg)
+                    st.session_state.messages.append({'role': 'assistant', 'content': error_msg})
+                    st.rerun()
+                response = get_search_engine(db).search(user_query)
+            st.session_state.messages.append({
+                'role': 'assistant',
+                'content': '',
+                'query': user_query,
+                'passages': response['passages'],
+                'docs': response['source_documents'],
+                'search_ms': (time.perf_counter() - trace.started) * 1000
+            })
+            st.rerun()
+        except Exception as e:
+            trace.set(error=type(e).__name__)
+            error_msg = f"❌ Passage search error: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({'role': 'assistant', 'content': error_msg})
+            st.rerun()
+        finally:
+            tracer.finish(trace, trace_token)
+    
+    # Process query when submitted, or generate from passages found earlier
+    answer_request = None
     if submit_button and user_query.strip():
         # Add user message to session state
         st.session_state.messages.append({'role': 'user', 'content': user_query})
+        answer_request = (user_query, None)
+    elif generate_request is not None:
+        st.session_state.messages.append({
+            'role': 'user', 'content': f"✍️ Answer from the passages found for: {generate_request[0]}"
+        })
+        answer_request = generate_request
+    
+    if answer_request is not None:
+        # Passages from a search skip retrieval; None retrieves as usual
+        user_query, passage_docs = answer_request
         
-        # Show loading animation without container
-        st.markdown("""
+        # Show loading animation without container; replaced by the first streamed token
+        loading = st.empty()
+        loading.markdown("""
         <div style="text-align: center; padding: 2rem; background: rgba(148, 163, 184, 0.1); border-radius: 12px; margin: 1rem 0;">
             <div class="loading-dots">
                 <div class="loading-dot"></div>
@@ -633,57 +868,93 @@ def main():
         </div>
         """, unsafe_allow_html=True)
         
+        # Every stage of this query is timed on one trace (see tracing.py)
+        tracer = get_tracer()
+        trace = tracer.begin("query")
+        trace_token = tracer.activate(trace)
         try:
+            if API_URL:
+                with tracer.span("api"):
+                    response = get_api_client().answer(user_query, passage_docs)
+                trace.set(cache="hit" if response['cached'] else "miss")
+                loading.empty()
+                st.session_state.messages.append({
+                    'role': 'assistant',
+                    'content': response['result'] + "\n\nSource Docs:\n" + str(response['source_documents']),
+                    'cached': response['cached'],
+                    'fallback': response.get('fallback')
+                })
+                st.rerun()
+            
             # Load vector store
             db = load_vector_store()
             if db is None:
+                trace.set(error="db_unavailable")
                 error_msg = "❌ Medical database unavailable. Please ensure the pathology knowledge base is properly loaded."
                 st.error(error_msg)
                 st.session_state.messages.append({'role': 'assistant', 'content': error_msg})
                 st.rerun()
             
-            # Setup retrieval
-            retriever = db.as_retriever(search_kwargs={"k": 4})
-            hf_rep_id = "mistralai/Mistral-7B-Instruct-v0.3"
             llm = get_hf_endpoint(hf_rep_id)
             
             if llm is None:
+                trace.set(error="llm_unavailable")
                 error_msg = "❌ AI diagnostic engine initialization failed. Please verify HuggingFace authentication."
                 st.error(error_msg)
                 st.session_state.messages.append({'role': 'assistant', 'content': error_msg})
                 st.rerun()
             
-            prompt = get_prompt(PROMPT_TEMPLATE)
+            engine = get_query_engine(db, llm)
             
-            # Setup RetrievalQA chain
-            retrieval_qa = RetrievalQA.from_chain_type(
-                llm=llm,
-                chain_type="stuff",
-                retriever=retriever,
-                return_source_documents=True,
-                chain_type_kwargs={"prompt": prompt}
-            )
+            # Stream the response into a placeholder as tokens arrive
+            answer = engine.stream_answer(user_query, docs=passage_docs)
+            answer_box = st.empty()
+            partial = ""
+            for token in answer:
+                if not partial:
+                    loading.empty()
+                partial += token
+                with tracer.span("render"):
+                    answer_box.markdown(f"""
+                    <div class="assistant-message">
+                        <strong>🔬 PathoCare AI:</strong><br>
+                        {partial}▌
+                    </div>
+                    """, unsafe_allow_html=True)
             
-            # Get response
-            response = retrieval_qa.invoke({"query": user_query})
-            
-            result = response["result"]
-            source_documents = response["source_documents"]
+            result = answer.result
+            source_documents = answer.source_documents
             
             # Format full response
             original_res = result + "\n\nSource Docs:\n" + str(source_documents)
             
             # Add assistant message to session state
-            st.session_state.messages.append({'role': 'assistant', 'content': original_res})
+            st.session_state.messages.append({
+                'role': 'assistant',
+                'content': original_res,
+                'ttft_ms': None if answer.time_to_first_token is None else answer.time_to_first_token * 1000,
+                'total_ms': None if answer.total_time is None else answer.total_time * 1000,
+                'cached': answer.cached,
+                'fallback': answer.fallback
+            })
             
             # Rerun to display the new messages
             st.rerun()
             
         except Exception as e:
+            trace.set(error=type(e).__name__)
             error_msg = f"❌ Diagnostic analysis error: {str(e)}"
             st.error(error_msg)
             st.session_state.messages.append({'role': 'assistant', 'content': error_msg})
             st.rerun()
+        finally:
+            # st.rerun() leaves through here too
+            tracer.finish(trace, trace_token)
+            record_query(trace, "api" if API_URL else "local")
+    
+    show_cache_metrics()
+    show_trace_panel()
+    show_startup_panel()
     
     # Medical footer with proper rendering
     st.markdown("---")
@@ -708,6 +979,8 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
+    get_tracer().observe("page_render", time.perf_counter() - render_started)
+    
 
 if __name__ == "__main__":
     main()
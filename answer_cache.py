@@ -0,0 +1,191 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+ANSWER_CACHE_PATH = os.getenv("PATHOCHAT_ANSWER_CACHE", os.path.join("vector_store", "answer_cache.sqlite"))
+# Cosine similarity between query embeddings needed to reuse an answer
+SIMILARITY_THRESHOLD = float(os.getenv("PATHOCHAT_ANSWER_CACHE_THRESHOLD", "0.95"))
+TTL_SECONDS = float(os.getenv("PATHOCHAT_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("PATHOCHAT_ANSWER_CACHE_ENTRIES", "10000"))
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _dump_sources(docs):
+    return json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs])
+
+
+def _load_sources(text):
+    return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.loads(text)]
+
+
+class AnswerCache:
+    """Semantic answer cache keyed on query embeddings, persisted in SQLite.
+
+    Embeddings of live entries are kept in memory as one normalized matrix so
+    a lookup is a single matrix-vector product. Entries expire after
+    ``ttl`` seconds, the least recently used are evicted past
+    ``max_entries``, and everything is dropped when ``index_version``
+    differs from the one the cache was filled against.
+
+    ``current_version`` returns the version of the index on disk now; it is
+    checked on every lookup and put. Once the index has been rebuilt under a
+    running process, entries made for older indexes are dropped and this
+    process, still searching the index it loaded, neither reads nor fills the
+    cache again.
+    """
+
+    def __init__(self, path, index_version, threshold=SIMILARITY_THRESHOLD, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES,
+                 current_version=None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.index_version = index_version
+        self.current_version = current_version
+        self.stale = False
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, query TEXT, embedding BLOB, "
+            "answer TEXT, sources TEXT, created REAL, last_used REAL, generation_seconds REAL)"
+        )
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'index_version'").fetchone()
+        if row is None or row[0] != index_version:
+            # The vector store was rebuilt: cached answers may cite stale passages
+            self.db.execute("DELETE FROM answers")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('index_version', ?)", (index_version,))
+        self.db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+
+        rows = self.db.execute("SELECT id, embedding FROM answers").fetchall()
+        self.ids = [entry_id for entry_id, _ in rows]
+        self.matrix = (
+            np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows]) if rows else None
+        )
+
+    def _drop(self, entry_ids):
+        drop = set(entry_ids)
+        self.db.executemany("DELETE FROM answers WHERE id = ?", [(i,) for i in drop])
+        keep = [pos for pos, entry_id in enumerate(self.ids) if entry_id not in drop]
+        self.ids = [self.ids[pos] for pos in keep]
+        self.matrix = self.matrix[keep] if keep else None
+
+    def _current(self):
+        """False once the index on disk is newer than the one this process loaded."""
+        if self.stale or self.current_version is None:
+            return not self.stale
+        version = self.current_version()
+        if version == self.index_version:
+            return True
+        self.stale = True
+        # First process to notice drops the answers made for older indexes
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute("SELECT value FROM meta WHERE name = 'index_version'").fetchone()
+            if row is None or row[0] != version:
+                self.db.execute("DELETE FROM answers")
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('index_version', ?)", (version,))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.ids, self.matrix = [], None
+        print("Vector store rebuilt: answer cache off until this process restarts")
+        return False
+
+    def _find(self, vector, threshold):
+        if not self._current() or self.matrix is None:
+            return None
+        scores = self.matrix @ _normalize(vector)
+        best = int(np.argmax(scores))
+        if scores[best] < (self.threshold if threshold is None else threshold):
+            return None
+        entry_id = self.ids[best]
+        row = self.db.execute(
+            "SELECT answer, sources, created, generation_seconds FROM answers WHERE id = ?", (entry_id,)
+        ).fetchone()
+        # Gone: expired or cleared by another process sharing the file
+        if row is None or time.time() - row[2] > self.ttl:
+            self._drop([entry_id])
+            return None
+        answer, sources, _, generation_seconds = row
+        self.db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+        return {"result": answer, "source_documents": _load_sources(sources), "similarity": float(scores[best]),
+                "generation_seconds": generation_seconds}
+
+    def lookup(self, vector, threshold=None, count=True):
+        """Return ``{"result", "source_documents", "similarity"}`` or None.
+
+        ``threshold`` overrides the cache's similarity threshold for this lookup;
+        ``count=False`` keeps it out of the hit rate (the LLM fallback's lookups).
+        """
+        with self.lock:
+            hit = self._find(vector, threshold)
+            if count and hit is None:
+                self.misses += 1
+            elif count:
+                self.hits += 1
+                self.saved_seconds += hit["generation_seconds"]
+        if hit is not None:
+            del hit["generation_seconds"]
+        return hit
+
+    def put(self, query, vector, result, source_documents, generation_seconds):
+        vector = _normalize(vector)
+        now = time.time()
+        with self.lock:
+            if not self._current():
+                return
+            cursor = self.db.execute(
+                "INSERT INTO answers (query, embedding, answer, sources, created, last_used, generation_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (query, vector.tobytes(), result, _dump_sources(source_documents), now, now, generation_seconds),
+            )
+            self.ids.append(cursor.lastrowid)
+            self.matrix = vector[None, :] if self.matrix is None else np.vstack([self.matrix, vector])
+            overflow = len(self.ids) - self.max_entries
+            if overflow > 0:
+                victims = self.db.execute(
+                    "SELECT id FROM answers ORDER BY last_used LIMIT ?", (overflow,)
+                ).fetchall()
+                self._drop([entry_id for (entry_id,) in victims])
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+def open_answer_cache(db_path, path=ANSWER_CACHE_PATH):
+    # PATHOCHAT_ANSWER_CACHE=off disables the cache
+    if path.lower() in ("", "off", "none"):
+        return None
+    from vector_store import index_version
+
+    try:
+        return AnswerCache(path, index_version(db_path), current_version=functools.partial(index_version, db_path))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Answer cache disabled: {e}")
+        return None
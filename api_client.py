@@ -0,0 +1,53 @@
+import os
+
+# Base URL of a running api_server.py; when set the Streamlit app is a thin client
+API_URL = os.getenv("PATHOCHAT_API_URL")
+TIMEOUT = float(os.getenv("PATHOCHAT_API_TIMEOUT", "120"))
+
+
+def to_documents(items):
+    from langchain_core.documents import Document
+
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in items]
+
+
+class PathochatClient:
+    """Client for api_server.py over one keep-alive connection pool."""
+
+    def __init__(self, base_url=API_URL, timeout=TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # Imported here so the Streamlit app doesn't pay for requests unless it is a thin client
+        import requests
+
+        self.session = requests.Session()
+
+    def _post(self, path, payload):
+        response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def health(self):
+        response = self.session.get(self.base_url + "/healthz", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def retrieve(self, query, k=None):
+        payload = {"query": query, "k": k} if k else {"query": query}
+        return to_documents(self._post("/retrieve", payload)["documents"])
+
+    def search(self, query, k=None):
+        """Same shape as ``QueryEngine.search``."""
+        payload = {"query": query, "k": k} if k else {"query": query}
+        response = self._post("/search", payload)
+        response["source_documents"] = to_documents(response["source_documents"])
+        return response
+
+    def answer(self, query, docs=None):
+        """Same shape as ``QueryEngine.answer``; ``docs`` answers from passages already found by ``search``."""
+        payload = {"query": query}
+        if docs is not None:
+            payload["documents"] = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+        response = self._post("/query", payload)
+        response["source_documents"] = to_documents(response["source_documents"])
+        return response
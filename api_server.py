@@ -0,0 +1,188 @@
+"""Long-running HTTP API over the retrieval + generation pipeline.
+
+The embedding model, FAISS index and LLM endpoint are loaded once at startup
+and shared by every request; connections are kept alive between requests.
+
+    python api_server.py --port 8000
+    curl -s localhost:8000/query -d '{"query": "What is coagulative necrosis?"}'
+
+Endpoints:
+    GET  /healthz   load state and queue depth
+    POST /retrieve  {"query": str, "k": int?} -> top-k passages, k at most PATHOCHAT_API_MAX_K
+    POST /search    {"query": str, "k": int?} -> ranked passages with page, source and highlighted matches
+    POST /query     {"query": str, "documents": [passage]?} -> answer and source passages; with
+                    "documents" (the source_documents of a /search) it answers from those passages
+                    and neither reads nor fills the shared answer cache
+    GET  /metrics   counters, gauges and per-stage latency histograms in Prometheus text format
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from aiohttp import web
+from langchain_core.documents import Document
+
+from async_engine import MAX_CONCURRENCY, QUEUE_SIZE, AsyncQueryEngine, Overloaded
+from metrics import REGISTRY, watch_vector_store
+from reranker import FETCH_K
+
+ENGINE_KEY = web.AppKey("engine", AsyncQueryEngine)
+# Larger k is clamped: one request must not force a huge search, fetch and highlighting pass
+MAX_K = int(os.getenv("PATHOCHAT_API_MAX_K", str(FETCH_K)))
+
+
+def document_json(doc):
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+
+async def read_query(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="request body must be JSON")
+    query = body.get("query") if isinstance(body, dict) else None
+    if not isinstance(query, str) or not query.strip():
+        raise web.HTTPBadRequest(text='expected {"query": "..."}')
+    return body, query
+
+
+def read_k(body):
+    # None or 0 for the engine's default k
+    try:
+        k = int(body.get("k") or 0)
+    except (TypeError, ValueError, OverflowError):
+        raise web.HTTPBadRequest(text='"k" must be a positive integer')
+    if k < 0:
+        raise web.HTTPBadRequest(text='"k" must be a positive integer')
+    return min(k, MAX_K) or None
+
+
+def read_documents(body):
+    # Passages to answer from instead of retrieving; None retrieves as usual
+    items = body.get("documents")
+    if items is None:
+        return None
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_K or not all(
+        isinstance(item, dict) and isinstance(item.get("page_content"), str)
+        and isinstance(item.get("metadata", {}), dict) for item in items
+    ):
+        raise web.HTTPBadRequest(
+            text=f'"documents" must be 1 to {MAX_K} passages {{"page_content": str, "metadata": {{...}}}}'
+        )
+    return [Document(page_content=item["page_content"], metadata=item.get("metadata", {})) for item in items]
+
+
+async def healthz(request):
+    engine = request.app[ENGINE_KEY]
+    return web.json_response({"status": "ok", "vectors": engine.engine.db.index.ntotal, **engine.stats()})
+
+
+async def metrics(request):
+    tracer = request.app[ENGINE_KEY].engine.tracer
+    text = REGISTRY.text() + tracer.prometheus_text()
+    return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+
+async def retrieve(request):
+    body, query = await read_query(request)
+    engine = request.app[ENGINE_KEY]
+    started = time.perf_counter()
+    docs = await engine.retrieve(query, read_k(body))
+    return web.json_response({
+        "documents": [document_json(doc) for doc in docs],
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    })
+
+
+async def search(request):
+    body, query = await read_query(request)
+    engine = request.app[ENGINE_KEY]
+    started = time.perf_counter()
+    response = await engine.search(query, read_k(body))
+    return web.json_response({
+        "passages": response["passages"],
+        "source_documents": [document_json(doc) for doc in response["source_documents"]],
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    })
+
+
+async def query(request):
+    body, query = await read_query(request)
+    docs = read_documents(body)
+    engine = request.app[ENGINE_KEY]
+    started = time.perf_counter()
+    try:
+        # Shed load instead of letting the queue grow without bound
+        future = await engine.try_submit(query, docs)
+    except Overloaded as e:
+        raise web.HTTPServiceUnavailable(text=str(e), headers={"Retry-After": "1"})
+    response = await future
+    return web.json_response({
+        "result": response["result"],
+        "source_documents": [document_json(doc) for doc in response["source_documents"]],
+        "cached": response["cached"],
+        "fallback": response["fallback"],
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    })
+
+
+def create_app(engine, max_concurrency=MAX_CONCURRENCY, queue_size=QUEUE_SIZE):
+    """aiohttp application serving ``engine``, a shared ``QueryEngine``."""
+    app = web.Application()
+    app[ENGINE_KEY] = AsyncQueryEngine(engine, max_concurrency=max_concurrency, queue_size=queue_size)
+
+    async def lifecycle(app):
+        await app[ENGINE_KEY].start()
+        yield
+        await app[ENGINE_KEY].close()
+
+    app.cleanup_ctx.append(lifecycle)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_post("/retrieve", retrieve)
+    app.router.add_post("/search", search)
+    app.router.add_post("/query", query)
+    return app
+
+
+def start_api(engine, port=0, **options):
+    """Serve ``engine`` from a background thread; returns ``(stop, url)``."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(create_app(engine, **options), access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    loop.run_until_complete(site.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    port = runner.addresses[0][1]
+    return stop, f"http://127.0.0.1:{port}"
+
+
+def main():
+    from query_engine import HF_REPO_ID, load_query_engine
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--hf-repo-id", default=HF_REPO_ID)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    args = parser.parse_args()
+
+    engine = load_query_engine(args.db, k=args.k, hf_rep_id=args.hf_repo_id)
+    watch_vector_store(engine.db, args.db)
+    app = create_app(engine, max_concurrency=args.max_concurrency, queue_size=args.queue_size)
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from context_packer import count_tokens
+from llm_client import LLMUnavailable
+
+# Requests generating at once, and requests allowed to wait for a slot
+MAX_CONCURRENCY = 16
+QUEUE_SIZE = 64
+RETRIEVAL_THREADS = 4
+
+
+class Overloaded(Exception):
+    """Raised by ``try_submit`` when the backpressure queue is full."""
+
+
+class AsyncQueryEngine:
+    """asyncio front end for a ``QueryEngine``.
+
+    Query embedding, answer-cache lookups and FAISS search run in a small
+    thread pool; generation goes through the LLM's ``ainvoke`` so requests
+    overlap their network wait on the endpoint without a thread each. ``max_concurrency`` workers
+    take requests from a queue of ``queue_size``: ``answer`` waits for room
+    when it is full, ``try_submit`` raises ``Overloaded`` instead.
+
+        async with AsyncQueryEngine(load_query_engine(db_path)) as engine:
+            response = await engine.answer("What is coagulative necrosis?")
+    """
+
+    def __init__(self, engine, max_concurrency=MAX_CONCURRENCY, queue_size=QUEUE_SIZE,
+                 retrieval_threads=RETRIEVAL_THREADS):
+        self.engine = engine
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.retrieval_threads = retrieval_threads
+        self.executor = None
+        self.queue = None
+        self.workers = []
+        self.in_flight = 0
+
+    async def start(self):
+        if self.workers:
+            return
+        self.executor = ThreadPoolExecutor(self.retrieval_threads, thread_name_prefix="retrieval")
+        self.queue = asyncio.Queue(self.queue_size)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        # The resilient LLM client keeps an aiohttp session per event loop
+        aclose = getattr(getattr(self.engine.llm, "client", None), "aclose", None)
+        if aclose is not None:
+            await aclose()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _retrieve(self, query, docs=None):
+        # Passages the caller chose skip the answer cache both ways (no vector)
+        if docs is not None:
+            return None, None, docs
+        # One embedding serves the answer cache and the FAISS search
+        vector = self.engine.embed_query(query)
+        hit = self.engine.lookup(vector)
+        if hit is not None:
+            return vector, hit, hit["source_documents"]
+        return vector, None, self.engine.retrieve_by_vector(vector, query=query)
+
+    def _in_executor(self, fn, *args):
+        # Copy the context so spans in the pool land on this request's trace
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(self.executor, context.run, fn, *args)
+
+    async def _run(self, query, docs=None):
+        tracer = self.engine.tracer
+        with tracer.trace("query"):
+            started = time.perf_counter()
+            vector, hit, docs = await self._in_executor(self._retrieve, query, docs)
+            if hit is not None:
+                return {"result": hit["result"], "source_documents": docs, "cached": True, "fallback": None}
+            prompt = self.engine.build_prompt(query, docs)
+            try:
+                with tracer.span("llm"):
+                    result = await self.engine.llm.ainvoke(prompt)
+            except LLMUnavailable as e:
+                result, docs, kind = await self._in_executor(self.engine.fallback, vector, docs, e)
+                tracer.annotate(fallback=kind)
+                return {"result": result, "source_documents": docs, "cached": False, "fallback": kind}
+            tracer.annotate(completion_tokens=count_tokens(result))
+            await self._in_executor(self.engine.remember, query, vector, result, docs, time.perf_counter() - started)
+            return {"result": result, "source_documents": docs, "cached": False, "fallback": None}
+
+    async def _worker(self):
+        while True:
+            query, docs, future = await self.queue.get()
+            self.in_flight += 1
+            try:
+                if not future.cancelled():
+                    future.set_result(await self._run(query, docs))
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    async def submit(self, query, docs=None):
+        """Queue ``query``, waiting while the queue is full; returns a future.
+
+        ``docs`` answers from passages already retrieved, e.g. by ``search``,
+        without reading or writing the answer cache.
+        """
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, docs, future))
+        return future
+
+    async def try_submit(self, query, docs=None):
+        """Queue ``query`` or raise ``Overloaded`` right away when the queue is full."""
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((query, docs, future))
+        except asyncio.QueueFull:
+            raise Overloaded(f"{self.queue_size} requests already waiting")
+        return future
+
+    async def answer(self, query, docs=None):
+        """Return ``{"result": str, "source_documents": [Document], "cached": bool, "fallback": str | None}``."""
+        return await (await self.submit(query, docs))
+
+    async def retrieve(self, query, k=None):
+        """Top-k documents for ``query``, without generation or queueing."""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.engine.retrieve, query, k)
+
+    async def search(self, query, k=None):
+        """Retrieval-only ranked passages with highlights (``QueryEngine.search``), without queueing."""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.engine.search, query, k)
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "queued": self.queue.qsize() if self.queue else 0}
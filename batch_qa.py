@@ -0,0 +1,189 @@
+"""Answer a whole evaluation set in one process.
+
+Questions come from JSONL (``{"id": ..., "question": ...}`` per line) or CSV
+(``id`` and ``question`` columns; ``id`` is optional in both and defaults to
+the row number). All questions are embedded in one matrix call and searched
+with one FAISS call; generation runs on a bounded thread pool and each answer
+is appended to the output JSONL as soon as it finishes. Rerunning with the
+same output skips questions that already have an answer and retries the rest;
+the error records of the earlier attempt are removed first, so the output
+holds exactly one record per id.
+
+    python batch_qa.py eval/questions.jsonl --output eval/answers.jsonl --concurrency 8
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bm25_index import open_bm25_index
+from context_packer import open_context_packer
+from query_engine import HF_REPO_ID, format_context
+from retrieval import BatchRetriever
+
+CONCURRENCY = 8
+
+
+def read_questions(path):
+    """Return ``[(id, question)]`` from a .jsonl or .csv file."""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    questions = []
+    for i, row in enumerate(rows):
+        question = row.get("question") or row.get("query")
+        if not question:
+            raise ValueError(f"{path}: row {i + 1} has no 'question'")
+        qid = row.get("id")
+        questions.append((str(i if qid in (None, "") else qid), question))
+    return questions
+
+
+def read_done(path):
+    """Ids already answered in ``path``, after dropping every other record from it.
+
+    Failed questions are retried, so their error records go, and so does a
+    torn last line left by a crash. The file is only rewritten when
+    something was dropped.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    kept, dropped = [], 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            if not isinstance(record, dict) or "answer" not in record or record.get("id") in done:
+                dropped += bool(line.strip())
+                continue
+            done.add(record["id"])
+            kept.append(line if line.endswith("\n") else line + "\n")
+    if dropped:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp, path)
+        print(f"Removed {dropped} failed or incomplete records from {path}")
+    return done
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self, answered):
+        for stage in ("load", "embed", "search", "generate", "total"):
+            if stage in self.seconds:
+                print(f"{stage:<10} {self.seconds[stage]:8.2f} s")
+        if answered:
+            print(f"{answered} answers, {self.seconds.get('total', 0.0) / answered * 1000:.0f} ms/question overall")
+
+
+def generate(llm, prompt):
+    started = time.perf_counter()
+    answer = llm.invoke(prompt)
+    return answer, time.perf_counter() - started
+
+
+def run_batch(questions, output, db, llm, prompt_template, k=4, concurrency=CONCURRENCY, lexical=None, packer=None):
+    timer = StageTimer()
+    started = time.perf_counter()
+    done = read_done(output)
+    todo = [(qid, question) for qid, question in questions if qid not in done]
+    print(f"{len(questions)} questions, {len(done)} already answered, {len(todo)} to go")
+    if not todo:
+        return timer, 0
+
+    retriever = BatchRetriever(db, k=k, lexical=lexical)
+    texts = [question for _, question in todo]
+    t = time.perf_counter()
+    vectors = retriever.embed(texts)
+    timer.add("embed", time.perf_counter() - t)
+
+    t = time.perf_counter()
+    contexts = retriever.search_vectors(vectors, queries=texts)
+    timer.add("search", time.perf_counter() - t)
+
+    answered = 0
+    with open(output, "a", encoding="utf-8") as out, ThreadPoolExecutor(concurrency) as pool:
+        if out.tell() and not ends_with_newline(output):
+            # Terminate a torn line so the first new record parses
+            out.write("\n")
+        futures = {}
+        for (qid, question), docs in zip(todo, contexts):
+            record = {"id": qid, "question": question}
+            prompt = prompt_template.format(context=format_context(docs), question=question)
+            if packer is not None:
+                # Same merging, dedup and token budget as the chat prompt
+                packed = prompt_template.format(context=format_context(packer.pack(docs)), question=question)
+                record["prompt_tokens"] = [packer.count(prompt), packer.count(packed)]
+                prompt = packed
+            futures[pool.submit(generate, llm, prompt)] = (record, docs)
+        t = time.perf_counter()
+        for future in as_completed(futures):
+            record, docs = futures[future]
+            try:
+                answer, seconds = future.result()
+                record.update(answer=answer, generate_ms=round(seconds * 1000, 1))
+                answered += 1
+            except Exception as e:
+                # Written for the record; the next run removes it and retries
+                record["error"] = str(e)
+            record["sources"] = [{"source": d.metadata.get("source"), "page": d.metadata.get("page")} for d in docs]
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+        timer.add("generate", time.perf_counter() - t)
+    timer.add("total", time.perf_counter() - started)
+    return timer, answered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help=".jsonl or .csv file of questions")
+    parser.add_argument("--output", required=True,
+                        help="answers JSONL, appended to and resumed from (failed records are retried and replaced)")
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--hf-repo-id", default=HF_REPO_ID)
+    args = parser.parse_args()
+
+    from embedding_cache import get_cached_embeddings
+    from llm_backends import open_llm
+    from query_engine import EMBEDDING_MODEL, PROMPT_TEMPLATE, get_prompt
+    from vector_store import load_faiss
+
+    t = time.perf_counter()
+    questions = read_questions(args.questions)
+    db = load_faiss(args.db, get_cached_embeddings(EMBEDDING_MODEL))
+    # Concurrent generations share decode steps on the llamacpp backend
+    llm = open_llm(args.hf_repo_id)
+    load_seconds = time.perf_counter() - t
+
+    timer, answered = run_batch(
+        questions, args.output, db, llm, get_prompt(PROMPT_TEMPLATE), args.k, args.concurrency,
+        lexical=open_bm25_index(args.db), packer=open_context_packer()
+    )
+    timer.add("load", load_seconds)
+    timer.report(answered)
+
+
+if __name__ == "__main__":
+    main()
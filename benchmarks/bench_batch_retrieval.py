@@ -0,0 +1,52 @@
+"""Per-query retrieval cost of batched search against one query at a time.
+
+Query vectors are embedded up front, so only FAISS search and document
+fetching are timed.
+
+    python -m benchmarks.bench_batch_retrieval --db vector_store/faiss_database --fake-embeddings
+"""
+import argparse
+import time
+
+from benchmarks.bench_query import QUESTIONS, get_embeddings
+from retrieval import BatchRetriever
+from vector_store import load_faiss
+
+
+def per_query_ms(fn, vectors, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(vectors)
+        best = min(best, time.perf_counter() - start)
+    return best / len(vectors) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 512])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    db = load_faiss(args.db, get_embeddings(args.fake_embeddings))
+    retriever = BatchRetriever(db, k=args.k)
+    questions = [f"{QUESTIONS[i % len(QUESTIONS)]} ({i})" for i in range(max(args.batch_sizes))]
+    all_vectors = retriever.embed(questions)
+
+    def one_at_a_time(vectors):
+        return [db.similarity_search_by_vector(vector.tolist(), k=args.k) for vector in vectors]
+
+    print(f"{db.index.ntotal} vectors, k={args.k}")
+    print(f"{'batch':>6} {'one-by-one':>12} {'batched':>10} {'speedup':>8}")
+    for size in args.batch_sizes:
+        vectors = all_vectors[:size]
+        single = per_query_ms(one_at_a_time, vectors, args.repeats)
+        batched = per_query_ms(retriever.search_vectors, vectors, args.repeats)
+        print(f"{size:>6} {single:9.3f} ms {batched:7.3f} ms {single / batched:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
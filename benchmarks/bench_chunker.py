@@ -0,0 +1,112 @@
+"""Structure-aware chunker against the RecursiveCharacterTextSplitter.
+
+Both splitters run on the same extracted pages. Reports chunk count, the
+text repeated through overlap, index size (FAISS vectors plus BM25 postings)
+and retrieval hit@k for dense and BM25 search. Each query is every other
+word of a sentence sampled from the pages; a hit means some top-k chunk
+contains the whole sentence, so chunks that cut sentences apart lose hits.
+Without ``--data`` a synthetic textbook from ``benchmarks.textbook_fixture``
+is used.
+
+    python -m benchmarks.bench_chunker --data data/ --samples 300 --k 4
+"""
+import argparse
+import random
+import re
+import tempfile
+import time
+
+import faiss
+
+from benchmarks.bench_query import get_embeddings
+from benchmarks.textbook_fixture import make_textbook
+from bm25_index import BM25Index, build_bm25_index
+from chunker import _SENTENCES
+from embedding_cache import embed_documents_array, embed_queries_array
+from llm_database import CHUNKERS, get_text_splitter
+from pdf_ingest import stream_chunks, stream_pages
+
+
+def normalize(text):
+    # Compare on letters and digits only, so line breaks and de-hyphenation don't matter
+    return re.sub(r"\W+", "", text.lower())
+
+
+def sample_sentences(pages, samples, seed=0):
+    sentences = []
+    for page in pages:
+        text = " ".join(page.page_content.split())
+        sentences.extend(sentence for sentence in _SENTENCES.split(text) if len(sentence) >= 60)
+    rng = random.Random(seed)
+    return rng.sample(sentences, min(samples, len(sentences)))
+
+
+def hit_rate(rankings, texts, sentences):
+    hits = 0
+    for rows, sentence in zip(rankings, sentences):
+        key = normalize(sentence)
+        hits += any(key in texts[row] for row in rows if row >= 0)
+    return hits / len(sentences)
+
+
+def evaluate(name, pages, embeddings, sentences, queries, query_vectors, k):
+    start = time.perf_counter()
+    chunks = list(stream_chunks(pages, get_text_splitter(name)))
+    split_seconds = time.perf_counter() - start
+    texts = [chunk.page_content for chunk in chunks]
+
+    vectors = embed_documents_array(embeddings, texts)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    _, dense = index.search(query_vectors, k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bm25_bytes = build_bm25_index(texts, tmp)["bytes"]
+        bm25 = BM25Index(tmp)
+        lexical = [bm25.search(query, k)[0] for query in queries]
+
+    normalized = [normalize(text) for text in texts]
+    page_chars = sum(len(page.page_content) for page in pages)
+    return {
+        "chunks": len(chunks),
+        "mean_chars": sum(map(len, texts)) / len(texts),
+        "inflation": sum(map(len, texts)) / page_chars,
+        "index_mb": (vectors.nbytes + bm25_bytes) / 1e6,
+        "split_s": split_seconds,
+        "dense": hit_rate(dense, normalized, sentences),
+        "bm25": hit_rate(lexical, normalized, sentences),
+        "with_section": sum(bool(chunk.metadata.get("section")) for chunk in chunks) / len(chunks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=None, help="folder of PDFs (default: a synthetic textbook)")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--chapters", type=int, default=8, help="synthetic textbook size")
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = args.data
+        if data is None:
+            data = tmp
+            make_textbook(f"{tmp}/textbook.pdf", chapters=args.chapters)
+        pages = list(stream_pages(data, workers=1))
+
+    embeddings = get_embeddings(args.fake_embeddings)
+    sentences = sample_sentences(pages, args.samples)
+    queries = [" ".join(sentence.split()[::2]) for sentence in sentences]
+    query_vectors = embed_queries_array(embeddings, queries)
+    print(f"{len(pages)} pages, {len(queries)} sentence queries, k={args.k}")
+    print(f"{'chunker':<10} {'chunks':>7} {'chars':>6} {'inflation':>9} {'index MB':>9} {'split':>7} "
+          f"{'dense hit':>9} {'bm25 hit':>9} {'sectioned':>9}")
+    for name in CHUNKERS:
+        r = evaluate(name, pages, embeddings, sentences, queries, query_vectors, args.k)
+        print(f"{name:<10} {r['chunks']:7d} {r['mean_chars']:6.0f} {r['inflation']:9.2f} {r['index_mb']:9.2f} "
+              f"{r['split_s']:6.2f}s {r['dense']:9.1%} {r['bm25']:9.1%} {r['with_section']:9.0%}")
+
+
+if __name__ == "__main__":
+    main()
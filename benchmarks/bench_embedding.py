@@ -0,0 +1,72 @@
+"""Chunks/sec of the multi-process embedding engine against the LangChain path.
+
+    python -m benchmarks.bench_embedding --chunks 2000 --workers 1 2 4
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from embedding_engine import BATCH_SIZE, EmbeddingEngine
+from pdf_ingest import list_pdf_files, stream_chunks, stream_pages
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def sample_chunks(data, count):
+    # Real textbook chunks when data/ has PDFs, otherwise synthetic text
+    if os.path.isdir(data) and list_pdf_files(data):
+        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=200)
+        chunks = stream_chunks(stream_pages(data), splitter)
+        texts = [chunk.page_content for chunk in itertools.islice(chunks, count)]
+        if texts:
+            return texts
+    rng = random.Random(0)
+    words = "cell injury necrosis apoptosis inflammation neoplasia tumor stroma edema fibrosis".split()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(10, 90))) for _ in range(count)]
+
+
+def bench_langchain(texts):
+    # What FAISS.from_documents does today: one embed_documents call in-process
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+    embeddings.embed_documents(texts[:8])
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def bench_engine(texts, workers, batch_size):
+    engine = EmbeddingEngine(MODEL_NAME, workers=workers, batch_size=batch_size)
+    try:
+        # Warm every worker so model load is not timed
+        engine.encode(texts[:workers * batch_size])
+        start = time.perf_counter()
+        engine.encode(texts)
+        return len(texts) / (time.perf_counter() - start)
+    finally:
+        engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="data/")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    texts = sample_chunks(args.data, args.chunks)
+    print(f"{len(texts)} chunks")
+    print(f"langchain HuggingFaceEmbeddings : {bench_langchain(texts):8.1f} chunks/sec")
+    for workers in args.workers:
+        rate = bench_engine(texts, workers, args.batch_size)
+        print(f"engine workers={workers:<2} batch={args.batch_size:<4}: {rate:8.1f} chunks/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Hybrid BM25 + dense retrieval against dense-only.
+
+Reports BM25 build time and on-disk size next to the FAISS index, the extra
+per-query latency of fusion, and hit@k on exact-term probes: for sampled
+chunks, the query is the chunk's rarest few words, and a hit means the chunk
+itself comes back in the top k.
+
+    python -m benchmarks.bench_hybrid --db vector_store/faiss_database --samples 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.bench_query import get_embeddings
+from bm25_index import BM25Index, build_bm25_index, tokenize
+from retrieval import BatchRetriever
+from vector_store import load_faiss
+
+
+def probe_queries(texts, samples, words, seed=0):
+    # The rarest terms of a chunk stand in for eponyms, genes and stain names
+    df = Counter(token for text in texts for token in set(tokenize(text)))
+    rng = random.Random(seed)
+    probes = []
+    for row in rng.sample(range(len(texts)), min(samples, len(texts))):
+        tokens = sorted(set(tokenize(texts[row])), key=lambda token: (df[token], token))
+        if tokens:
+            probes.append((row, " ".join(tokens[:words])))
+    return probes
+
+
+def evaluate(retriever, texts, probes, k, lexical):
+    hits, latencies = 0, []
+    vectors = retriever.embed([query for _, query in probes])
+    for (row, query), vector in zip(probes, vectors):
+        start = time.perf_counter()
+        docs = retriever.search_vectors([vector], k, [query] if lexical else None)[0]
+        latencies.append(time.perf_counter() - start)
+        hits += any(doc.page_content == texts[row] for doc in docs)
+    latencies.sort()
+    return hits / len(probes), latencies[len(latencies) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--words", type=int, default=3, help="rare words per probe query")
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    db = load_faiss(args.db, get_embeddings(args.fake_embeddings))
+    texts = [db.docstore.search(db.index_to_docstore_id[i]).page_content for i in range(db.index.ntotal)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = build_bm25_index(texts, tmp)
+        bm25 = BM25Index(tmp)
+        faiss_bytes = os.path.getsize(os.path.join(args.db, "index.faiss"))
+        print(f"BM25 build: {report['seconds']:.2f}s for {len(texts)} chunks, {report['terms']} terms")
+        print(f"BM25 size : {report['bytes'] / 1e6:.2f} MB ({report['bytes'] / faiss_bytes:.0%} of index.faiss)")
+
+        probes = probe_queries(texts, args.samples, args.words)
+        print(f"{'mode':<7} {'hit@' + str(args.k):>7} {'p50 search':>11}")
+        for name, lexical in (("dense", None), ("hybrid", bm25)):
+            retriever = BatchRetriever(db, k=args.k, lexical=lexical)
+            hit_rate, p50 = evaluate(retriever, texts, probes, args.k, lexical is not None)
+            print(f"{name:<7} {hit_rate:7.1%} {p50:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
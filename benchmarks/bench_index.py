@@ -0,0 +1,79 @@
+"""Recall@k and query latency of each index type against the flat baseline.
+
+    python -m benchmarks.bench_index --db vector_store/faiss_database --k 4
+"""
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+from index_spec import build_index, parse_spec
+
+DEFAULT_SPECS = ["Flat", "SQ8", "IVF-Flat", "IVF-PQ", "HNSW"]
+
+
+def load_vectors(db_path, synthetic_count, dim=384, seed=0):
+    # Reuse the real chunk vectors when a flat index has been built
+    path = os.path.join(db_path, "index.faiss")
+    if os.path.exists(path):
+        index = faiss.read_index(path)
+        if isinstance(index, faiss.IndexFlat):
+            return index.reconstruct_n(0, index.ntotal)
+        print(f"{path} is not a flat index, using synthetic vectors")
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((64, dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), synthetic_count)
+    return centers[labels] + 0.3 * rng.standard_normal((synthetic_count, dim)).astype(np.float32)
+
+
+def make_queries(vectors, count, seed=1):
+    # Perturbed corpus vectors stand in for questions about indexed passages
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), count, replace=False)]
+    scale = 0.1 * float(np.std(vectors))
+    return (picked + scale * rng.standard_normal(picked.shape)).astype(np.float32)
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    hits = 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(found[0]) & set(truth[i]))
+    latencies = np.array(latencies) * 1000
+    return hits / truth.size, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--synthetic", type=int, default=50_000, help="vector count when no flat index exists")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--specs", nargs="+", default=DEFAULT_SPECS)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.db, args.synthetic)
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, truth = baseline.search(queries, args.k)
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<32} {'build s':>8} {'size MB':>8} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for text in args.specs:
+        spec = parse_spec(text)
+        start = time.perf_counter()
+        index = build_index(spec, vectors)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+        recall, p50, p95 = measure(index, queries, truth, args.k)
+        print(f"{text:<32} {build_seconds:8.2f} {size_mb:8.1f} {recall:7.3f} {p50:7.3f} {p95:7.3f}")
+
+
+if __name__ == "__main__":
+    main()
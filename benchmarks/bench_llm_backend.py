@@ -0,0 +1,127 @@
+"""Local llama.cpp backend against the remote endpoint, replayed from a recording.
+
+The remote side is HuggingFaceEndpoint talking to ``benchmarks.stub_endpoint``,
+which replays responses recorded from the real endpoint (``--recording``; make one
+with ``--record`` and HF_TOKEN set) or, without one, a fixed answer on its default
+delays. The local side is ``llm_backends.LlamaCppLLM`` on ``--model``, once with
+micro-batching and the prefix cache and once with neither, for comparison.
+
+Prompts are the real template filled with synthetic textbook passages. For each
+configuration and ``--concurrency`` level, ``--requests`` prompts are streamed:
+reported are requests/s, generated tokens/s and p50/p95 time to first token and
+total latency.
+
+    python -m benchmarks.bench_llm_backend --model models/qwen2.5-0.5b-instruct-q4_k_m.gguf --concurrency 1 4 8
+    HF_TOKEN=... python -m benchmarks.bench_llm_backend --record hf_responses.jsonl --requests 20
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stub_endpoint import load_recording, record_responses, start_stub
+from benchmarks.textbook_fixture import textbook_pages
+from query_engine import HF_REPO_ID, PROMPT_TEMPLATE
+
+
+def make_prompts(count, passages=3, seed=0):
+    # Paragraph-sized passages from the synthetic textbook, a few per prompt
+    text = "\n".join("\n".join(page) for page in textbook_pages(chapters=4, seed=seed))
+    paragraphs = [p for p in text.split(". ") if len(p) > 80]
+    rng = random.Random(seed)
+    prompts = []
+    for _ in range(count):
+        context = "\n\n".join(". ".join(rng.sample(paragraphs, 4)) + "." for _ in range(passages))
+        question = f"What does the context say about {rng.choice(paragraphs).split()[0].lower()}?"
+        prompts.append(PROMPT_TEMPLATE.format(context=context, question=question))
+    return prompts
+
+
+def stream_one(llm, prompt):
+    started = time.perf_counter()
+    first, tokens = None, 0
+    for _ in llm.stream(prompt):
+        if first is None:
+            first = time.perf_counter() - started
+        tokens += 1
+    return first or 0.0, time.perf_counter() - started, tokens
+
+
+def run_level(llm, prompts, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda prompt: stream_one(llm, prompt), prompts))
+    elapsed = time.perf_counter() - started
+    ttft, total, tokens = (np.array(column) for column in zip(*results))
+    return {
+        "rps": len(prompts) / elapsed,
+        "tokens_per_s": tokens.sum() / elapsed,
+        "ttft_p50": np.percentile(ttft, 50) * 1000, "ttft_p95": np.percentile(ttft, 95) * 1000,
+        "total_p50": np.percentile(total, 50) * 1000, "total_p95": np.percentile(total, 95) * 1000,
+    }
+
+
+def remote_llm(url, max_new_tokens):
+    from langchain_huggingface import HuggingFaceEndpoint
+
+    return HuggingFaceEndpoint(endpoint_url=url, temperature=0.5, max_new_tokens=max_new_tokens)
+
+
+def local_llm(model, max_new_tokens, max_batch, prefix_cache, n_ctx):
+    from llm_backends import LlamaCppGenerator, LlamaCppLLM, template_prefix
+
+    generator = LlamaCppGenerator(
+        model, n_ctx=n_ctx, max_batch=max_batch, prefix=template_prefix() if prefix_cache else None,
+        max_new_tokens=max_new_tokens
+    )
+    return LlamaCppLLM(generator=generator, max_new_tokens=max_new_tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=None, help="GGUF model for the local backend (skipped without one)")
+    parser.add_argument("--recording", default=None, help="recorded endpoint responses to replay")
+    parser.add_argument("--record", default=None, help="record the real endpoint's responses to this file and exit")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--batch", type=int, default=4, help="sequences the local backend decodes together")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--ctx", type=int, default=0, help="KV cache cells of the local backend (default: sized to fit)")
+    args = parser.parse_args()
+
+    prompts = make_prompts(args.requests)
+    if args.record:
+        from query_engine import get_hf_endpoint
+
+        record_responses(get_hf_endpoint(HF_REPO_ID), prompts, args.record)
+        print(f"Recorded {len(prompts)} responses to {args.record}")
+        return
+
+    server, url = start_stub(recording=load_recording(args.recording) if args.recording else None)
+    configs = [("remote (replayed)", lambda: remote_llm(url, args.max_new_tokens))]
+    if args.model:
+        configs.append((f"llamacpp batch={args.batch} prefix", lambda: local_llm(args.model, args.max_new_tokens, args.batch, True, args.ctx)))
+        configs.append(("llamacpp batch=1 no prefix", lambda: local_llm(args.model, args.max_new_tokens, 1, False, args.ctx)))
+    else:
+        print("No --model given: only the remote endpoint is measured")
+
+    print(f"{len(prompts)} prompts, up to {args.max_new_tokens} new tokens each")
+    print(f"{'backend':<28} {'conc':>4} {'req/s':>7} {'tok/s':>8} {'ttft p50':>9} {'ttft p95':>9} {'total p50':>10} {'total p95':>10}")
+    for name, make in configs:
+        llm = make()
+        stream_one(llm, prompts[0])
+        for concurrency in args.concurrency:
+            r = run_level(llm, prompts, concurrency)
+            print(f"{name:<28} {concurrency:4d} {r['rps']:7.2f} {r['tokens_per_s']:8.1f} {r['ttft_p50']:7.0f}ms "
+                  f"{r['ttft_p95']:7.0f}ms {r['total_p50']:8.0f}ms {r['total_p95']:8.0f}ms")
+        generator = getattr(llm, "generator", None)
+        if generator is not None and generator.reused_tokens:
+            share = generator.reused_tokens / (generator.reused_tokens + generator.prefilled_tokens)
+            print(f"{'':<28} prefix cache covered {share:.0%} of prompt tokens")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
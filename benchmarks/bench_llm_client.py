@@ -0,0 +1,90 @@
+"""Resilient LLM client against the plain endpoint under injected faults.
+
+Both stream answers from ``benchmarks.stub_endpoint`` while it fails a share of
+requests with 503s, answers a share of them seconds late, or is down entirely.
+The plain client is ``HuggingFaceEndpoint``; the resilient one is
+``llm_client.ResilientEndpoint`` with retries and a circuit breaker, once more
+with hedging after the p95 time to first token. For each scenario: the share
+of calls that got an answer and p50/p95/p99 latency of all calls (failures
+included, so a client that fails fast shows up as fast).
+
+    python -m benchmarks.bench_llm_client --requests 60 --concurrency 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stub_endpoint import start_stub
+
+SCENARIOS = {
+    "healthy": {},
+    "20% errors": {"error_rate": 0.2},
+    "5% slow": {"slow_rate": 0.05, "slow_delay": 2.0},
+    "outage": {"error_rate": 1.0},
+}
+
+
+def plain_llm(url):
+    from langchain_huggingface import HuggingFaceEndpoint
+
+    return HuggingFaceEndpoint(endpoint_url=url, max_new_tokens=64, huggingfacehub_api_token="stub")
+
+
+def resilient_llm(url, hedge):
+    from llm_client import CircuitBreaker, ResilientClient, ResilientEndpoint
+
+    client = ResilientClient(url, deadline=10, backoff=0.05, hedge=hedge, breaker=CircuitBreaker(5, 30))
+    return ResilientEndpoint(client=client, max_new_tokens=64)
+
+
+def call(llm, prompt):
+    started = time.perf_counter()
+    try:
+        for _ in llm.stream(prompt):
+            pass
+        ok = True
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - started
+
+
+def run(llm, requests, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: call(llm, f"Question {i}: what is necrosis?"), range(requests)))
+    ok, seconds = (np.array(column) for column in zip(*results))
+    return ok.mean(), np.percentile(seconds, [50, 95, 99]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    args = parser.parse_args()
+
+    print(f"{args.requests} streamed calls per run, {args.concurrency} at a time")
+    print(f"{'scenario':<12} {'client':<20} {'answered':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for scenario in args.scenarios:
+        clients = [("plain", plain_llm), ("resilient", lambda url: resilient_llm(url, "off")),
+                   ("resilient + hedge", lambda url: resilient_llm(url, "p95"))]
+        for name, make in clients:
+            # A fresh stub per run so every client sees the same sequence of faults
+            server, url = start_stub(first_token_delay=0.1, token_delay=0.005)
+            llm = make(url)
+            # Healthy calls first: connections and the time-to-first-token samples
+            # the hedge delay comes from
+            for _ in range(20):
+                call(llm, "warmup")
+            config = server.RequestHandlerClass.config
+            for option, value in SCENARIOS[scenario].items():
+                setattr(config, option, value)
+            config.rng.seed(0)
+            answered, (p50, p95, p99) = run(llm, args.requests, args.concurrency)
+            print(f"{scenario:<12} {name:<20} {answered:8.0%} {p50:6.0f}ms {p95:6.0f}ms {p99:6.0f}ms")
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
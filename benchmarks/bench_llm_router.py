@@ -0,0 +1,97 @@
+"""LLM router over several stub endpoints with different latencies.
+
+Starts ``--endpoints`` stub endpoints whose first token takes 0.15 s, 0.3 s,
+0.6 s, ... and which each answer 429 beyond ``--rate-limit`` requests in flight,
+like a rate-limited provider, plus one fast "small model" stub as the fallback.
+The same load goes through one endpoint alone, then through ``llm_router`` with
+weighted round-robin, least-outstanding-requests, and least-outstanding with
+overflow to the fallback. Reported per configuration: answered share,
+requests/s, p50/p95 time to first token and total latency, and how the calls
+were spread over the endpoints.
+
+    python -m benchmarks.bench_llm_router --requests 96 --concurrency 16
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stub_endpoint import start_stub
+
+
+def call(llm, prompt):
+    started = time.perf_counter()
+    first = None
+    try:
+        for _ in llm.stream(prompt):
+            if first is None:
+                first = time.perf_counter() - started
+        ok = True
+    except Exception:
+        ok = False
+    return ok, first or 0.0, time.perf_counter() - started
+
+
+def run(llm, requests, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: call(llm, f"Question {i}: what is necrosis?"), range(requests)))
+    elapsed = time.perf_counter() - started
+    ok, ttft, total = (np.array(column) for column in zip(*results))
+    return {
+        "answered": ok.mean(), "rps": ok.sum() / elapsed,
+        "ttft": np.percentile(ttft[ok], [50, 95]) * 1000 if ok.any() else (0, 0),
+        "total": np.percentile(total[ok], [50, 95]) * 1000 if ok.any() else (0, 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoints", type=int, default=3)
+    parser.add_argument("--rate-limit", type=int, default=4, help="requests in flight per endpoint before 429s")
+    parser.add_argument("--requests", type=int, default=96)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fallback-queue", type=int, default=3)
+    args = parser.parse_args()
+
+    from llm_client import ResilientClient, ResilientEndpoint
+    from llm_router import build_router
+
+    delays = [0.15 * 2 ** i for i in range(args.endpoints)]
+    stubs = [start_stub(first_token_delay=delay, token_delay=0.01, max_concurrency=args.rate_limit)
+             for delay in delays]
+    fallback = start_stub(first_token_delay=0.05, token_delay=0.004, answer="Short answer from the small model.")
+    urls = [url for _, url in stubs]
+    names = {url: f"{delay * 1000:.0f}ms" for url, delay in zip(urls, delays)}
+    names[fallback[1]] = "fallback"
+
+    pool = [(url, 1) for url in urls]
+    # The router keeps each endpoint within its rate limit and queues the rest
+    limit = args.rate_limit
+    configs = [
+        ("single endpoint", lambda: ResilientClient(urls[0])),
+        ("weighted round-robin", lambda: build_router(pool, routing="weighted", concurrency=limit)),
+        ("least outstanding", lambda: build_router(pool, concurrency=limit)),
+        ("least outstanding + fallback", lambda: build_router(
+            pool, [(fallback[1], 1)], fallback_queue=args.fallback_queue, concurrency=limit
+        )),
+    ]
+    print(f"{args.requests} streamed calls, {args.concurrency} at a time; endpoints with first token after "
+          f"{', '.join(names[url] for url in urls)}, {args.rate_limit} requests in flight each")
+    print(f"{'routing':<30} {'answered':>8} {'req/s':>6} {'ttft p50':>9} {'ttft p95':>9} {'total p50':>10} "
+          f"{'total p95':>10}  calls per endpoint")
+    for name, make in configs:
+        client = make()
+        r = run(ResilientEndpoint(client=client, max_new_tokens=32), args.requests, args.concurrency)
+        spread = ""
+        if hasattr(client, "stats"):
+            spread = " ".join(f"{names[s['endpoint']]}={s['calls']}" for s in client.stats())
+        print(f"{name:<30} {r['answered']:8.0%} {r['rps']:6.1f} {r['ttft'][0]:7.0f}ms {r['ttft'][1]:7.0f}ms "
+              f"{r['total'][0]:8.0f}ms {r['total'][1]:8.0f}ms  {spread}")
+    for server, _ in stubs + [fallback]:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Cold-start time and memory of the pickle and mmap load modes.
+
+Each mode loads in a fresh interpreter so nothing is shared between runs.
+
+    python -m benchmarks.bench_load --db vector_store/faiss_database
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+_PROBE = """
+import json, resource, sys, time
+from langchain_core.embeddings import FakeEmbeddings
+from vector_store import load_faiss
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+db = load_faiss(sys.argv[1], FakeEmbeddings(size=384), mode=sys.argv[2])
+loaded = time.perf_counter() - start
+db.similarity_search_by_vector([0.0] * db.index.d, k=4)
+first_query = time.perf_counter() - start - loaded
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"load_s": loaded, "first_query_s": first_query, "rss_mb": (after - before) / 1024}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--modes", nargs="+", default=["pickle", "mmap"])
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'load ms':>9} {'1st query ms':>13} {'RSS delta MB':>13}")
+    for mode in args.modes:
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE, args.db, mode], capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{mode:<8} {result['load_s'] * 1000:9.1f} {result['first_query_s'] * 1000:13.1f} {result['rss_mb']:13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Per-query cost of the shared QueryEngine against rebuilding the chain per submit.
+
+The LLM is a canned fake so only retrieval and chain overhead are timed.
+
+    python -m benchmarks.bench_query --db vector_store/faiss_database --queries 200
+"""
+import argparse
+import time
+
+from langchain_core.language_models.fake import FakeListLLM
+
+from query_engine import EMBEDDING_MODEL, QueryEngine
+from vector_store import load_faiss
+
+QUESTIONS = [
+    "What are the hallmarks of cancer?",
+    "Describe the morphology of coagulative necrosis.",
+    "Which cells dominate acute inflammation?",
+    "What causes amyloidosis?",
+]
+
+
+def get_embeddings(fake, dim=384):
+    if fake:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        return DeterministicFakeEmbedding(size=dim)
+    from embedding_cache import get_cached_embeddings
+
+    return get_cached_embeddings(EMBEDDING_MODEL)
+
+
+def timed(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(QUESTIONS[i % len(QUESTIONS)])
+    return (time.perf_counter() - start) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fake-embeddings", action="store_true", help="skip MiniLM, time chain overhead only")
+    args = parser.parse_args()
+
+    db = load_faiss(args.db, get_embeddings(args.fake_embeddings))
+    llm = FakeListLLM(responses=["stub answer"])
+
+    # Old Pathochat.main behaviour: retriever, prompt and chain on every submit
+    rebuild_ms = timed(lambda q: QueryEngine(db, llm, k=args.k).answer(q), args.queries)
+    engine = QueryEngine(db, llm, k=args.k)
+    shared_ms = timed(engine.answer, args.queries)
+    print(f"rebuild per query : {rebuild_ms:7.3f} ms/query")
+    print(f"shared engine     : {shared_ms:7.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
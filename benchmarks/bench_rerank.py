@@ -0,0 +1,56 @@
+"""Cost of the cross-encoder reranking stage and the prompt it saves.
+
+For each question: dense/hybrid top-k as the chain uses today, against
+fetching ``--fetch-k`` hits and keeping the reranker's ``--top-n``. Prints
+rerank latency, how often the budget forced the dense fallback, and the
+average prompt size in whitespace tokens.
+
+    python -m benchmarks.bench_rerank --model cross-encoder/ms-marco-MiniLM-L-6-v2 --fetch-k 50 --top-n 3
+"""
+import argparse
+import statistics
+
+from langchain_core.language_models.fake import FakeListLLM
+
+from benchmarks.bench_query import QUESTIONS, get_embeddings
+from bm25_index import open_bm25_index
+from query_engine import PROMPT_TEMPLATE, QueryEngine, format_context
+from reranker import Reranker, load_cross_encoder
+from vector_store import load_faiss
+
+
+def prompt_tokens(docs, question):
+    return len(PROMPT_TEMPLATE.format(context=format_context(docs), question=question).split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=300)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    db = load_faiss(args.db, get_embeddings(args.fake_embeddings))
+    reranker = Reranker(load_cross_encoder(args.model), args.fetch_k, args.top_n, args.budget_ms)
+    lexical = open_bm25_index(args.db)
+    llm = FakeListLLM(responses=["unused"])
+    plain = QueryEngine(db, llm, k=args.k, lexical=lexical)
+    reranked = QueryEngine(db, llm, k=args.k, lexical=lexical, reranker=reranker)
+
+    before, after, latencies = [], [], []
+    for question in QUESTIONS * 5:
+        before.append(prompt_tokens(plain.retrieve(question), question))
+        after.append(prompt_tokens(reranked.retrieve(question), question))
+        latencies.append(reranker.last_ms)
+
+    print(f"rerank latency   : p50 {statistics.median(latencies):.1f} ms, max {max(latencies):.1f} ms")
+    print(f"budget fallbacks : {reranker.fallbacks} of {len(latencies)}")
+    print(f"prompt tokens    : {statistics.mean(before):.0f} -> {statistics.mean(after):.0f}")
+
+
+if __name__ == "__main__":
+    main()
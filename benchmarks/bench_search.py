@@ -0,0 +1,75 @@
+"""Retrieval-only search against answers that go through the LLM.
+
+Each question runs three ways on one QueryEngine, with the LLM served by
+benchmarks/stub_endpoint.py: ``search`` (ranked, highlighted passages and no
+generation), a full streamed answer, and a streamed answer generated from the
+passages the search returned, as "Generate answer" in the UI does. Reported:
+p50/p95 time until passages are on screen, until the first answer token, and
+until the answer is complete.
+
+    python -m benchmarks.bench_search --db vector_store/faiss_database --fake-embeddings
+"""
+import argparse
+import time
+
+import numpy as np
+from langchain_huggingface import HuggingFaceEndpoint
+
+from benchmarks.bench_query import QUESTIONS, get_embeddings
+from benchmarks.stub_endpoint import start_stub
+from bm25_index import open_bm25_index
+from query_engine import QueryEngine
+from vector_store import load_faiss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    server, url = start_stub(first_token_delay=args.first_token_delay, token_delay=args.token_delay)
+    llm = HuggingFaceEndpoint(endpoint_url=url, max_new_tokens=1024, huggingfacehub_api_token="stub")
+    db = load_faiss(args.db, get_embeddings(args.fake_embeddings))
+    # No answer cache, so every answer is generated
+    engine = QueryEngine(db, llm, k=args.k, lexical=open_bm25_index(args.db))
+    engine.search(QUESTIONS[0])
+
+    timings = {name: [] for name in ("search", "answer_first", "answer_total", "generate_first", "generate_total")}
+    for i in range(args.queries):
+        query = QUESTIONS[i % len(QUESTIONS)]
+        start = time.perf_counter()
+        found = engine.search(query)
+        timings["search"].append(time.perf_counter() - start)
+
+        answer = engine.stream_answer(query)
+        for _ in answer:
+            pass
+        timings["answer_first"].append(answer.time_to_first_token)
+        timings["answer_total"].append(answer.total_time)
+
+        answer = engine.stream_answer(query, docs=found["source_documents"])
+        for _ in answer:
+            pass
+        timings["generate_first"].append(answer.time_to_first_token)
+        timings["generate_total"].append(answer.total_time)
+    server.shutdown()
+
+    def ms(name):
+        p50, p95 = np.percentile(timings[name], [50, 95]) * 1000
+        return f"p50 {p50:8.1f} ms  p95 {p95:8.1f} ms"
+
+    print(f"{args.queries} questions, k={args.k}")
+    print(f"search, passages on screen              : {ms('search')}")
+    print(f"full answer, first token                : {ms('answer_first')}")
+    print(f"full answer, last token                 : {ms('answer_total')}")
+    print(f"answer from found passages, first token : {ms('generate_first')}")
+    print(f"answer from found passages, last token  : {ms('generate_total')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Cold-start time of the Streamlit app and the CLI, each step in a fresh process.
+
+Measured, median of ``--repeat`` cold processes each:
+  - import time of each entry module (what a first page view or CLI run pays
+    before any model loads), plus the slowest imports of ``--module`` from
+    ``python -X importtime``
+  - first render: the app script's first run under Streamlit's AppTest
+  - ready: until the background warmup (warmup.py) has built the query engine,
+    with its per-step profile
+
+The LLM is a local stub endpoint unless ``--real-llm``. Without ``--db`` a small
+store is built from the synthetic textbook with fake embeddings; the warmup
+still loads the real embedding model.
+
+    python -m benchmarks.bench_startup --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_endpoint import start_stub
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_MODULES = ("streamlit", "warmup", "api_client", "query_engine", "api_server", "llm_database")
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+RENDER_SCRIPT = """
+import json, time
+from warmup import process_uptime
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=600)
+at.run()
+rendered = process_uptime()
+import warmup
+[w] = warmup._warmups.values()
+w.ready.wait()
+print(json.dumps({{"first_render_s": rendered, "ready_s": process_uptime(), "profile": w.profile()}}))
+"""
+
+CLI_SCRIPT = """
+import json
+from warmup import process_uptime, start_warmup
+w = start_warmup({db!r})
+prompt_s = process_uptime()
+w.ready.wait()
+print(json.dumps({{"prompt_s": prompt_s, "ready_s": process_uptime(), "profile": w.profile()}}))
+"""
+
+
+def run_python(args, env, cwd=REPO):
+    out = subprocess.run([sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True, timeout=900)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}")
+    return out
+
+
+def last_json(stdout):
+    # The warmup and trace logs go to stdout too; the result is the last line
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def import_seconds(module, env, repeat):
+    return statistics.median(
+        float(run_python(["-c", IMPORT_SCRIPT.format(module=module)], env).stdout.strip().splitlines()[-1])
+        for _ in range(repeat)
+    )
+
+
+def slowest_imports(module, env, top):
+    """``[(cumulative ms, module)]`` of the slowest imports under ``module``, from ``-X importtime``."""
+    out = run_python(["-X", "importtime", "-c", f"import {module}"], env)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def median_runs(script, env, repeat, cwd):
+    runs = [last_json(run_python(["-c", script], env, cwd).stdout) for _ in range(repeat)]
+    keys = [key for key, value in runs[0].items() if isinstance(value, (int, float))]
+    summary = {key: round(statistics.median(run[key] for run in runs), 3) for key in keys}
+    steps = runs[0]["profile"]["steps_s"]
+    summary["steps_s"] = {step: round(statistics.median(run["profile"]["steps_s"][step] for run in runs), 3)
+                          for step in steps}
+    summary["errors"] = runs[-1]["profile"]["errors"]
+    return summary
+
+
+def build_store(work):
+    from benchmarks.bench_query import get_embeddings
+    from benchmarks.textbook_fixture import make_textbook
+    from index_spec import parse_spec
+    from pdf_ingest import PAGES_PER_TASK, IngestStats
+    import llm_database
+
+    data = os.path.join(work, "data")
+    os.makedirs(data)
+    make_textbook(os.path.join(data, "textbook.pdf"), chapters=4)
+    llm_database.DATA_PATH, llm_database.vec_Path = data, os.path.join(work, "faiss_database")
+    llm_database.build_incremental(IngestStats(), get_embeddings(True), parse_spec("Flat"), 1, PAGES_PER_TASK, full=True)
+    return llm_database.vec_Path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=None, help="vector store folder (default: a small synthetic one)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--module", default="query_engine", help="module broken down with -X importtime")
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--real-llm", action="store_true", help="use HF_ENDPOINT_URL/the hosted API instead of a stub")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.environ.get("PYTHONPATH"), REPO])),
+               PATHOCHAT_TRACE="off")
+    if not args.real_llm:
+        _, env["HF_ENDPOINT_URL"] = start_stub()
+
+    with tempfile.TemporaryDirectory() as work:
+        db = os.path.abspath(args.db) if args.db else build_store(work)
+        # The app looks for faiss_database in its working directory
+        app_dir = os.path.dirname(db)
+        if os.path.basename(db) != "faiss_database":
+            app_dir = os.path.join(work, "app")
+            os.makedirs(app_dir)
+            os.symlink(db, os.path.join(app_dir, "faiss_database"))
+        # Keep the answer cache and embedding cache of the runs out of the real store
+        env["PATHOCHAT_EMBEDDING_CACHE"] = os.path.join(work, "embedding_cache")
+        env["PATHOCHAT_ANSWER_CACHE"] = "off"
+
+        print(f"Import time, median of {args.repeat} cold processes:")
+        imports = {}
+        for module in ENTRY_MODULES:
+            imports[module] = round(import_seconds(module, env, args.repeat), 3)
+            print(f"  {module:<14} {imports[module] * 1000:8.0f} ms")
+
+        print(f"Slowest imports under {args.module} (cumulative):")
+        slowest = slowest_imports(args.module, env, args.top)
+        for ms, name in slowest:
+            print(f"  {ms:8.0f} ms  {name}")
+
+        app = median_runs(RENDER_SCRIPT.format(app=os.path.join(REPO, "Pathochat.py")), env, args.repeat, app_dir)
+        cli = median_runs(CLI_SCRIPT.format(db=db), env, args.repeat, REPO)
+
+    print(f"Streamlit app: first render {app['first_render_s']:.2f} s, ready {app['ready_s']:.2f} s after process start")
+    print(f"CLI: prompt shown {cli['prompt_s']:.2f} s, ready {cli['ready_s']:.2f} s after process start")
+    print("Warmup steps: " + " ".join(f"{step}={seconds * 1000:.0f}ms" for step, seconds in app["steps_s"].items()))
+    for step, error in app["errors"].items():
+        print(f"  {step} failed: {error}")
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "imports_s": imports,
+            "slowest_imports_ms": [[name, ms] for ms, name in slowest],
+            "app": app,
+            "cli": cli,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
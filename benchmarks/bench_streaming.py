@@ -0,0 +1,54 @@
+"""Time to first token of streamed answers against blocking answers.
+
+Runs the QueryEngine against benchmarks/stub_endpoint.py, so no network or
+HF token is needed.
+
+    python -m benchmarks.bench_streaming --db vector_store/faiss_database --fake-embeddings
+"""
+import argparse
+import statistics
+import time
+
+from langchain_huggingface import HuggingFaceEndpoint
+
+from benchmarks.bench_query import QUESTIONS, get_embeddings
+from benchmarks.stub_endpoint import start_stub
+from query_engine import QueryEngine
+from vector_store import load_faiss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    server, url = start_stub(first_token_delay=args.first_token_delay, token_delay=args.token_delay)
+    llm = HuggingFaceEndpoint(endpoint_url=url, max_new_tokens=1024, huggingfacehub_api_token="stub")
+    engine = QueryEngine(load_faiss(args.db, get_embeddings(args.fake_embeddings)), llm)
+
+    blocking, first_token, streamed = [], [], []
+    for i in range(args.queries):
+        query = QUESTIONS[i % len(QUESTIONS)]
+        start = time.perf_counter()
+        engine.answer(query)
+        blocking.append(time.perf_counter() - start)
+
+        answer = engine.stream_answer(query)
+        for _ in answer:
+            pass
+        first_token.append(answer.time_to_first_token)
+        streamed.append(answer.total_time)
+    server.shutdown()
+
+    ms = lambda values: f"{statistics.median(values) * 1000:8.1f} ms"
+    print(f"blocking answer, time to any text : {ms(blocking)}")
+    print(f"streamed answer, time to first token: {ms(first_token)}")
+    print(f"streamed answer, time to last token : {ms(streamed)}")
+
+
+if __name__ == "__main__":
+    main()
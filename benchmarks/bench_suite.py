@@ -0,0 +1,257 @@
+"""Retrieval quality and latency suite, written to JSON for regression tracking.
+
+For every ``--chunker`` x ``--index`` combination the store is built from
+scratch with the real ingestion path into a scratch folder, then a labelled
+question set runs through the QueryEngine retriever. Reported per run:
+recall@k for each ``--k``, MRR, p50/p95/p99 retrieval latency, stubbed-LLM
+answer latency, build time, index size on disk and RSS.
+
+Questions are JSONL with a ``question`` and either ``evidence`` (a sentence or
+list of sentences a relevant chunk must contain) or ``pages`` (a list of
+``{"source": "<pdf file name>", "page": <0-based page>}``). Without ``--data``
+a synthetic textbook and its question set from ``benchmarks.textbook_fixture``
+are used, so the suite runs offline with ``--fake-embeddings``.
+
+    python -m benchmarks.bench_suite --fake-embeddings --output bench.json
+    python -m benchmarks.bench_suite --data data/ --questions eval.jsonl --index Flat HNSW --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.language_models.fake import FakeListLLM
+
+import llm_database
+from benchmarks.bench_query import get_embeddings
+from benchmarks.textbook_fixture import make_textbook
+from bm25_index import open_bm25_index
+from context_packer import open_context_packer
+from embedding_cache import get_cached_embeddings
+from index_spec import parse_spec
+from pdf_ingest import PAGES_PER_TASK, IngestStats, peak_rss_mb
+from query_engine import EMBEDDING_MODEL, QueryEngine
+from vector_store import load_faiss
+
+# Metrics where a higher value is better; everything else compared is lower-is-better
+HIGHER_IS_BETTER = ("recall@", "mrr")
+COMPARED = ("recall@", "mrr", "retrieve_p95_ms", "build_seconds", "index_mb")
+
+
+def normalize(text):
+    # Letters and digits only, so line breaks and de-hyphenation don't matter
+    return "".join(c for c in text.lower() if c.isalnum())
+
+
+def read_questions(path):
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                questions.append(json.loads(line))
+    return questions
+
+
+def is_relevant(doc, question):
+    evidence = question.get("evidence")
+    if evidence:
+        text = normalize(doc.page_content)
+        return any(normalize(sentence) in text for sentence in ([evidence] if isinstance(evidence, str) else evidence))
+    source = os.path.basename(doc.metadata.get("source", ""))
+    return any(source == page["source"] and doc.metadata.get("page") == page["page"] for page in question.get("pages", []))
+
+
+def percentiles(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {f"p{p}": round(float(np.percentile(ms, p)), 3) for p in (50, 95, 99)}
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def dir_size_mb(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file()) / 1e6
+
+
+def make_embeddings(fake, cache_dir):
+    # A cold, private cache so build and query times don't depend on earlier runs
+    if fake:
+        return get_embeddings(True)
+    return get_cached_embeddings(EMBEDDING_MODEL, cache_dir=cache_dir)
+
+
+def build(data, db_path, chunker, spec, embeddings, workers):
+    # The builder reads its paths from module globals
+    llm_database.DATA_PATH, llm_database.vec_Path = data, db_path
+    stats = IngestStats()
+    start = time.perf_counter()
+    llm_database.build_incremental(stats, embeddings, spec, workers, PAGES_PER_TASK, full=True, chunker=chunker)
+    return stats, time.perf_counter() - start
+
+
+def evaluate(engine, questions, ks, answers):
+    depth = max(ks)
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks, retrieve_seconds = [], []
+    for question in questions:
+        start = time.perf_counter()
+        docs = engine.retrieve(question["question"], k=depth)
+        retrieve_seconds.append(time.perf_counter() - start)
+        rank = next((i + 1 for i, doc in enumerate(docs) if is_relevant(doc, question)), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        for k in ks:
+            hits[k] += rank is not None and rank <= k
+
+    answer_seconds = []
+    for question in questions[:answers]:
+        start = time.perf_counter()
+        # Keep the per-query prompt size log out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.answer(question["question"])
+        answer_seconds.append(time.perf_counter() - start)
+
+    metrics = {f"recall@{k}": round(hits[k] / len(questions), 4) for k in ks}
+    metrics["mrr"] = round(float(np.mean(reciprocal_ranks)), 4)
+    metrics.update({f"retrieve_{name}_ms": value for name, value in percentiles(retrieve_seconds).items()})
+    if answer_seconds:
+        metrics.update({f"answer_{name}_ms": value for name, value in percentiles(answer_seconds).items()})
+    return metrics
+
+
+def run(args, data, questions, work, chunker, spec):
+    db_path = os.path.join(work, f"{chunker}-{spec['type']}")
+    build_embeddings = make_embeddings(args.fake_embeddings, os.path.join(db_path + "-cache", "build"))
+    stats, build_seconds = build(data, db_path, chunker, spec, build_embeddings, args.workers)
+
+    query_embeddings = make_embeddings(args.fake_embeddings, os.path.join(db_path + "-cache", "query"))
+    db = load_faiss(db_path, query_embeddings)
+    lexical = open_bm25_index(db_path, args.retrieval)
+    # Canned LLM: answer latency is retrieval, packing and chain overhead only
+    llm = FakeListLLM(responses=["stub answer"])
+    engine = QueryEngine(db, llm, k=max(args.k), lexical=lexical, packer=open_context_packer())
+    metrics = evaluate(engine, questions, args.k, args.answers)
+
+    own, children = peak_rss_mb()
+    metrics.update({
+        "build_seconds": round(build_seconds, 3),
+        "pages": stats.pages,
+        "chunks": db.index.ntotal,
+        "index_mb": round(dir_size_mb(db_path), 3),
+        "rss_mb": round(current_rss_mb(), 1),
+        "peak_rss_mb": round(own, 1),
+        "peak_worker_rss_mb": round(children, 1),
+    })
+    return {"chunker": chunker, "index": spec, "retrieval": args.retrieval, "metrics": metrics}
+
+
+def git_commit():
+    try:
+        repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_key(entry):
+    return entry["chunker"], json.dumps(entry["index"], sort_keys=True), entry["retrieval"]
+
+
+def compare(baseline, report, tolerance):
+    """Print metric changes against ``baseline`` and return the regressions."""
+    previous = {run_key(entry): entry["metrics"] for entry in baseline["runs"]}
+    regressions = []
+    for entry in report["runs"]:
+        old = previous.get(run_key(entry))
+        if old is None:
+            continue
+        for name, value in entry["metrics"].items():
+            if not name.startswith(COMPARED) or name not in old or not old[name]:
+                continue
+            change = (value - old[name]) / abs(old[name])
+            worse = -change if name.startswith(HIGHER_IS_BETTER) else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            print(f"{entry['chunker']:<10} {entry['index']['type']:<9} {name:<18} {old[name]:>10} -> {value:<10} {change:+7.1%} {flag}")
+            if flag:
+                regressions.append((run_key(entry), name, old[name], value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=None, help="folder of PDFs (default: a synthetic textbook)")
+    parser.add_argument("--questions", default=None, help="labelled JSONL question set (required with --data)")
+    parser.add_argument("--chunker", nargs="+", default=["recursive"], choices=llm_database.CHUNKERS)
+    parser.add_argument("--index", nargs="+", type=parse_spec, default=[parse_spec("Flat")])
+    parser.add_argument("--retrieval", choices=("hybrid", "dense"), default="hybrid")
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 4, 10])
+    parser.add_argument("--answers", type=int, default=50, help="questions also answered through the stub LLM")
+    parser.add_argument("--chapters", type=int, default=8, help="synthetic textbook size")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes")
+    parser.add_argument("--fake-embeddings", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    if args.data and not args.questions:
+        parser.error("--data needs --questions")
+
+    with tempfile.TemporaryDirectory() as work:
+        data, questions_path = args.data, args.questions
+        if data is None:
+            data = os.path.join(work, "data")
+            os.makedirs(data)
+            questions_path = questions_path or os.path.join(work, "questions.jsonl")
+            make_textbook(os.path.join(data, "textbook.pdf"), chapters=args.chapters, questions_path=questions_path)
+        questions = read_questions(questions_path)
+
+        runs = []
+        for chunker in args.chunker:
+            for spec in args.index:
+                result = run(args, data, questions, work, chunker, spec)
+                runs.append(result)
+                metrics = result["metrics"]
+                recall = " ".join(f"{name} {value:.1%}" for name, value in metrics.items() if name.startswith("recall@"))
+                print(f"{chunker:<10} {spec['type']:<9} {recall}  MRR {metrics['mrr']:.3f}  "
+                      f"retrieve p50/p95/p99 {metrics['retrieve_p50_ms']}/{metrics['retrieve_p95_ms']}/{metrics['retrieve_p99_ms']} ms  "
+                      f"build {metrics['build_seconds']}s  {metrics['index_mb']} MB  RSS {metrics['rss_mb']} MB")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "data": args.data or "synthetic",
+        "questions": len(questions),
+        "embeddings": "fake" if args.fake_embeddings else EMBEDDING_MODEL,
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Load test for api_server.py against a stubbed LLM.
+
+Starts benchmarks/stub_endpoint.py and the API server in-process, then runs
+client threads that each hold one keep-alive connection and send /query
+(or /retrieve) requests back to back.
+
+    python -m benchmarks.load_api --fake-embeddings --clients 1 8 32
+    python -m benchmarks.load_api --url http://127.0.0.1:8000 --clients 16   # an already running server
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+from api_client import PathochatClient
+from benchmarks.bench_query import QUESTIONS
+
+
+def run_clients(url, clients, requests_per_client, endpoint):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(n):
+        api = PathochatClient(url)
+        call = api.answer if endpoint == "query" else api.retrieve
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                call(QUESTIONS[(n + i) % len(QUESTIONS)])
+            except requests.RequestException as e:
+                with lock:
+                    errors.append(e)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def start_local(args):
+    from langchain_huggingface import HuggingFaceEndpoint
+
+    from api_server import start_api
+    from benchmarks.bench_query import get_embeddings
+    from benchmarks.stub_endpoint import start_stub
+    from query_engine import QueryEngine
+    from vector_store import load_faiss
+
+    server, stub_url = start_stub(first_token_delay=args.latency, token_delay=0.0)
+    llm = HuggingFaceEndpoint(endpoint_url=stub_url, max_new_tokens=1024, huggingfacehub_api_token="stub")
+    engine = QueryEngine(load_faiss(args.db, get_embeddings(args.fake_embeddings)), llm)
+    stop, url = start_api(engine, max_concurrency=args.max_concurrency, queue_size=args.queue_size)
+    return url, lambda: (stop(), server.shutdown())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--endpoint", choices=["query", "retrieve"], default="query")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=8, help="requests per client")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per answer")
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    url, shutdown = (args.url, lambda: None) if args.url else start_local(args)
+    print(f"{'clients':>7} {'req/s':>8} {'p50':>9} {'p95':>9} {'errors':>7}")
+    for clients in args.clients:
+        latencies, errors, elapsed = run_clients(url, clients, args.requests, args.endpoint)
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+        p95 = latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else float("nan")
+        print(f"{clients:>7} {len(latencies) / elapsed:8.1f} {p50:6.0f} ms {p95:6.0f} ms {len(errors):>7}")
+    shutdown()
+
+
+if __name__ == "__main__":
+    main()
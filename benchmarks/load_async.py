@@ -0,0 +1,68 @@
+"""Throughput of the AsyncQueryEngine as concurrency grows.
+
+Fires a fixed number of questions at benchmarks/stub_endpoint.py for each
+concurrency level; with generation dominated by endpoint latency, requests
+per second should scale close to linearly until the stub or retrieval
+saturates. ``--llm resilient`` goes through ``llm_client.ResilientEndpoint``
+(the default LLM of the app and API) instead of the plain HuggingFaceEndpoint.
+
+    python -m benchmarks.load_async --db vector_store/faiss_database --fake-embeddings
+    python -m benchmarks.load_async --fake-embeddings --llm resilient --concurrency 16 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_huggingface import HuggingFaceEndpoint
+
+from async_engine import AsyncQueryEngine
+from benchmarks.bench_query import QUESTIONS, get_embeddings
+from benchmarks.stub_endpoint import start_stub
+from query_engine import QueryEngine
+from vector_store import load_faiss
+
+
+async def run_level(engine, concurrency, requests):
+    latencies = []
+
+    async def one(pool, i):
+        start = time.perf_counter()
+        await pool.answer(QUESTIONS[i % len(QUESTIONS)])
+        latencies.append(time.perf_counter() - start)
+
+    async with AsyncQueryEngine(engine, max_concurrency=concurrency, queue_size=requests) as pool:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(pool, i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vector_store/faiss_database")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per answer")
+    parser.add_argument("--fake-embeddings", action="store_true")
+    parser.add_argument("--llm", choices=["plain", "resilient"], default="plain")
+    args = parser.parse_args()
+
+    server, url = start_stub(first_token_delay=args.latency, token_delay=0.0)
+    if args.llm == "resilient":
+        from llm_client import ResilientClient, ResilientEndpoint
+
+        llm = ResilientEndpoint(client=ResilientClient(url), max_new_tokens=1024)
+    else:
+        llm = HuggingFaceEndpoint(endpoint_url=url, max_new_tokens=1024, huggingfacehub_api_token="stub")
+    engine = QueryEngine(load_faiss(args.db, get_embeddings(args.fake_embeddings)), llm)
+
+    print(f"{'concurrency':>11} {'req/s':>8} {'p50 latency':>12}")
+    for concurrency in args.concurrency:
+        throughput, p50 = asyncio.run(run_level(engine, concurrency, args.requests))
+        print(f"{concurrency:>11} {throughput:8.1f} {p50 * 1000:9.0f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Local stand-in for the Hugging Face text-generation endpoint.
+
+Speaks enough of the TGI protocol for ``HuggingFaceEndpoint(endpoint_url=...)``:
+plain JSON responses and ``stream=True`` server-sent events, emitting tokens
+on a configurable delay. With ``--recording`` it replays responses captured
+from the real endpoint (see ``record_responses``), tokens and timings included,
+in turn. Faults can be injected for testing the client: a share of requests
+answered with an HTTP error (``--error-rate``, ``--error-status``) and a share
+whose first token comes ``--slow-delay`` seconds late (``--slow-rate``).
+``--max-concurrency`` answers 429 to requests beyond that many in flight, like a
+rate-limited provider.
+
+    python -m benchmarks.stub_endpoint --port 8080 --token-delay 0.05
+    python -m benchmarks.stub_endpoint --port 8080 --recording hf_responses.jsonl
+    python -m benchmarks.stub_endpoint --port 8080 --error-rate 0.2 --slow-rate 0.05 --slow-delay 3
+    HF_ENDPOINT_URL=http://127.0.0.1:8080 streamlit run Pathochat.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "Coagulative necrosis preserves the basic tissue architecture for several days "
+    "because injury denatures structural proteins and enzymes alike."
+)
+
+
+class StubConfig:
+    def __init__(self, answer=DEFAULT_ANSWER, first_token_delay=0.2, token_delay=0.02, recording=None,
+                 error_rate=0.0, error_status=503, slow_rate=0.0, slow_delay=2.0, max_concurrency=None, seed=0):
+        self.answer = answer
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        # Recorded responses: {"tokens": [...], "first_token_delay": s, "token_delays": [s, ...]}
+        self.recording = recording
+        # Injected faults; may be changed while the server runs
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.max_concurrency = max_concurrency
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """Count a request in flight, or False when ``max_concurrency`` are already."""
+        with self.lock:
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def done(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def fault(self):
+        """``(error status or None, extra first-token delay)`` for the next request."""
+        with self.lock:
+            if self.rng.random() < self.error_rate:
+                self.errors += 1
+                return self.error_status, 0.0
+            return None, self.slow_delay if self.rng.random() < self.slow_rate else 0.0
+
+    def tokens(self, max_new_tokens=None):
+        # Whitespace-preserving word tokens, like a detokenized stream
+        words = self.answer.split(" ")
+        tokens = [word if i == 0 else " " + word for i, word in enumerate(words)]
+        return tokens[:max_new_tokens] if max_new_tokens else tokens
+
+    def next_response(self, max_new_tokens=None):
+        """``(tokens, first_token_delay, delays between tokens)`` of the next response."""
+        with self.lock:
+            self.requests += 1
+            number = self.requests
+        if not self.recording:
+            tokens = self.tokens(max_new_tokens)
+            return tokens, self.first_token_delay, [self.token_delay] * max(len(tokens) - 1, 0)
+        response = self.recording[(number - 1) % len(self.recording)]
+        tokens = response["tokens"][:max_new_tokens] if max_new_tokens else response["tokens"]
+        return tokens, response["first_token_delay"], response["token_delays"][:max(len(tokens) - 1, 0)]
+
+
+def load_recording(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_responses(llm, prompts, path):
+    """Stream ``prompts`` through ``llm`` (e.g. the real endpoint) and save tokens and timings for replay."""
+    with open(path, "w", encoding="utf-8") as f:
+        for prompt in prompts:
+            started = time.perf_counter()
+            tokens, times = [], []
+            for token in llm.stream(prompt):
+                tokens.append(token)
+                times.append(time.perf_counter())
+            if not tokens:
+                continue
+            record = {
+                "tokens": tokens,
+                "first_token_delay": round(times[0] - started, 4),
+                "token_delays": [round(b - a, 4) for a, b in zip(times, times[1:])],
+            }
+            f.write(json.dumps(record) + "\n")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up mid-stream (a cancelled or hedged request)
+            self.close_connection = True
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._send_json(200, {"model_id": "stub", "status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        params = request.get("parameters") or {}
+        if not self.config.admit():
+            self._send_json(429, {"error": "Too many requests", "error_type": "rate_limited"})
+            return
+        try:
+            self._generate(request, params)
+        finally:
+            self.config.done()
+
+    def _generate(self, request, params):
+        status, slow = self.config.fault()
+        if status is not None:
+            self._send_json(status, {"error": "Injected fault", "error_type": "overloaded"})
+            return
+        tokens, first_token_delay, delays = self.config.next_response(params.get("max_new_tokens"))
+        time.sleep(first_token_delay + slow)
+
+        if not request.get("stream"):
+            time.sleep(sum(delays))
+            self._send_json(200, [{"generated_text": "".join(tokens)}])
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(delays[i - 1])
+            last = i == len(tokens) - 1
+            event = {
+                "index": i,
+                "token": {"id": i, "text": token, "logprob": 0.0, "special": False},
+                "generated_text": "".join(tokens) if last else None,
+                "details": None,
+            }
+            self._send_chunk(f"data:{json.dumps(event)}\n\n".encode("utf-8"))
+        self._send_chunk(b"")
+
+
+class StubServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connection bursts from async clients,
+    # which then stall for a 1 s SYN retransmit
+    request_queue_size = 256
+
+
+def start_stub(port=0, **options):
+    """Run a stub server in a background thread; returns ``(server, url)``."""
+    handler = type("Handler", (StubHandler,), {"config": StubConfig(**options)})
+    server = StubServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    parser.add_argument("--recording", default=None, help="JSONL of recorded responses to replay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests with a late first token")
+    parser.add_argument("--slow-delay", type=float, default=2.0)
+    parser.add_argument("--max-concurrency", type=int, default=None, help="requests in flight before 429s")
+    args = parser.parse_args()
+
+    server, url = start_stub(
+        args.port, answer=args.answer, first_token_delay=args.first_token_delay, token_delay=args.token_delay,
+        recording=load_recording(args.recording) if args.recording else None, error_rate=args.error_rate,
+        error_status=args.error_status, slow_rate=args.slow_rate, slow_delay=args.slow_delay,
+        max_concurrency=args.max_concurrency
+    )
+    print(f"Stub text-generation endpoint on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Synthetic pathology textbook PDF for benchmarks that need a corpus.
+
+Chapters open on a new page with a "Chapter N" line and a title, numbered
+sections follow, and paragraphs of template sentences are wrapped the way a
+typeset page is, with the odd figure caption. Written with a minimal PDF
+writer so no PDF library is needed beyond the pypdf used to read it back.
+
+    python -m benchmarks.textbook_fixture data/synthetic_textbook.pdf --chapters 8 --questions questions.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import textwrap
+
+LINES_PER_PAGE = 48
+LINE_WIDTH = 92
+
+CHAPTERS = [
+    "Cell Injury and Cell Death", "Acute and Chronic Inflammation", "Tissue Repair",
+    "Hemodynamic Disorders", "Diseases of the Immune System", "Neoplasia",
+    "Genetic Disorders", "Infectious Diseases", "Environmental Pathology", "Blood Vessels",
+    "The Heart", "The Lung", "The Kidney", "The Liver and Gallbladder",
+]
+TOPICS = [
+    "coagulative necrosis", "liquefactive necrosis", "caseous necrosis", "apoptosis", "fatty change",
+    "neutrophil emigration", "granulomatous inflammation", "chronic inflammation", "scar formation",
+    "angiogenesis", "thrombosis", "embolism", "infarction", "septic shock", "amyloidosis",
+    "type I hypersensitivity", "autoimmunity", "dysplasia", "metastasis", "oncogene activation",
+    "tumor suppressor loss", "atherosclerosis", "hypertensive vasculopathy", "vasculitis",
+    "glomerulonephritis", "cirrhosis", "viral hepatitis", "tuberculosis", "pneumonia", "emphysema",
+]
+FEATURES = [
+    "eosinophilic cytoplasm", "nuclear pyknosis", "karyorrhexis", "loss of cell outlines",
+    "foamy macrophages", "multinucleate giant cells", "fibrin deposition", "edema of the interstitium",
+    "collagen deposition", "granulation tissue", "lymphocytic infiltrates", "hemosiderin-laden macrophages",
+    "nuclear pleomorphism", "abnormal mitoses", "loss of polarity", "Congo red positivity",
+    "apple-green birefringence", "lines of Zahn", "wedge-shaped pallor", "central caseation",
+]
+ORGANS = ["heart", "kidney", "liver", "lung", "brain", "spleen", "small bowel", "lymph node", "skin", "bone marrow"]
+CAUSES = [
+    "ischemia", "bacterial infection", "viral infection", "immune complex deposition", "toxin exposure",
+    "hypertension", "chronic alcohol use", "inherited mutations", "radiation", "hypoxia",
+]
+# (sentence, the question it answers)
+TEMPLATES = [
+    ("{Topic} is characterized by {feature} in the {organ}.", "What characterizes {topic} in the {organ}?"),
+    ("The most common cause of {topic} in the {organ} is {cause}.", "What most commonly causes {topic} in the {organ}?"),
+    ("Microscopically, {topic} shows {feature} and {feature2}.", "Which microscopic findings accompany {feature} in {topic}?"),
+    ("In the {organ}, {cause} leads to {topic} within days.", "How quickly does {cause} lead to {topic} in the {organ}?"),
+    ("{Feature} distinguishes {topic} from other lesions of the {organ}.", "What distinguishes {topic} from other lesions of the {organ}?"),
+    ("Clinically, {topic} of the {organ} presents after {cause}.", "When does {topic} of the {organ} present clinically?"),
+    ("Electron microscopy in {topic} reveals {feature} adjacent to {feature2}.", "What does electron microscopy of {topic} show next to {feature2}?"),
+    ("Because {cause} persists, {topic} progresses to {feature}.", "What does {topic} progress to when {cause} persists?"),
+]
+
+
+def sentence(rng, topic, facts=None):
+    feature, feature2 = rng.sample(FEATURES, 2)
+    fields = {
+        "topic": topic, "Topic": topic[0].upper() + topic[1:],
+        "feature": feature, "Feature": feature[0].upper() + feature[1:], "feature2": feature2,
+        "organ": rng.choice(ORGANS), "cause": rng.choice(CAUSES),
+    }
+    template, question = rng.choice(TEMPLATES)
+    text = template.format(**fields)
+    if facts is not None:
+        facts.append({"question": question.format(**fields), "evidence": text})
+    return text
+
+
+def textbook_pages(chapters=6, sections=4, paragraphs=5, seed=0, facts=None):
+    """Pages as lists of text lines, in reading order.
+
+    With a ``facts`` list, every body sentence is appended to it as a
+    labelled question: ``{"question", "evidence", "page"}``.
+    """
+    rng = random.Random(seed)
+    pages, lines = [], []
+
+    def new_page():
+        if lines:
+            pages.append(lines[:])
+            lines.clear()
+
+    def emit(new_lines):
+        # Keep a heading with at least the first lines below it
+        if len(lines) + min(len(new_lines), 3) > LINES_PER_PAGE:
+            new_page()
+        for line in new_lines:
+            if len(lines) >= LINES_PER_PAGE:
+                new_page()
+            lines.append(line)
+
+    figure = 0
+    for c in range(chapters):
+        new_page()
+        title = CHAPTERS[c % len(CHAPTERS)]
+        emit([f"Chapter {c + 1}", title])
+        for s in range(sections):
+            topic = rng.choice(TOPICS)
+            emit([f"{c + 1}.{s + 1} {topic.title()}"])
+            for _ in range(paragraphs):
+                added = [] if facts is not None else None
+                text = " ".join(sentence(rng, topic, added) for _ in range(rng.randint(3, 7)))
+                emit(textwrap.wrap(text, LINE_WIDTH))
+                if added:
+                    # Page the paragraph ends on; the evidence text is the real label
+                    facts.extend({**fact, "page": len(pages)} for fact in added)
+                if rng.random() < 0.15:
+                    figure += 1
+                    caption = f"Figure {c + 1}.{figure} {sentence(rng, topic)}"
+                    emit(textwrap.wrap(caption, LINE_WIDTH))
+    new_page()
+    return pages
+
+
+def write_pdf(path, pages):
+    """One Helvetica text line per entry of each page; no compression, no images."""
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>", None]
+    kids = []
+    for lines in pages:
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = ("BT /F1 10 Tf 50 760 Td 15 TL " + " ".join(f"({line}) '" for line in escaped) + " ET").encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 1 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_textbook(path, chapters=6, sections=4, paragraphs=5, seed=0, questions_path=None):
+    """Write the PDF, and with ``questions_path`` a JSONL question set labelled by evidence sentence."""
+    facts = [] if questions_path else None
+    pages = textbook_pages(chapters, sections, paragraphs, seed, facts)
+    write_pdf(path, pages)
+    if questions_path:
+        source = os.path.basename(path)
+        with open(questions_path, "w", encoding="utf-8") as f:
+            for i, fact in enumerate(facts):
+                f.write(json.dumps({"id": f"q{i}", "source": source, **fact}) + "\n")
+    return len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--chapters", type=int, default=6)
+    parser.add_argument("--sections", type=int, default=4)
+    parser.add_argument("--paragraphs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--questions", default=None, help="also write a labelled JSONL question set here")
+    args = parser.parse_args()
+    pages = make_textbook(args.path, args.chapters, args.sections, args.paragraphs, args.seed, args.questions)
+    print(f"Wrote {pages} pages to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
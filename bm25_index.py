@@ -0,0 +1,168 @@
+"""BM25 inverted index stored next to the FAISS index.
+
+Documents are FAISS rows. Terms are a sorted fixed-width byte array, so a
+term is found by binary search on the memory-mapped array without building a
+dictionary at load time; each term's postings are a slice of two flat
+arrays (row ids and term frequencies) addressed by an offsets array.
+
+    bm25.terms.npy     sorted terms, dtype S<n>
+    bm25.offsets.npy   int64, postings of term t are [offsets[t], offsets[t + 1])
+    bm25.rows.npy      int32 FAISS rows
+    bm25.tfs.npy       uint16 term frequencies
+    bm25.doclen.npy    int32 tokens per row
+    bm25.json          k1, b and the average document length
+
+    python bm25_index.py vector_store/faiss_database   # add to an existing index
+"""
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+# Which retriever the app uses when the BM25 files exist: "hybrid" or "dense"
+RETRIEVAL_MODE = os.getenv("PATHOCHAT_RETRIEVAL", "hybrid")
+K1 = 1.2
+B = 0.75
+MAX_TERM_BYTES = 32
+FILES = ("bm25.terms.npy", "bm25.offsets.npy", "bm25.rows.npy", "bm25.tfs.npy", "bm25.doclen.npy", "bm25.json")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with "
+    "what who how why when where does do".split()
+)
+
+
+def tokenize(text):
+    # Gene and stain names such as BRCA1 or PAS survive as single tokens
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _encode(token):
+    return token.encode("utf-8")[:MAX_TERM_BYTES]
+
+
+def build_bm25_index(texts, path, k1=K1, b=B):
+    """Write the BM25 files for ``texts`` (in FAISS row order) into ``path``."""
+    started = time.perf_counter()
+    postings = {}
+    doclen = np.zeros(len(texts), dtype=np.int32)
+    for row, text in enumerate(texts):
+        counts = Counter(_encode(token) for token in tokenize(text))
+        doclen[row] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, min(tf, 65535)))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    rows = np.empty(offsets[-1], dtype=np.int32)
+    tfs = np.empty(offsets[-1], dtype=np.uint16)
+    for i, term in enumerate(terms):
+        entries = np.asarray(postings[term], dtype=np.int64).reshape(-1, 2)
+        rows[offsets[i]:offsets[i + 1]] = entries[:, 0]
+        tfs[offsets[i]:offsets[i + 1]] = entries[:, 1]
+
+    width = max((len(term) for term in terms), default=1)
+    np.save(os.path.join(path, "bm25.terms.npy"), np.asarray(terms, dtype=f"S{width}"))
+    np.save(os.path.join(path, "bm25.offsets.npy"), offsets)
+    np.save(os.path.join(path, "bm25.rows.npy"), rows)
+    np.save(os.path.join(path, "bm25.tfs.npy"), tfs)
+    np.save(os.path.join(path, "bm25.doclen.npy"), doclen)
+    avgdl = float(doclen.mean()) if len(doclen) else 0.0
+    with open(os.path.join(path, "bm25.json"), "w", encoding="utf-8") as f:
+        json.dump({"k1": k1, "b": b, "avgdl": avgdl, "documents": len(texts), "terms": len(terms)}, f)
+    return {
+        "terms": len(terms),
+        "postings": int(offsets[-1]),
+        "seconds": time.perf_counter() - started,
+        "bytes": bm25_size(path),
+    }
+
+
+def write_bm25_index(db, path):
+    """Build the BM25 files for a LangChain FAISS store being saved to ``path``."""
+    texts = [db.docstore.search(db.index_to_docstore_id[i]).page_content for i in range(db.index.ntotal)]
+    return build_bm25_index(texts, path)
+
+
+def has_bm25_index(path):
+    return all(os.path.exists(os.path.join(path, name)) for name in FILES)
+
+
+def bm25_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in FILES if os.path.exists(os.path.join(path, name)))
+
+
+class BM25Index:
+    """Memory-mapped BM25 scorer over FAISS rows."""
+
+    def __init__(self, path):
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.terms = load("bm25.terms.npy")
+        self.offsets = load("bm25.offsets.npy")
+        self.rows = load("bm25.rows.npy")
+        self.tfs = load("bm25.tfs.npy")
+        self.doclen = load("bm25.doclen.npy")
+        with open(os.path.join(path, "bm25.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.k1, self.b, self.avgdl = meta["k1"], meta["b"], meta["avgdl"] or 1.0
+        self.count = len(self.doclen)
+        # Length normalization per row, computed once
+        self.norm = (self.k1 * (1 - self.b + self.b * self.doclen / self.avgdl)).astype(np.float32)
+
+    def __len__(self):
+        return self.count
+
+    def _term_ids(self, tokens):
+        # Longer than every indexed term means not indexed, and would be truncated by the cast
+        width = self.terms.dtype.itemsize
+        keys = sorted({key for key in map(_encode, tokens) if len(key) <= width})
+        if not keys or not len(self.terms):
+            return []
+        positions = np.searchsorted(self.terms, np.asarray(keys, dtype=self.terms.dtype))
+        return [int(p) for p, key in zip(positions, keys) if p < len(self.terms) and self.terms[p] == key]
+
+    def scores(self, query):
+        """BM25 score of every row for ``query``; rows without a query term score 0."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in self._term_ids(tokenize(query)):
+            start, end = self.offsets[term], self.offsets[term + 1]
+            rows = self.rows[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1.0 + (self.count - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self.norm[rows])
+        return scores
+
+    def search(self, query, k):
+        """``(rows, scores)`` of the top ``k`` rows with a nonzero score, best first."""
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        order = np.argsort(-scores[hits], kind="stable")
+        return hits[order], scores[hits[order]]
+
+
+def open_bm25_index(path, mode=RETRIEVAL_MODE):
+    # Dense-only when asked to, or for indexes built before BM25 was added
+    if mode != "hybrid" or not has_bm25_index(path):
+        return None
+    return BM25Index(path)
+
+
+if __name__ == "__main__":
+    from mmap_docstore import MmapDocstore, has_mmap_docstore
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "vector_store/faiss_database"
+    if not has_mmap_docstore(db_path):
+        raise SystemExit(f"{db_path} has no memory-mapped docstore; run python mmap_docstore.py {db_path} first")
+    docstore = MmapDocstore(db_path)
+    report = build_bm25_index([docstore.text[i] for i in range(len(docstore))], db_path)
+    print(f"BM25 index: {report['terms']} terms, {report['postings']} postings, "
+          f"{report['bytes'] / 1e6:.1f} MB in {report['seconds']:.1f}s")
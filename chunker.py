@@ -0,0 +1,195 @@
+"""Structure-aware chunking of PyPDF page text.
+
+PyPDF gives one line of text per printed line. Lines are grouped into
+units (chapter and section headings, figure/table captions, list items
+and paragraphs) and units are packed into chunks that
+never cut a paragraph unless it alone is longer than ``chunk_size``. Every
+chunk carries the chapter and section it falls under next to the usual
+source/page metadata; headings carry over from page to page, so pages of
+one PDF must arrive in order, as ``pdf_ingest.stream_pages`` yields them.
+"""
+import re
+import statistics
+from collections import Counter
+
+from langchain_core.documents import Document
+
+CHUNK_SIZE = 800
+MIN_CHUNK = 200
+
+_CHAPTER = re.compile(r"^(chapter|part)\s+(\d+|[ivxlc]+)\b", re.IGNORECASE)
+_NUMBERED_HEADING = re.compile(r"^\d+(\.\d+){0,3}\.?\s+[A-Z]")
+_CAPTION = re.compile(r"^(fig(ure)?\.?|table|box)\s*\d+([.\-–]\d+)*", re.IGNORECASE)
+_BULLET = re.compile(r"^([•▪◦‣●\-\*]|\(?\d{1,2}[.)]|\(?[a-z][.)])\s+")
+_SENTENCE_END = re.compile(r"[.!?:][\"')\]]?$")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"(])")
+_PAGE_NUMBER = re.compile(r"^\d+\s+|\s+\d+$")
+# Page-edge lines seen this often in one PDF are running headers/footers
+FURNITURE_REPEATS = 2
+
+
+def is_heading(line):
+    """Short title-like line: numbered, ALL CAPS or mostly capitalized words, no sentence ending."""
+    words = line.split()
+    if not words or len(words) > 12 or len(line) > 90 or line[-1] in ".,;" or _CAPTION.match(line):
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 4 and all(c.isupper() for c in letters):
+        return True
+    capitalized = sum(word[0].isupper() for word in words if len(word) > 3)
+    long_words = sum(len(word) > 3 for word in words)
+    return len(words) <= 8 and long_words > 0 and capitalized == long_words
+
+
+def _join(text, line):
+    # Undo end-of-line hyphenation of a lowercase word
+    if text.endswith("-") and line[:1].islower():
+        return text[:-1] + line
+    return f"{text} {line}" if text else line
+
+
+def page_units(text):
+    """``[(kind, text)]`` for one page; kind is chapter, section, caption, item or paragraph."""
+    lines = [line.strip() for line in text.splitlines()]
+    widths = [len(line) for line in lines if line]
+    # A line well short of the page's usual width that ends a sentence ends a paragraph
+    full_width = statistics.median(widths) * 0.8 if widths else 0
+    last = max((i for i, line in enumerate(lines) if line), default=-1)
+
+    units = []
+    current, kind = "", None
+    for i, line in enumerate(lines):
+        if not line:
+            if current:
+                units.append((kind, current))
+            current, kind = "", None
+            continue
+        if _CHAPTER.match(line) or is_heading(line):
+            if current:
+                units.append((kind, current))
+            current, kind = "", None
+            units.append(("chapter" if _CHAPTER.match(line) else "section", line))
+            continue
+        if _CAPTION.match(line) or _BULLET.match(line):
+            if current:
+                units.append((kind, current))
+            current, kind = line, "caption" if _CAPTION.match(line) else "item"
+        else:
+            current, kind = _join(current, line), kind or "paragraph"
+        # Captions are set apart from the text, so they end with their first sentence-ending line
+        if _SENTENCE_END.search(line) and (len(line) < full_width or i == last or kind == "caption"):
+            units.append((kind, current))
+            current, kind = "", None
+    if current:
+        units.append((kind, current))
+
+    # "Chapter 3" on its own line followed by the chapter name
+    merged = []
+    for kind, unit in units:
+        if merged and merged[-1][0] == "chapter" and kind == "section" and _CHAPTER.fullmatch(merged[-1][1].strip()):
+            merged[-1] = ("chapter", f"{merged[-1][1]}: {unit}")
+        else:
+            merged.append((kind, unit))
+    return merged
+
+
+def split_long(text, chunk_size):
+    # Sentence-wise pieces; the last sentence of a piece repeats at the start of the next
+    sentences = _SENTENCES.split(text)
+    pieces, current = [], []
+    for sentence in sentences:
+        if current and len(" ".join(current + [sentence])) > chunk_size:
+            pieces.append(" ".join(current))
+            current = current[-1:] if len(current[-1]) < chunk_size // 4 else []
+        current.append(sentence)
+    if current:
+        pieces.append(" ".join(current))
+    # A single sentence longer than a chunk is cut at word boundaries
+    out = []
+    for piece in pieces:
+        while len(piece) > chunk_size:
+            cut = piece.rfind(" ", 0, chunk_size)
+            cut = cut if cut > 0 else chunk_size
+            out.append(piece[:cut])
+            piece = piece[cut:].lstrip()
+        out.append(piece)
+    return [piece for piece in out if piece]
+
+
+class StructureChunker:
+    """Drop-in for ``RecursiveCharacterTextSplitter.split_documents`` on PyPDF pages."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE, min_chunk=MIN_CHUNK):
+        self.chunk_size = chunk_size
+        self.min_chunk = min_chunk
+        # Current (chapter, section) and page-edge line counts per source PDF
+        self.headings = {}
+        self.edges = {}
+
+    def _strip_furniture(self, source, text):
+        # Drop page numbers and running headers/footers, which would otherwise read as headings
+        lines = [line.strip() for line in text.splitlines()]
+        filled = [i for i, line in enumerate(lines) if line]
+        seen = self.edges.setdefault(source, Counter())
+        keys = {i: _PAGE_NUMBER.sub("", lines[i]) for i in filled[:2] + filled[-2:] if not _CHAPTER.fullmatch(lines[i])}
+        furniture = {i for i, key in keys.items() if seen[key] >= FURNITURE_REPEATS}
+        seen.update(set(keys.values()))
+        return "\n".join(line for i, line in enumerate(lines) if i not in furniture and not line.isdigit())
+
+    def _chunk(self, text, page, chapter, section):
+        metadata = {**page.metadata, "chapter": chapter, "section": section}
+        return Document(page_content=text, metadata=metadata)
+
+    def split_page(self, page):
+        source = page.metadata.get("source")
+        chapter, section = self.headings.get(source, ("", ""))
+        chunks, parts = [], []
+        body = False
+
+        def flush():
+            if parts:
+                chunks.append(self._chunk("\n".join(parts), page, chapter, section))
+                parts.clear()
+
+        for kind, text in page_units(self._strip_furniture(source, page.page_content)):
+            if kind in ("chapter", "section"):
+                # Consecutive headings (chapter title, first section) stay together
+                if body:
+                    flush()
+                body = False
+                if kind == "chapter":
+                    chapter, section = text, ""
+                else:
+                    section = text
+                # The heading opens the first chunk of its section
+                parts.append(text)
+                continue
+            body = True
+            size = len("\n".join(parts))
+            if parts and size + len(text) + 1 > self.chunk_size and size >= self.min_chunk:
+                flush()
+            if len(text) > self.chunk_size:
+                pieces = split_long(text, self.chunk_size - len("\n".join(parts)) if parts else self.chunk_size)
+                parts.append(pieces[0])
+                for piece in split_long(" ".join(pieces[1:]), self.chunk_size) if len(pieces) > 1 else []:
+                    flush()
+                    parts.append(piece)
+            else:
+                parts.append(text)
+        flush()
+
+        # A heading-only or tiny tail joins the chunk before it when they share a section
+        if len(chunks) > 1 and len(chunks[-1].page_content) < self.min_chunk:
+            tail = chunks.pop()
+            previous = chunks[-1]
+            if previous.metadata["section"] == tail.metadata["section"]:
+                previous.page_content += "\n" + tail.page_content
+            else:
+                chunks.append(tail)
+        self.headings[source] = (chapter, section)
+        return [chunk for chunk in chunks if chunk.page_content.strip()]
+
+    def split_documents(self, documents):
+        return [chunk for page in documents for chunk in self.split_page(page)]
@@ -0,0 +1,130 @@
+import math
+import os
+import re
+from functools import lru_cache
+
+from langchain_core.documents import Document
+
+# Prompt context budget in tokens; "off" sends retrieved chunks unchanged
+CONTEXT_TOKENS = os.getenv("PATHOCHAT_CONTEXT_TOKENS", "1500")
+# Hugging Face tokenizer to count with; unset estimates 4 characters per token
+TOKENIZER = os.getenv("PATHOCHAT_TOKENIZER")
+# Shortest suffix/prefix match treated as splitter overlap rather than coincidence
+MIN_OVERLAP = 30
+# Share of a passage's word trigrams already in a kept passage that makes it a duplicate
+DUPLICATE_SIMILARITY = 0.8
+# Smallest remainder worth filling with a truncated passage
+MIN_TAIL_TOKENS = 40
+
+
+@lru_cache(maxsize=None)
+def _load_tokenizer(name):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(name)
+
+
+def count_tokens(text, tokenizer=TOKENIZER):
+    if tokenizer:
+        return len(_load_tokenizer(tokenizer).encode(text, add_special_tokens=False))
+    return math.ceil(len(text) / 4)
+
+
+def merge_overlap(first, second):
+    """``first`` and ``second`` joined over their shared text, or None if they don't overlap."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    head = second[:MIN_OVERLAP]
+    start = first.find(head)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first[:start] + second
+        start = first.find(head, start + 1)
+    return None
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def _page_key(doc):
+    return doc.metadata.get("source"), doc.metadata.get("page")
+
+
+class ContextPacker:
+    """Turns retrieved chunks into compact prompt context.
+
+    Chunks from the same page are stitched together over the text the
+    splitter repeated, pages are kept in retrieval order, passages mostly
+    repeating a better-ranked one (another edition, a recap box) are
+    dropped, and the result is cut to ``max_tokens``.
+    """
+
+    def __init__(self, max_tokens=1500, tokenizer=TOKENIZER):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+
+    def _merge_page(self, texts):
+        merged = []
+        for text in texts:
+            for i, passage in enumerate(merged):
+                joined = merge_overlap(passage, text) or merge_overlap(text, passage)
+                if joined is not None:
+                    merged[i] = joined
+                    break
+            else:
+                merged.append(text)
+        # Non-overlapping chunks of one page still travel as one passage
+        return "\n".join(merged)
+
+    def _truncate(self, text, budget):
+        # Cut at the last sentence end that fits
+        sentences = re.split(r"(?<=[.!?])\s+", text)
+        kept = []
+        for sentence in sentences:
+            if count_tokens(" ".join(kept + [sentence]), self.tokenizer) > budget:
+                break
+            kept.append(sentence)
+        return " ".join(kept)
+
+    def pack(self, docs):
+        """Packed passages as Documents carrying the first chunk's metadata of each page."""
+        pages = {}
+        for doc in docs:
+            pages.setdefault(_page_key(doc), []).append(doc)
+
+        passages, seen = [], []
+        for group in pages.values():
+            text = self._merge_page([doc.page_content for doc in group])
+            shingles = _shingles(text)
+            if any(len(shingles & other) / len(shingles) >= DUPLICATE_SIMILARITY for other in seen):
+                continue
+            seen.append(shingles)
+            passages.append(Document(page_content=text, metadata=group[0].metadata))
+
+        packed, used = [], 0
+        for passage in passages:
+            tokens = count_tokens(passage.page_content, self.tokenizer)
+            if used + tokens > self.max_tokens:
+                remaining = self.max_tokens - used
+                if remaining >= MIN_TAIL_TOKENS:
+                    text = self._truncate(passage.page_content, remaining)
+                    if text:
+                        packed.append(Document(page_content=text, metadata=passage.metadata))
+                        used += count_tokens(text, self.tokenizer)
+                break
+            packed.append(passage)
+            used += tokens
+        return packed
+
+    def count(self, text):
+        return count_tokens(text, self.tokenizer)
+
+
+def open_context_packer(max_tokens=CONTEXT_TOKENS):
+    if str(max_tokens).lower() in ("", "off", "none"):
+        return None
+    return ContextPacker(int(max_tokens))
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+CACHE_DIR = os.getenv("PATHOCHAT_EMBEDDING_CACHE", os.path.join("vector_store", "embedding_cache"))
+# Row cap of the vector file; 100k MiniLM rows is ~150 MB on disk
+CACHE_ROWS = int(os.getenv("PATHOCHAT_EMBEDDING_CACHE_ROWS", "100000"))
+# Seconds after which a claimed slot whose rows never arrived is reused: its writer died
+CLAIM_TIMEOUT = 600
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model_name, kind, text):
+    # kind keeps query and document vectors apart for models that embed them differently
+    raw = f"{model_name}\0{kind}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha1(raw).digest()
+
+
+class EmbeddingCache:
+    """Content-addressed vector cache: a memory-mapped float32 matrix plus a
+    SQLite table mapping key -> row. The least recently used rows are
+    overwritten once ``capacity`` rows are taken.
+
+    A row is written only after the slot it goes to has been claimed in a
+    committed transaction, and its entry is inserted only after that, so no
+    committed entry ever points at a slot whose vector is being replaced.
+    """
+
+    def __init__(self, path, dim, capacity=CACHE_ROWS):
+        os.makedirs(path, exist_ok=True)
+        self.dim = dim
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        # Slots released by a failed write; slots from ``next_slot`` up have never been used
+        self.db.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        # Slots being written, entries not inserted yet
+        self.db.execute("CREATE TABLE IF NOT EXISTS claimed (slot INTEGER PRIMARY KEY, at REAL)")
+
+        vectors_path = os.path.join(path, "vectors.f32")
+        layout = dict(self.db.execute("SELECT name, value FROM meta").fetchall())
+        expected_size = capacity * dim * 4
+        reuse = (
+            layout.get("dim") == dim and layout.get("capacity") == capacity
+            and os.path.exists(vectors_path)
+            and os.path.getsize(vectors_path) == expected_size
+        )
+        if not reuse:
+            # Layout changed: start over rather than read rows of the wrong shape
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM free_slots")
+            self.db.execute("DELETE FROM claimed")
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('dim', ?), ('capacity', ?), ('next_slot', 0)", (dim, capacity)
+            )
+        # Caches written before free slots were tracked fill their slots from 0 up
+        self.db.execute(
+            "INSERT OR IGNORE INTO meta VALUES ('next_slot', (SELECT COALESCE(MAX(slot) + 1, 0) FROM entries))"
+        )
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+" if reuse else "w+", shape=(capacity, dim))
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _slots(self, keys):
+        return dict(self.db.execute(
+            f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(keys))})", keys
+        ).fetchall())
+
+    def get_many(self, keys):
+        """Return ``{key: vector}`` for the keys that are cached."""
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                copied = {key: (slot, np.array(self.vectors[slot])) for key, slot in self._slots(batch).items()}
+                if not copied:
+                    continue
+                # Another process may evict a row and rewrite its slot while we copy:
+                # keep only vectors whose entry still holds that slot afterwards
+                current = self._slots(list(copied))
+                found.update((key, vector) for key, (slot, vector) in copied.items() if current.get(key) == slot)
+            if found:
+                now = time.time()
+                self.db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+        return found
+
+    def _claim(self, keys):
+        """The keys not cached yet, a slot for each that no entry points at any more, and the claim time."""
+        now = time.time()
+        # IMMEDIATE serialises slot allocation across processes sharing the cache
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("INSERT OR IGNORE INTO free_slots SELECT slot FROM claimed WHERE at < ?",
+                            (now - CLAIM_TIMEOUT,))
+            self.db.execute("DELETE FROM claimed WHERE at < ?", (now - CLAIM_TIMEOUT,))
+            # Keys are content hashes, so a cached key already holds the right vector
+            existing = set()
+            for start in range(0, len(keys), _SQL_BATCH):
+                existing.update(self._slots(keys[start:start + _SQL_BATCH]))
+            new_keys = [k for k in keys if k not in existing][:self.capacity]
+            slots = [slot for (slot,) in self.db.execute("SELECT slot FROM free_slots LIMIT ?", (len(new_keys),))]
+            self.db.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in slots])
+            next_slot = self.db.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()[0]
+            fresh = max(min(len(new_keys) - len(slots), self.capacity - next_slot), 0)
+            slots.extend(range(next_slot, next_slot + fresh))
+            self.db.execute("UPDATE meta SET value = ? WHERE name = 'next_slot'", (next_slot + fresh,))
+            evict = len(new_keys) - len(slots)
+            if evict:
+                victims = self.db.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict,)
+                ).fetchall()
+                self.db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+                slots.extend(slot for _, slot in victims)
+            self.db.executemany("INSERT INTO claimed VALUES (?, ?)", [(slot, now) for slot in slots])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        # Fewer slots than keys only while other writers hold the rest
+        return new_keys[:len(slots)], slots, now
+
+    def _free(self, slots, claimed_at):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            for slot in slots:
+                # A claim that timed out has been handed on already
+                if self.db.execute("DELETE FROM claimed WHERE slot = ? AND at = ?", (slot, claimed_at)).rowcount:
+                    self.db.execute("INSERT OR IGNORE INTO free_slots VALUES (?)", (slot,))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def put_many(self, items):
+        """Store ``(key, vector)`` pairs, evicting least recently used rows when full.
+
+        The evicted entries are deleted and the slots claimed in one committed
+        transaction, then the vectors are written, then the entries inserted.
+        A crash in between leaves the slots unused for ``CLAIM_TIMEOUT``
+        seconds, never an entry pointing at the wrong vector.
+        """
+        if not items:
+            return
+        items = dict(items)
+        with self.lock:
+            keys, slots, claimed_at = self._claim(list(items))
+            done = False
+            try:
+                for key, slot in zip(keys, slots):
+                    self.vectors[slot] = items[key]
+                self.vectors.flush()
+                now = time.time()
+                self.db.execute("BEGIN IMMEDIATE")
+                try:
+                    for key, slot in zip(keys, slots):
+                        # A claim that timed out has been handed on already
+                        if not self.db.execute(
+                            "DELETE FROM claimed WHERE slot = ? AND at = ?", (slot, claimed_at)
+                        ).rowcount:
+                            continue
+                        # Another process may have stored the same key meanwhile
+                        if not self.db.execute(
+                            "INSERT OR IGNORE INTO entries (key, slot, last_used) VALUES (?, ?, ?)", (key, slot, now)
+                        ).rowcount:
+                            self.db.execute("INSERT OR IGNORE INTO free_slots VALUES (?)", (slot,))
+                    self.db.execute("COMMIT")
+                    done = True
+                except BaseException:
+                    self.db.execute("ROLLBACK")
+                    raise
+            finally:
+                if not done:
+                    self._free(slots, claimed_at)
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that only computes vectors missing from the cache."""
+
+    def __init__(self, embeddings, model_name, cache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def _embed_array(self, texts, kind, compute):
+        keys = [cache_key(self.model_name, kind, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = np.asarray(compute(list(missing.values())), dtype=np.float32)
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(list(computed.items()))
+            found.update(computed)
+        if not keys:
+            return np.empty((0, self.cache.dim), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def embed_documents_array(self, texts):
+        compute = getattr(self.embeddings, "embed_documents_array", self.embeddings.embed_documents)
+        return self._embed_array(texts, "doc", compute)
+
+    def embed_documents(self, texts):
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self._embed_array([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0].tolist()
+
+    def embed_queries_array(self, texts):
+        # MiniLM encodes queries like documents, so misses share one batched call
+        compute = getattr(self.embeddings, "embed_documents_array", self.embeddings.embed_documents)
+        return self._embed_array(texts, "query", compute)
+
+
+def embed_documents_array(embeddings, texts):
+    # (n, dim) float32 without a detour through lists of Python floats when possible
+    if hasattr(embeddings, "embed_documents_array"):
+        return embeddings.embed_documents_array(texts)
+    return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def embed_queries_array(embeddings, texts):
+    # Many queries in one model call instead of one embed_query per question
+    if hasattr(embeddings, "embed_queries_array"):
+        return embeddings.embed_queries_array(texts)
+    return embed_documents_array(embeddings, texts)
+
+
+def get_cached_embeddings(model_name, embeddings=None, cache_dir=CACHE_DIR, capacity=CACHE_ROWS, dim=None):
+    # A known ``dim`` skips the probe, which would load the model
+    if embeddings is None:
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    try:
+        dim = dim or len(embeddings.embed_query("dimension probe"))
+        cache = EmbeddingCache(cache_dir, dim, capacity)
+    except (OSError, sqlite3.Error) as e:
+        # e.g. a read-only deploy: fall back to computing every vector
+        print(f"Embedding cache disabled: {e}")
+        return embeddings
+    return CachedEmbeddings(embeddings, model_name, cache)
@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BATCH_SIZE = 64
+
+# One SentenceTransformer per worker process, loaded by the pool initializer
+_model = None
+
+
+def _init_worker(model_name, threads):
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Workers split the cores between them instead of each grabbing all of them
+    torch.set_num_threads(threads)
+    _model = SentenceTransformer(model_name, device="cpu")
+
+
+def _dimension():
+    return _model.get_sentence_embedding_dimension()
+
+
+def _encode_batch(shm_name, shape, rows, texts):
+    # Write this batch's vectors straight into the parent's shared matrix
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[rows] = _model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+        del out
+    finally:
+        shm.close()
+    return len(rows)
+
+
+def token_lengths(texts, tokenizer):
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+class EmbeddingEngine:
+    """Embed large text batches across a pool of processes.
+
+    Texts are sorted by token length so each batch pads to a similar length,
+    and workers write their rows into one preallocated shared matrix. The
+    worker processes start on the first ``encode``, so a run that finds
+    everything cached never loads a model; use as a context manager or
+    ``close()`` it to stop them.
+    """
+
+    def __init__(self, model_name, workers=None, batch_size=BATCH_SIZE):
+        self.model_name = model_name
+        self.workers = workers or max(1, (os.cpu_count() or 1) // 2)
+        self.batch_size = batch_size
+        self.tokenizer = None
+        self.executor = None
+        self.dim = None
+
+    def _start(self):
+        from transformers import AutoTokenizer
+
+        cpus = os.cpu_count() or 1
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # spawn: torch and the Rust tokenizer do not survive fork reliably
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name, max(1, cpus // self.workers)),
+        )
+        self.dim = self.executor.submit(_dimension).result()
+
+    def encode(self, texts):
+        if self.executor is None:
+            self._start()
+        shape = (len(texts), self.dim)
+        if not texts:
+            return np.empty(shape, dtype=np.float32)
+        order = np.argsort(token_lengths(texts, self.tokenizer), kind="stable")
+        shm = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * 4)
+        try:
+            futures = []
+            for start in range(0, len(order), self.batch_size):
+                rows = order[start:start + self.batch_size].tolist()
+                futures.append(self.executor.submit(
+                    _encode_batch, shm.name, shape, rows, [texts[r] for r in rows]
+                ))
+            for future in as_completed(futures):
+                future.result()
+            shared = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            vectors = shared.copy()
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+        return vectors
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EngineEmbeddings(Embeddings):
+    """LangChain adapter so FAISS and the embedding cache can drive the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def embed_documents_array(self, texts):
+        return self.engine.encode(list(texts))
+
+    def embed_documents(self, texts):
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.engine.encode([text])[0].tolist()
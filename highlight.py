@@ -0,0 +1,88 @@
+"""Query-term highlighting for retrieval-only results.
+
+Terms are the query's BM25 tokens (lowercase, stopwords dropped), so what is
+highlighted is what the lexical retriever matched on. A term also matches words
+it begins, so "granuloma" marks "granulomas" and "granulomatous". Each passage
+gets a snippet around its densest cluster of matches, with the spans of every
+match, and an HTML rendering with ``<mark>``.
+"""
+import html
+import os
+import re
+
+from bm25_index import tokenize
+
+# Characters of passage text shown around the matches
+SNIPPET_CHARS = 400
+# Terms shorter than this only match whole words
+MIN_PREFIX_TERM = 4
+
+
+def query_terms(query):
+    # Unique, longest first so "necrosis" is preferred over "necro" in the alternation
+    return sorted(set(tokenize(query)), key=lambda term: (-len(term), term))
+
+
+def _pattern(terms):
+    parts = [re.escape(term) + (r"\w*" if len(term) >= MIN_PREFIX_TERM else "") for term in terms]
+    return re.compile(r"\b(?:" + "|".join(parts) + r")\b", re.IGNORECASE)
+
+
+def match_spans(text, terms):
+    """``[(start, end)]`` of words in ``text`` matching any of ``terms``."""
+    if not terms:
+        return []
+    return [match.span() for match in _pattern(terms).finditer(text)]
+
+
+def snippet(text, spans, width=SNIPPET_CHARS):
+    """``(start, end)`` of the ``width``-character window holding the most matches, on word boundaries."""
+    if len(text) <= width:
+        return 0, len(text)
+    best, best_start = -1, 0
+    for start, _ in spans or [(0, 0)]:
+        # Open the window a little before the match it starts at
+        window_start = max(min(start - width // 8, len(text) - width), 0)
+        count = sum(1 for s, e in spans if s >= window_start and e <= window_start + width)
+        if count > best:
+            best, best_start = count, window_start
+    end = best_start + width
+    if best_start:
+        best_start = text.find(" ", best_start) + 1 or best_start
+    if end < len(text):
+        cut = text.rfind(" ", best_start, end)
+        end = cut if cut > best_start else end
+    return best_start, end
+
+
+def mark(text, spans, start=0, end=None):
+    """HTML of ``text[start:end]`` with ``spans`` wrapped in ``<mark>``."""
+    end = len(text) if end is None else end
+    parts, position = [], start
+    for s, e in spans:
+        if s < start or e > end:
+            continue
+        parts.append(html.escape(text[position:s]))
+        parts.append(f"<mark>{html.escape(text[s:e])}</mark>")
+        position = e
+    parts.append(html.escape(text[position:end]))
+    return ("… " if start else "") + "".join(parts) + (" …" if end < len(text) else "")
+
+
+def passage(doc, rank, terms):
+    """A ranked search result: text, where it comes from, and its highlighted snippet."""
+    text = " ".join(doc.page_content.split())
+    spans = match_spans(text, terms)
+    start, end = snippet(text, spans)
+    page = doc.metadata.get("page")
+    return {
+        "rank": rank,
+        "text": text,
+        "source": os.path.basename(str(doc.metadata.get("source", ""))) or None,
+        # PDF loaders number pages from 0
+        "page": None if page is None else page + 1,
+        "chapter": doc.metadata.get("chapter"),
+        "section": doc.metadata.get("section"),
+        "matches": spans,
+        "snippet_html": mark(text, spans, start, end),
+    }
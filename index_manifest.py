@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from bm25_index import write_bm25_index
+from index_spec import LOSSY_TYPES, reconstruct_all, save_spec
+from mmap_docstore import write_mmap_docstore
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# Exact float32 vectors in index row order, kept for indexes that compress them
+VECTORS_NAME = "vectors.f32"
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source, page, text, occurrence=0):
+    # Content hash of a chunk; occurrence separates identical text on one page
+    key = f"{source}\0{page}\0{occurrence}\0{text}".encode("utf-8")
+    return hashlib.sha1(key).hexdigest()
+
+
+def empty_manifest(embedding_model):
+    return {"version": MANIFEST_VERSION, "embedding_model": embedding_model, "files": {}}
+
+
+def load_manifest(vec_path):
+    path = os.path.join(vec_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def diff_files(manifest, pdf_files, data):
+    """Compare ``pdf_files`` against the manifest by content hash.
+
+    Returns ``(changed, removed, hashes)``: files that are new or whose bytes
+    differ, manifest entries whose file is gone, and the current hash of
+    every file keyed by its path relative to ``data``.
+    """
+    known = manifest["files"]
+    hashes = {}
+    changed = []
+    for path in pdf_files:
+        rel = os.path.relpath(path, data)
+        hashes[rel] = file_sha256(path)
+        entry = known.get(rel)
+        if entry is None or entry["sha256"] != hashes[rel]:
+            changed.append(path)
+    removed = [rel for rel in known if rel not in hashes]
+    return changed, removed, hashes
+
+
+def load_vectors(vec_path, index, spec):
+    """Exact vectors of a saved index in row order, or None if they cannot be recovered.
+
+    Lossy indexes (SQ8, IVF-PQ) read them from the vectors file written with
+    the index; Flat, IVF-Flat and HNSW give them back themselves.
+    """
+    path = os.path.join(vec_path, VECTORS_NAME)
+    if os.path.exists(path) and os.path.getsize(path) == index.ntotal * index.d * 4:
+        return np.memmap(path, dtype=np.float32, mode="r", shape=(index.ntotal, index.d))
+    if spec["type"] in LOSSY_TYPES:
+        return None
+    return reconstruct_all(index)
+
+
+class ChunkIdAssigner:
+    """Give each chunk of one rebuild a stable, content-derived id."""
+
+    def __init__(self, data):
+        self.data = data
+        self.seen = {}
+
+    def __call__(self, chunk):
+        rel = os.path.relpath(chunk.metadata["source"], self.data)
+        page = chunk.metadata.get("page", 0)
+        key = (rel, page, chunk.page_content)
+        occurrence = self.seen.get(key, 0)
+        self.seen[key] = occurrence + 1
+        return rel, chunk_id(rel, page, chunk.page_content, occurrence)
+
+
+def save_atomic(db, manifest, vec_path, spec=None, vectors=None):
+    """Write index, manifest and ``vectors`` (if given) to a sibling temp dir, then swap it in.
+
+    Readers never see a half written index: the path only disappears for
+    the instant between the two renames, and the old copy is removed after.
+    """
+    vec_path = os.path.abspath(vec_path)
+    parent = os.path.dirname(vec_path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".faiss_tmp-", dir=parent)
+    try:
+        db.save_local(tmp)
+        write_mmap_docstore(db, tmp)
+        bm25 = write_bm25_index(db, tmp)
+        print(f"BM25 index: {bm25['terms']} terms, {bm25['postings']} postings, "
+              f"{bm25['bytes'] / 1e6:.1f} MB in {bm25['seconds']:.1f}s")
+        if spec is not None:
+            save_spec(tmp, spec, db.index)
+        if vectors is not None:
+            np.ascontiguousarray(vectors, dtype=np.float32).tofile(os.path.join(tmp, VECTORS_NAME))
+        if manifest is not None:
+            with open(os.path.join(tmp, MANIFEST_NAME), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+        old = None
+        if os.path.exists(vec_path):
+            old = tmp + ".old"
+            os.rename(vec_path, old)
+        os.rename(tmp, vec_path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
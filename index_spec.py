@@ -0,0 +1,112 @@
+import json
+import os
+
+import faiss
+import numpy as np
+
+SPEC_FILE = "index_spec.json"
+
+# Index types the builder understands and their default parameters
+DEFAULT_PARAMS = {
+    "Flat": {},
+    "SQ8": {},
+    "IVF-Flat": {"nlist": 1024, "nprobe": 16},
+    "IVF-PQ": {"nlist": 1024, "m": 48, "nbits": 8, "nprobe": 16},
+    "HNSW": {"M": 32, "efConstruction": 200, "efSearch": 64},
+}
+# Index types that keep only compressed codes, so their exact vectors are saved next to them
+LOSSY_TYPES = ("SQ8", "IVF-PQ")
+# Vectors sampled for training IVF centroids, PQ codebooks and SQ ranges
+MAX_TRAIN_VECTORS = 100_000
+# FAISS wants roughly this many training points per centroid
+_POINTS_PER_CENTROID = 39
+
+
+def parse_spec(text):
+    """Parse ``"IVF-PQ:nlist=512,m=48"`` into ``{"type": "IVF-PQ", "nlist": 512, ...}``."""
+    name, _, params = text.partition(":")
+    if name not in DEFAULT_PARAMS:
+        raise ValueError(f"Unknown index type {name!r}, expected one of {', '.join(DEFAULT_PARAMS)}")
+    spec = {"type": name, **DEFAULT_PARAMS[name]}
+    for item in filter(None, params.split(",")):
+        key, _, value = item.partition("=")
+        if key not in DEFAULT_PARAMS[name]:
+            raise ValueError(f"{name} does not take a {key!r} parameter")
+        spec[key] = int(value)
+    return spec
+
+
+FLAT = parse_spec("Flat")
+
+
+def supports_incremental(spec):
+    # Flat and SQ8 renumber rows on remove_ids like LangChain's FAISS.delete
+    # expects; IVF keeps its own ids and HNSW cannot remove at all
+    return spec["type"] in ("Flat", "SQ8")
+
+
+def reconstruct_all(index):
+    """(ntotal, dim) float32 copy of the vectors an uncompressed index holds."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # IVF lists are only addressable by row through a direct map
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def factory_string(spec, n_vectors):
+    kind = spec["type"]
+    if kind == "Flat":
+        return "Flat"
+    if kind == "SQ8":
+        return "SQ8"
+    if kind == "HNSW":
+        return f"HNSW{spec['M']}"
+    # Small corpora cannot train many centroids or 8-bit codebooks
+    nlist = max(1, min(spec["nlist"], n_vectors // _POINTS_PER_CENTROID))
+    if kind == "IVF-Flat":
+        return f"IVF{nlist},Flat"
+    nbits = spec["nbits"]
+    while nbits > 4 and n_vectors < _POINTS_PER_CENTROID * (1 << nbits):
+        nbits -= 1
+    return f"IVF{nlist},PQ{spec['m']}x{nbits}"
+
+
+def apply_search_params(index, spec):
+    params = faiss.ParameterSpace()
+    if spec["type"] in ("IVF-Flat", "IVF-PQ"):
+        params.set_index_parameter(index, "nprobe", spec["nprobe"])
+    elif spec["type"] == "HNSW":
+        params.set_index_parameter(index, "efSearch", spec["efSearch"])
+
+
+def build_index(spec, vectors, seed=0):
+    """Build and fill a FAISS index of ``spec`` from an (n, dim) float32 matrix."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index = faiss.index_factory(dim, factory_string(spec, n), faiss.METRIC_L2)
+    if spec["type"] == "HNSW":
+        index.hnsw.efConstruction = spec["efConstruction"]
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors if n <= MAX_TRAIN_VECTORS else vectors[rng.choice(n, MAX_TRAIN_VECTORS, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    apply_search_params(index, spec)
+    return index
+
+
+def save_spec(vec_path, spec, index):
+    record = {**spec, "index_class": type(index).__name__, "ntotal": index.ntotal}
+    with open(os.path.join(vec_path, SPEC_FILE), "w", encoding="utf-8") as f:
+        json.dump(record, f)
+
+
+def load_spec(vec_path):
+    # Indexes built before specs were recorded are plain flat indexes
+    path = os.path.join(vec_path, SPEC_FILE)
+    if not os.path.exists(path):
+        return dict(FLAT)
+    with open(path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    return {key: record[key] for key in ("type", *DEFAULT_PARAMS[record["type"]])}
@@ -0,0 +1,425 @@
+"""LLM backends for the query engine, picked with ``PATHOCHAT_LLM_BACKEND``.
+
+    hf        HuggingFaceEndpoint: the hosted inference API, or HF_ENDPOINT_URL (default),
+              or a pool of endpoints with PATHOCHAT_LLM_ENDPOINTS (llm_router.py)
+    llamacpp  a quantized GGUF instruct model on the local CPU through llama-cpp-python,
+              for air-gapped deploys: PATHOCHAT_LLAMA_MODEL=/models/mistral-7b-instruct-v0.3.Q4_K_M.gguf
+
+Both are LangChain LLMs, so ``invoke`` and ``stream`` look the same to the engine,
+as do ``ainvoke`` and ``astream``, which wait on the event loop rather than a thread.
+
+The llama.cpp backend keeps one model on one worker thread. Requests that arrive
+while others are generating join the running batch (up to ``PATHOCHAT_LLM_BATCH``
+sequences), and every decode step is one forward pass for all of them, which on a
+memory-bound CPU costs little more than a pass for one. The KV cache of the
+shared ``PROMPT_TEMPLATE`` prefix is computed once at load and copied into each
+new sequence, so only the context and question are prefilled per request.
+"""
+import asyncio
+import codecs
+import ctypes
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import aclosing
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+BACKEND = os.getenv("PATHOCHAT_LLM_BACKEND", "hf")
+LLAMA_MODEL = os.getenv("PATHOCHAT_LLAMA_MODEL")
+# KV cache cells shared by the prefix and every running sequence; 0 sizes it so
+# every sequence fits a full prompt plus MAX_NEW_TOKENS
+LLAMA_CTX = int(os.getenv("PATHOCHAT_LLAMA_CTX", "0"))
+# Prompt tokens each sequence holds beyond the shared prefix; 0 derives it from the context packer's budget
+LLAMA_PROMPT_TOKENS = int(os.getenv("PATHOCHAT_LLAMA_PROMPT_TOKENS", "0"))
+# Without context packing the passages are not budgeted: room for k chunks and the question
+UNPACKED_PROMPT_TOKENS = 2048
+LLAMA_THREADS = int(os.getenv("PATHOCHAT_LLAMA_THREADS", "0")) or os.cpu_count()
+# Sequences decoded together, and how long a request waits for company when the model is idle
+MAX_BATCH = int(os.getenv("PATHOCHAT_LLM_BATCH", "4"))
+BATCH_WAIT_MS = float(os.getenv("PATHOCHAT_LLM_BATCH_WAIT_MS", "20"))
+# Same generation settings as the endpoint
+MAX_NEW_TOKENS = 1024
+TEMPERATURE = 0.5
+TOP_K = 40
+# Tokens per llama_decode call while prefilling
+PREFILL_CHUNK = 512
+
+# Sequence id holding the KV cache of the prompt template prefix; requests use 1..MAX_BATCH
+PREFIX_SEQ = 0
+
+
+class GenerationRequest:
+    def __init__(self, tokens, max_tokens, temperature, stop, out=None):
+        self.tokens = tokens
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = stop or []
+        # Text pieces, then None at the end or an exception
+        self.out = out or queue.Queue()
+        self.cancelled = False
+        self.seq = None
+        # Leading tokens shared with the cached template prefix
+        self.shared = 0
+        self.pos = 0
+        self.last_token = None
+        self.generated = 0
+        self.text = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+
+class AsyncOutput:
+    """``GenerationRequest.out`` for an asyncio caller: the worker hands pieces to its event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            # The caller's event loop is closed; nobody is reading
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+
+def prompt_budget():
+    """Prompt tokens a sequence must hold: the packed context, the question and the template tail."""
+    if LLAMA_PROMPT_TOKENS:
+        return LLAMA_PROMPT_TOKENS
+    from context_packer import CONTEXT_TOKENS
+
+    if str(CONTEXT_TOKENS).lower() in ("", "off", "none"):
+        return UNPACKED_PROMPT_TOKENS
+    # The packer counts with its own tokenizer (or 4 characters a token): leave a quarter more
+    return int(int(CONTEXT_TOKENS) * 1.25) + 512
+
+
+class LlamaCppGenerator:
+    """Continuous micro-batching over one llama.cpp context with a shared prefix cache.
+
+    Each of the ``max_batch`` sequences gets room for ``prompt_tokens`` of prompt
+    and ``max_new_tokens`` of answer. Without ``n_ctx`` the KV cache is sized for
+    that; an ``n_ctx`` too small for it is refused at start-up rather than
+    cutting answers short.
+    """
+
+    def __init__(self, model_path, n_ctx=LLAMA_CTX, n_threads=LLAMA_THREADS, max_batch=MAX_BATCH,
+                 batch_wait_ms=BATCH_WAIT_MS, prefix=None, seed=0, verbose=False,
+                 max_new_tokens=MAX_NEW_TOKENS, prompt_tokens=None):
+        import llama_cpp
+
+        self.lib = llama_cpp
+        # llama.cpp logs every tensor it loads; keep errors only, like Llama(verbose=False)
+        logging.getLogger("llama-cpp-python").setLevel(logging.DEBUG if verbose else logging.ERROR)
+        llama_cpp.llama_backend_init()
+        self.model = llama_cpp.llama_model_load_from_file(model_path.encode("utf-8"), llama_cpp.llama_model_default_params())
+        if not self.model:
+            raise ValueError(f"Could not load GGUF model {model_path}")
+        self.vocab = llama_cpp.llama_model_get_vocab(self.model)
+        self.n_vocab = llama_cpp.llama_vocab_n_tokens(self.vocab)
+        self.prefix_tokens = self.tokenize(prefix) if prefix else []
+        slot = (prompt_tokens or prompt_budget()) + max_new_tokens
+        if not n_ctx:
+            n_ctx = len(self.prefix_tokens) + max_batch * slot
+        elif (n_ctx - len(self.prefix_tokens)) // max_batch < slot:
+            raise ValueError(
+                f"A KV cache of {n_ctx} tokens leaves each of {max_batch} sequences fewer than the "
+                f"{slot} tokens a prompt and answer need; raise PATHOCHAT_LLAMA_CTX to at least "
+                f"{len(self.prefix_tokens) + max_batch * slot} or lower PATHOCHAT_LLM_BATCH"
+            )
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx
+        params.n_batch = params.n_ubatch = PREFILL_CHUNK
+        params.n_seq_max = max_batch + 1
+        params.n_threads = params.n_threads_batch = n_threads
+        # One KV buffer for all sequences, so copies of the prefix share cells
+        params.kv_unified = True
+        self.ctx = llama_cpp.llama_init_from_model(self.model, params)
+        if not self.ctx:
+            raise ValueError(f"Could not create a llama.cpp context of {n_ctx} tokens")
+        self.memory = llama_cpp.llama_get_memory(self.ctx)
+        self.batch = llama_cpp.llama_batch_init(max(PREFILL_CHUNK, max_batch), 0, 1)
+        self.n_ctx = llama_cpp.llama_n_ctx(self.ctx)
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self.rng = np.random.default_rng(seed)
+
+        if self.prefix_tokens:
+            self._prefill(PREFIX_SEQ, self.prefix_tokens, 0, logits=False)
+        # Cells left for each running sequence beyond the shared prefix
+        self.seq_budget = (self.n_ctx - len(self.prefix_tokens)) // max_batch
+        self.free_seqs = list(range(max_batch, 0, -1))
+        self.requests = queue.Queue()
+        # Prefill tokens skipped thanks to the prefix cache, for benchmarks
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+        threading.Thread(target=self._run, name="llama-cpp-batcher", daemon=True).start()
+
+    def tokenize(self, text, add_bos=True):
+        data = text.encode("utf-8")
+        size = len(data) + 2
+        while True:
+            tokens = (self.lib.llama_token * size)()
+            n = self.lib.llama_tokenize(self.vocab, data, len(data), tokens, size, add_bos, False)
+            if n >= 0:
+                return list(tokens[:n])
+            size = -n
+
+    def piece(self, token):
+        buffer = ctypes.create_string_buffer(64)
+        n = self.lib.llama_token_to_piece(self.vocab, token, buffer, len(buffer), 0, False)
+        if n < 0:
+            buffer = ctypes.create_string_buffer(-n)
+            n = self.lib.llama_token_to_piece(self.vocab, token, buffer, len(buffer), 0, False)
+        return buffer.raw[:n]
+
+    def generate(self, prompt, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE, stop=None):
+        """Yield the completion of ``prompt`` piece by piece; stops generating if the caller stops reading."""
+        request = self._request(prompt, max_tokens, temperature, stop)
+        try:
+            while True:
+                item = request.out.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            request.cancelled = True
+
+    async def agenerate(self, prompt, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE, stop=None):
+        """``generate`` for asyncio callers."""
+        request = self._request(prompt, max_tokens, temperature, stop, AsyncOutput(asyncio.get_running_loop()))
+        try:
+            while True:
+                item = await request.out.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            request.cancelled = True
+
+    def _request(self, prompt, max_tokens, temperature, stop, out=None):
+        request = GenerationRequest(self.tokenize(prompt), max_tokens, temperature, stop, out)
+        request.shared = self._shared_prefix(request.tokens)
+        if len(request.tokens) - request.shared >= self.seq_budget:
+            raise ValueError(f"Prompt of {len(request.tokens)} tokens does not fit the {self.seq_budget}-token slot")
+        self.requests.put(request)
+        return request
+
+    def _shared_prefix(self, tokens):
+        n = 0
+        # Keep at least the last prompt token to prefill, for its logits
+        for a, b in zip(self.prefix_tokens, tokens[:-1]):
+            if a != b:
+                break
+            n += 1
+        return n
+
+    def _fill(self, entries):
+        """Put ``(token, pos, seq, logits)`` entries into the batch and decode them."""
+        batch = self.batch
+        for i, (token, pos, seq, logits) in enumerate(entries):
+            batch.token[i] = token
+            batch.pos[i] = pos
+            batch.n_seq_id[i] = 1
+            batch.seq_id[i][0] = seq
+            batch.logits[i] = logits
+        batch.n_tokens = len(entries)
+        status = self.lib.llama_decode(self.ctx, batch)
+        if status != 0:
+            raise RuntimeError(f"llama_decode failed with status {status}")
+
+    def _prefill(self, seq, tokens, start, logits=True):
+        for offset in range(0, len(tokens), PREFILL_CHUNK):
+            chunk = tokens[offset:offset + PREFILL_CHUNK]
+            last = offset + len(chunk) == len(tokens)
+            self._fill([
+                (token, start + offset + i, seq, logits and last and i == len(chunk) - 1)
+                for i, token in enumerate(chunk)
+            ])
+        return len(tokens)
+
+    def _logits(self, i):
+        return np.ctypeslib.as_array(self.lib.llama_get_logits_ith(self.ctx, i), shape=(self.n_vocab,))
+
+    def _sample(self, logits, temperature):
+        if temperature <= 0:
+            return int(np.argmax(logits))
+        top = np.argpartition(logits, -TOP_K)[-TOP_K:] if self.n_vocab > TOP_K else np.arange(self.n_vocab)
+        scaled = logits[top].astype(np.float64) / temperature
+        probs = np.exp(scaled - scaled.max())
+        return int(self.rng.choice(top, p=probs / probs.sum()))
+
+    def _start(self, request):
+        request.seq = self.free_seqs.pop()
+        self.lib.llama_memory_seq_rm(self.memory, request.seq, -1, -1)
+        shared = request.shared
+        if shared:
+            # The template prefix is already in the cache: share its cells
+            self.lib.llama_memory_seq_cp(self.memory, PREFIX_SEQ, request.seq, 0, shared)
+        self._prefill(request.seq, request.tokens[shared:], shared)
+        self.reused_tokens += shared
+        self.prefilled_tokens += len(request.tokens) - shared
+        request.pos = len(request.tokens)
+        self._accept(request, self._sample(self._logits(-1), request.temperature))
+
+    def _accept(self, request, token):
+        """Emit ``token`` for ``request``; returns False once the request is finished."""
+        done = (
+            request.cancelled
+            or self.lib.llama_vocab_is_eog(self.vocab, token)
+            or request.generated >= request.max_tokens
+            or request.pos - request.shared >= self.seq_budget
+        )
+        if not done:
+            text = request.decoder.decode(self.piece(token))
+            request.generated += 1
+            request.last_token = token
+            if request.stop:
+                request.text += text
+                cut = min((request.text.find(stop) for stop in request.stop if stop in request.text), default=-1)
+                if cut >= 0:
+                    text = text[:max(len(text) - (len(request.text) - cut), 0)]
+                    done = True
+            if text:
+                request.out.put(text)
+        if done:
+            self._finish(request)
+        return not done
+
+    def _finish(self, request, error=None):
+        if request.seq is not None:
+            self.lib.llama_memory_seq_rm(self.memory, request.seq, -1, -1)
+            self.free_seqs.append(request.seq)
+            request.seq = None
+        request.out.put(error)
+
+    def _step(self, active):
+        self._fill([(request.last_token, request.pos, request.seq, True) for request in active])
+        running = []
+        for i, request in enumerate(active):
+            request.pos += 1
+            if self._accept(request, self._sample(self._logits(i), request.temperature)):
+                running.append(request)
+        return running
+
+    def _admit(self, active):
+        if active:
+            waiting = []
+            while len(active) + len(waiting) < self.max_batch:
+                try:
+                    waiting.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            return waiting
+        # Idle: wait for a request, then briefly for others to start with it
+        waiting = [self.requests.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(waiting) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                waiting.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return waiting
+
+    def _run(self):
+        active = []
+        while True:
+            for request in self._admit(active):
+                try:
+                    self._start(request)
+                except Exception as e:
+                    self._finish(request, e)
+                    continue
+                if request.seq is not None:
+                    active.append(request)
+            if not active:
+                continue
+            try:
+                active = self._step(active)
+            except Exception as e:
+                for request in active:
+                    self._finish(request, e)
+                active = []
+
+
+class LlamaCppLLM(LLM):
+    """LangChain LLM over a shared ``LlamaCppGenerator``."""
+
+    generator: Any
+    max_new_tokens: int = MAX_NEW_TOKENS
+    temperature: float = TEMPERATURE
+
+    @property
+    def _llm_type(self):
+        return "llamacpp-batched"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for text in self.generator.generate(prompt, self.max_new_tokens, self.temperature, stop):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join([chunk.text async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        pieces = self.generator.agenerate(prompt, self.max_new_tokens, self.temperature, stop)
+        async with aclosing(pieces):
+            async for text in pieces:
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    await run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+
+
+def template_prefix():
+    # Everything before the first per-query field is the same for every prompt
+    from query_engine import PROMPT_TEMPLATE
+
+    return PROMPT_TEMPLATE.split("{context}")[0]
+
+
+@lru_cache(maxsize=None)
+def load_llama_generator(model_path, max_batch=MAX_BATCH):
+    # One model and KV cache per process, shared by every session
+    return LlamaCppGenerator(model_path, max_batch=max_batch, prefix=template_prefix())
+
+
+def open_llm(hf_rep_id=None, backend=BACKEND):
+    """The LLM the engine answers with."""
+    backend = backend.lower()
+    if backend == "hf":
+        from llm_router import open_llm_router
+        from query_engine import HF_REPO_ID, HF_TOKEN, get_hf_endpoint
+
+        # A pool of endpoints when PATHOCHAT_LLM_ENDPOINTS is set, else the one endpoint
+        router = open_llm_router(HF_TOKEN)
+        if router is not None:
+            return router
+        return get_hf_endpoint(hf_rep_id or HF_REPO_ID)
+    if backend == "llamacpp":
+        if not LLAMA_MODEL:
+            raise ValueError("PATHOCHAT_LLM_BACKEND=llamacpp needs PATHOCHAT_LLAMA_MODEL, the path of a GGUF model")
+        return LlamaCppLLM(generator=load_llama_generator(LLAMA_MODEL))
+    raise ValueError(f"Unknown LLM backend {backend!r}, expected hf or llamacpp")
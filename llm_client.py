@@ -0,0 +1,621 @@
+"""Resilient client for the text-generation endpoint behind ``get_hf_endpoint``.
+
+One pooled ``requests.Session`` per endpoint URL is shared by every session of
+the process. Each call has a deadline (``PATHOCHAT_LLM_DEADLINE``) covering all of
+its attempts. Connection errors, timeouts, 429 and 5xx responses are retried
+with full-jitter exponential backoff (or the server's ``Retry-After``) until the
+first token arrives; after that the answer is streaming and is not retried.
+
+With ``PATHOCHAT_LLM_HEDGE=p95`` a second, identical request is sent when the first
+has produced no token within the p95 time to first token of recent calls (or
+after a fixed number of milliseconds), and whichever answers first is used.
+
+A circuit breaker opens after ``PATHOCHAT_LLM_BREAKER_FAILURES`` failed calls in a
+row (calls that only ran into 429s don't count). While it is open calls fail at once with ``CircuitOpenError``; after
+``PATHOCHAT_LLM_BREAKER_RESET`` seconds one trial call is let through. All of
+these raise ``LLMUnavailable``, which the query engine answers with a cached
+answer to a similar question or with the retrieved passages.
+
+``astream`` is the same call for asyncio callers (``ainvoke``, the API server):
+one aiohttp session per event loop, and the same retries, hedging, breaker and
+metrics, without a thread per request.
+"""
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from metrics import LLM_BREAKER, LLM_CALLS, LLM_HEDGES, LLM_RETRIES
+
+# PATHOCHAT_LLM_RESILIENT=off goes back to the plain HuggingFaceEndpoint
+RESILIENT = os.getenv("PATHOCHAT_LLM_RESILIENT", "on")
+HF_INFERENCE_URL = "https://router.huggingface.co/hf-inference/models"
+# Seconds one call may take across all attempts, and to open a connection
+DEADLINE = float(os.getenv("PATHOCHAT_LLM_DEADLINE", "60"))
+CONNECT_TIMEOUT = float(os.getenv("PATHOCHAT_LLM_CONNECT_TIMEOUT", "5"))
+RETRIES = int(os.getenv("PATHOCHAT_LLM_RETRIES", "3"))
+# Base and cap of the jittered exponential backoff, in seconds
+BACKOFF = float(os.getenv("PATHOCHAT_LLM_BACKOFF", "0.5"))
+BACKOFF_CAP = 8.0
+# "off", "p95" or a fixed delay in milliseconds
+HEDGE = os.getenv("PATHOCHAT_LLM_HEDGE", "off")
+# Time-to-first-token samples needed before the p95 is trusted for hedging
+HEDGE_MIN_SAMPLES = 20
+BREAKER_FAILURES = int(os.getenv("PATHOCHAT_LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("PATHOCHAT_LLM_BREAKER_RESET", "30"))
+# Keep-alive connections per endpoint
+POOL_SIZE = int(os.getenv("PATHOCHAT_LLM_POOL", "16"))
+
+RETRYABLE_STATUS = (408, 425, 429, 500, 502, 503, 504)
+
+
+class LLMUnavailable(RuntimeError):
+    """The endpoint could not produce an answer within the call's deadline and retries."""
+
+
+class LLMTimeout(LLMUnavailable):
+    pass
+
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None, status=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+class CircuitBreaker:
+    """closed -> open after ``failures`` failures in a row -> half-open after ``reset_seconds``."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now; in half-open state only one trial call at a time."""
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def available(self):
+        """Whether ``allow`` would let a call through now, without claiming the half-open trial."""
+        with self.lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_seconds
+            return not (self.state == self.HALF_OPEN and self.trial)
+
+    def success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive = 0
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.consecutive += 1
+            self.trial = False
+            if self.state == self.HALF_OPEN or self.consecutive >= self.failures:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def code(self):
+        return {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state]
+
+
+class Attempt:
+    """One request whose first token has arrived; iterate for the rest."""
+
+    def __init__(self, response, first, rest):
+        self.response = response
+        self.first = first
+        self.rest = rest
+
+    def close(self):
+        self.response.close()
+
+
+def _sse_text(line):
+    """Text of one server-sent event line, or None for other lines and special tokens."""
+    if not line.startswith(b"data:"):
+        return None
+    event = json.loads(line[5:])
+    if event.get("error"):
+        raise RetryableError(f"Endpoint error: {event['error']}")
+    token = event.get("token") or {}
+    return None if token.get("special") else token.get("text", "")
+
+
+def _sse_tokens(response):
+    for line in response.iter_lines():
+        text = _sse_text(line)
+        if text is not None:
+            yield text
+
+
+async def _asse_tokens(response):
+    async for line in response.content:
+        text = _sse_text(line.rstrip(b"\r\n"))
+        if text is not None:
+            yield text
+
+
+async def _no_tokens():
+    return
+    yield
+
+
+class ResilientClient:
+    """Pooled, deadline-bound, retrying, optionally hedging text-generation client."""
+
+    def __init__(self, url, token=None, deadline=DEADLINE, retries=RETRIES, backoff=BACKOFF, hedge=HEDGE,
+                 breaker=None, pool_size=POOL_SIZE):
+        # Imported here so importing this module stays cheap at startup
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # The connection failed or broke off, including a truncated chunked body
+        self.transport_errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+        self.url = url
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = str(hedge).lower()
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        # Recent time-to-first-token (streamed) and response (not streamed) samples
+        # of successful attempts, for the hedge delay
+        self.first_token_seconds = {True: deque(maxlen=500), False: deque(maxlen=500)}
+        self.pool_size = pool_size
+        self.token = token
+        # aiohttp sessions belong to one event loop: one per loop that calls astream
+        self.async_sessions = {}
+        self.async_lock = threading.Lock()
+        LLM_BREAKER.set_function(self.breaker.code, endpoint=url)
+
+    def hedge_delay(self, stream=True):
+        """Seconds to wait for a first token before sending a hedged request, or None."""
+        if self.hedge in ("", "off", "none"):
+            return None
+        if self.hedge == "p95":
+            samples = list(self.first_token_seconds[stream])
+            return float(np.percentile(samples, 95)) if len(samples) >= HEDGE_MIN_SAMPLES else None
+        return float(self.hedge) / 1000
+
+    def _open(self, payload, deadline):
+        """Send one request and wait for its first token; raises RetryableError on retryable failures."""
+        started = time.monotonic()
+        remaining = deadline - started
+        if remaining <= 0:
+            raise LLMTimeout("LLM call deadline passed")
+        try:
+            response = self.session.post(
+                self.url, json=payload, stream=payload["stream"], timeout=(min(CONNECT_TIMEOUT, remaining), remaining)
+            )
+        except self.transport_errors as e:
+            raise RetryableError(f"{type(e).__name__}: {e}")
+        if response.status_code in RETRYABLE_STATUS:
+            retry_after = response.headers.get("Retry-After")
+            response.close()
+            raise RetryableError(
+                f"Endpoint returned {response.status_code}",
+                float(retry_after) if retry_after and retry_after.isdigit() else None, response.status_code
+            )
+        if response.status_code >= 400:
+            text = response.text[:200]
+            response.close()
+            raise ValueError(f"Endpoint returned {response.status_code}: {text}")
+        try:
+            if not payload["stream"]:
+                data = response.json()
+                data = data[0] if isinstance(data, list) else data
+                attempt = Attempt(response, data["generated_text"], iter(()))
+            else:
+                tokens = _sse_tokens(response)
+                attempt = Attempt(response, next(tokens, ""), tokens)
+        except (*self.transport_errors, RetryableError) as e:
+            response.close()
+            raise RetryableError(f"{type(e).__name__} before the first token: {e}")
+        self.first_token_seconds[payload["stream"]].append(time.monotonic() - started)
+        return attempt
+
+    def _race(self, payload, deadline, hedge_after):
+        """``_open`` with a hedged duplicate after ``hedge_after`` seconds; the first to answer wins."""
+        results = queue.Queue()
+        lock = threading.Lock()
+        decided = [False]
+
+        def run(name):
+            try:
+                outcome = (name, self._open(payload, deadline), None)
+            except Exception as e:
+                outcome = (name, None, e)
+            with lock:
+                if not decided[0]:
+                    results.put(outcome)
+                    return
+            # The race is over: close the loser's stream
+            if outcome[1] is not None:
+                outcome[1].close()
+
+        def decide():
+            with lock:
+                decided[0] = True
+                while not results.empty():
+                    _, attempt, _ = results.get_nowait()
+                    if attempt is not None:
+                        attempt.close()
+
+        threading.Thread(target=run, args=("primary",), daemon=True).start()
+        launched, pending, error = 1, 1, None
+        started = time.monotonic()
+        while pending:
+            timeout = deadline - time.monotonic()
+            if launched == 1:
+                timeout = min(timeout, started + hedge_after - time.monotonic())
+            try:
+                name, attempt, e = results.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                if launched == 1 and time.monotonic() < deadline:
+                    threading.Thread(target=run, args=("hedge",), daemon=True).start()
+                    launched, pending = 2, pending + 1
+                    continue
+                decide()
+                raise LLMTimeout("No first token before the LLM call deadline")
+            pending -= 1
+            if e is None:
+                decide()
+                if launched == 2:
+                    LLM_HEDGES.inc(winner=name)
+                return attempt
+            error = e
+        decide()
+        raise error
+
+    def _payload(self, prompt, max_new_tokens, temperature, stop, stream):
+        return {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_new_tokens, "temperature": temperature, "do_sample": False,
+                "return_full_text": False, "stop": stop or [],
+            },
+            "stream": stream,
+        }
+
+    def _admit(self, number):
+        """Raise ``CircuitOpenError`` unless attempt ``number`` of a call may go out."""
+        if not number:
+            if not self.breaker.allow():
+                LLM_CALLS.inc(outcome="circuit_open")
+                raise CircuitOpenError("LLM endpoint circuit is open after repeated failures")
+            return
+        if self.breaker.state == CircuitBreaker.OPEN:
+            # Other calls gave up on the endpoint meanwhile
+            LLM_CALLS.inc(outcome="circuit_open")
+            raise CircuitOpenError("LLM endpoint circuit opened while retrying")
+        LLM_RETRIES.inc()
+
+    def _retry_delay(self, error, number, deadline):
+        """Seconds to back off before the next attempt; raises ``LLMUnavailable`` when out of attempts or time."""
+        # Full jitter, or what the server asked for, within the deadline
+        delay = error.retry_after or random.uniform(0, min(BACKOFF_CAP, self.backoff * 2 ** number))
+        if number == self.retries or time.monotonic() + delay >= deadline:
+            # Rate limited means busy, not broken: no strike against the endpoint
+            if error.status != 429:
+                self.breaker.failure()
+            LLM_CALLS.inc(outcome="rate_limited" if error.status == 429 else "failed")
+            raise LLMUnavailable(f"LLM endpoint failed after {number + 1} attempts: {error}")
+        return delay
+
+    def _failed(self, outcome):
+        self.breaker.failure()
+        LLM_CALLS.inc(outcome=outcome)
+
+    def _rejected(self):
+        # A 4xx says nothing about the endpoint's health
+        self.breaker.success()
+        LLM_CALLS.inc(outcome="rejected")
+
+    def stream(self, prompt, max_new_tokens=1024, temperature=0.5, stop=None, stream=True):
+        """Yield the completion of ``prompt``; raises ``LLMUnavailable`` if no first token arrives in time."""
+        payload = self._payload(prompt, max_new_tokens, temperature, stop, stream)
+        deadline = time.monotonic() + self.deadline
+        attempt = None
+        for number in range(self.retries + 1):
+            self._admit(number)
+            try:
+                hedge_after = self.hedge_delay(stream)
+                if hedge_after is None:
+                    attempt = self._open(payload, deadline)
+                else:
+                    attempt = self._race(payload, deadline, hedge_after)
+                break
+            except RetryableError as e:
+                time.sleep(self._retry_delay(e, number, deadline))
+            except LLMTimeout:
+                self._failed("timeout")
+                raise
+            except ValueError:
+                self._rejected()
+                raise
+
+        # The call counts for the breaker once the answer is complete, so an
+        # endpoint that keeps breaking off mid-answer opens it
+        try:
+            yield attempt.first
+            for text in attempt.rest:
+                if time.monotonic() > deadline:
+                    self._failed("timeout")
+                    raise LLMTimeout("LLM call deadline passed mid-answer")
+                yield text
+        except GeneratorExit:
+            # The caller stopped reading; the endpoint was answering
+            self.breaker.success()
+            raise
+        except LLMTimeout:
+            raise
+        except (*self.transport_errors, RetryableError) as e:
+            self._failed("failed")
+            raise LLMUnavailable(f"LLM stream broke off: {e}")
+        except Exception:
+            self._failed("failed")
+            raise
+        else:
+            self.breaker.success()
+            LLM_CALLS.inc(outcome="ok")
+        finally:
+            attempt.close()
+
+    def _async_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        with self.async_lock:
+            session = self.async_sessions.get(loop)
+            if session is None or session.closed:
+                # Forget sessions of loops that have ended
+                for other in [other for other in self.async_sessions if other.is_closed()]:
+                    del self.async_sessions[other]
+                headers = {"Authorization": f"Bearer {self.token}"} if self.token else None
+                # No connection cap: the caller bounds concurrency, as requests' non-blocking pool does
+                connector = aiohttp.TCPConnector(limit=0, limit_per_host=0)
+                session = self.async_sessions[loop] = aiohttp.ClientSession(connector=connector, headers=headers)
+            return session
+
+    async def aclose(self):
+        """Close this event loop's aiohttp session."""
+        with self.async_lock:
+            session = self.async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    async def _aopen(self, payload, deadline):
+        """``_open`` for asyncio callers."""
+        import aiohttp
+
+        started = time.monotonic()
+        remaining = deadline - started
+        if remaining <= 0:
+            raise LLMTimeout("LLM call deadline passed")
+        timeout = aiohttp.ClientTimeout(connect=min(CONNECT_TIMEOUT, remaining), sock_read=remaining)
+        try:
+            response = await self._async_session().post(self.url, json=payload, timeout=timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise RetryableError(f"{type(e).__name__}: {e}")
+        try:
+            if response.status in RETRYABLE_STATUS:
+                retry_after = response.headers.get("Retry-After")
+                raise RetryableError(
+                    f"Endpoint returned {response.status}",
+                    float(retry_after) if retry_after and retry_after.isdigit() else None, response.status
+                )
+            if response.status >= 400:
+                text = (await response.text())[:200]
+                raise ValueError(f"Endpoint returned {response.status}: {text}")
+            try:
+                if not payload["stream"]:
+                    data = await response.json(content_type=None)
+                    data = data[0] if isinstance(data, list) else data
+                    attempt = Attempt(response, data["generated_text"], _no_tokens())
+                else:
+                    tokens = _asse_tokens(response)
+                    attempt = Attempt(response, await anext(tokens, ""), tokens)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RetryableError) as e:
+                raise RetryableError(f"{type(e).__name__} before the first token: {e}")
+        except BaseException:
+            # Including cancellation of a hedged attempt that lost the race
+            response.close()
+            raise
+        self.first_token_seconds[payload["stream"]].append(time.monotonic() - started)
+        return attempt
+
+    async def _arace(self, payload, deadline, hedge_after):
+        """``_race`` for asyncio callers: the loser is cancelled or closed."""
+        tasks = {asyncio.ensure_future(self._aopen(payload, deadline)): "primary"}
+        winner, error = None, None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(min(hedge_after, deadline - time.monotonic()), 0))
+            if not done and time.monotonic() < deadline:
+                tasks[asyncio.ensure_future(self._aopen(payload, deadline))] = "hedge"
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(deadline - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise LLMTimeout("No first token before the LLM call deadline")
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                if winner is not None:
+                    if len(tasks) == 2:
+                        LLM_HEDGES.inc(winner=tasks[winner])
+                    return winner.result()
+            raise error
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    task.result().close()
+
+    async def astream(self, prompt, max_new_tokens=1024, temperature=0.5, stop=None, stream=True):
+        """``stream`` for asyncio callers: an async iterator over the completion of ``prompt``."""
+        import aiohttp
+
+        payload = self._payload(prompt, max_new_tokens, temperature, stop, stream)
+        deadline = time.monotonic() + self.deadline
+        attempt = None
+        for number in range(self.retries + 1):
+            self._admit(number)
+            try:
+                hedge_after = self.hedge_delay(stream)
+                if hedge_after is None:
+                    attempt = await self._aopen(payload, deadline)
+                else:
+                    attempt = await self._arace(payload, deadline, hedge_after)
+                break
+            except RetryableError as e:
+                await asyncio.sleep(self._retry_delay(e, number, deadline))
+            except LLMTimeout:
+                self._failed("timeout")
+                raise
+            except ValueError:
+                self._rejected()
+                raise
+
+        try:
+            yield attempt.first
+            async for text in attempt.rest:
+                if time.monotonic() > deadline:
+                    self._failed("timeout")
+                    raise LLMTimeout("LLM call deadline passed mid-answer")
+                yield text
+        except (GeneratorExit, asyncio.CancelledError):
+            self.breaker.success()
+            raise
+        except LLMTimeout:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableError) as e:
+            self._failed("failed")
+            raise LLMUnavailable(f"LLM stream broke off: {e}")
+        except Exception:
+            self._failed("failed")
+            raise
+        else:
+            self.breaker.success()
+            LLM_CALLS.inc(outcome="ok")
+        finally:
+            attempt.close()
+
+
+def __getattr__(name):
+    # ResilientEndpoint is defined on first use: langchain_core.language_models is
+    # slow to import, and query_engine imports this module for LLMUnavailable
+    if name == "ResilientEndpoint":
+        global ResilientEndpoint
+        ResilientEndpoint = _resilient_endpoint_class()
+        return ResilientEndpoint
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _resilient_endpoint_class():
+    from contextlib import aclosing
+
+    from langchain_core.language_models.llms import LLM
+    from langchain_core.outputs import GenerationChunk
+
+    class ResilientEndpoint(LLM):
+        """LangChain LLM over a shared ``ResilientClient``; drop-in for HuggingFaceEndpoint."""
+
+        client: Any
+        max_new_tokens: int = 1024
+        temperature: float = 0.5
+
+        @property
+        def _llm_type(self):
+            return "resilient-text-generation"
+
+        def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+            text = "".join(self.client.stream(prompt, self.max_new_tokens, self.temperature, stop, stream=False))
+            return _strip_stop(text, stop)
+
+        async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+            # Native async: concurrent ainvoke calls do not each hold a thread
+            tokens = self.client.astream(prompt, self.max_new_tokens, self.temperature, stop, stream=False)
+            return _strip_stop("".join([text async for text in tokens]), stop)
+
+        def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+            for text in self.client.stream(prompt, self.max_new_tokens, self.temperature, stop):
+                if any(stop_sequence in text for stop_sequence in stop or []):
+                    break
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+
+        async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+            async with aclosing(self.client.astream(prompt, self.max_new_tokens, self.temperature, stop)) as tokens:
+                async for text in tokens:
+                    if any(stop_sequence in text for stop_sequence in stop or []):
+                        break
+                    chunk = GenerationChunk(text=text)
+                    if run_manager:
+                        await run_manager.on_llm_new_token(text, chunk=chunk)
+                    yield chunk
+
+    return ResilientEndpoint
+
+
+def _strip_stop(text, stop):
+    for stop_sequence in stop or []:
+        if text.endswith(stop_sequence):
+            text = text[:-len(stop_sequence)]
+    return text
+
+
+@lru_cache(maxsize=None)
+def get_client(url, token=None):
+    # One connection pool and circuit breaker per endpoint, shared by all sessions
+    return ResilientClient(url, token)
+
+
+def open_resilient_endpoint(url, token=None, max_new_tokens=1024, temperature=0.5):
+    # PATHOCHAT_LLM_RESILIENT=off: the caller builds a plain HuggingFaceEndpoint
+    if RESILIENT.lower() in ("", "off", "none"):
+        return None
+    endpoint_class = __getattr__("ResilientEndpoint")
+    return endpoint_class(client=get_client(url, token), max_new_tokens=max_new_tokens, temperature=temperature)
@@ -1,39 +1,195 @@
+import argparse
+import os
+import numpy as np
 from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from sentence_transformers import SentenceTransformer
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from pdf_ingest import IngestStats, PAGES_PER_TASK, batched, list_pdf_files, stream_chunks, stream_pages
+from embedding_cache import embed_documents_array, get_cached_embeddings
+from embedding_engine import BATCH_SIZE, EmbeddingEngine, EngineEmbeddings
+from index_manifest import ChunkIdAssigner, diff_files, empty_manifest, load_manifest, load_vectors, save_atomic
+from index_spec import DEFAULT_PARAMS, FLAT, LOSSY_TYPES, build_index, load_spec, parse_spec, supports_incremental
+from chunker import StructureChunker
 # data loading
 DATA_PATH="data/"
 def load_pdf_files(data):
     loader = DirectoryLoader(data,
                             glob='*.pdf',
                             loader_cls=PyPDFLoader)
-    
+
     documents=loader.load()
     return documents
 
-documents=load_pdf_files(data=DATA_PATH)
 #print("Length of PDF pages: ", len(documents))
 
 # text splitting
+CHUNKERS = ("recursive", "structure")
+def get_text_splitter(chunker="recursive"):
+    if chunker == "structure":
+        # Paragraph/heading-aligned chunks with chapter and section metadata
+        return StructureChunker()
+    return RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=200)
+
 def split_text(documents):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=200)
+    text_splitter = get_text_splitter()
     text_chunks = text_splitter.split_documents(documents)
     return text_chunks
-text_chunks = split_text(documents=documents)
-#print("Length of text chunks: ", len(text_chunks)) 
+#print("Length of text chunks: ", len(text_chunks))
 
 # embedding
-def embed_text():
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+def embed_text(engine, dim=None):
+    # Cache misses go to the multi-process engine; unchanged chunks come from disk
+    embeddings = get_cached_embeddings(EMBEDDING_MODEL, embeddings=EngineEmbeddings(engine), dim=dim)
     return embeddings
 
-embeddings = embed_text()
-
 # vector store
 vec_Path = "vector_store/faiss_database"
-db = FAISS.from_documents(text_chunks, embeddings)
-# Save the vector store
-db.save_local(vec_Path)
 
+def build_legacy(stats, embeddings):
+    # Original path: every page of every PDF in memory before splitting
+    documents = load_pdf_files(data=DATA_PATH)
+    stats.pages = len(documents)
+    text_chunks = split_text(documents=documents)
+    stats.chunks = len(text_chunks)
+    return FAISS.from_documents(text_chunks, embeddings)
+
+def load_existing(embeddings, full, chunker="recursive"):
+    # Start from the saved index only if it was built with the same model and chunker
+    manifest = None if full else load_manifest(vec_Path)
+    if manifest is None or manifest["embedding_model"] != EMBEDDING_MODEL or manifest.get("chunker", "recursive") != chunker:
+        manifest = empty_manifest(EMBEDDING_MODEL)
+        manifest["chunker"] = chunker
+        return None, manifest
+    db = FAISS.load_local(vec_Path, embeddings, allow_dangerous_deserialization=True)
+    return db, manifest
+
+def build_store(ids, docs, vectors, embeddings, spec):
+    index = build_index(spec, vectors)
+    docstore = InMemoryDocstore(dict(zip(ids, docs)))
+    return FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+
+def build_incremental(stats, embedder, spec, workers, pages_per_task, full=False, batch_size=2048, chunker="recursive"):
+    # Only new or changed PDFs are extracted, and only their new chunks embedded.
+    # ``embedder`` is an EmbeddingEngine, put behind the embedding cache, or any
+    # LangChain Embeddings used as is (the benchmarks' fake or cached ones)
+    engine = embedder if isinstance(embedder, EmbeddingEngine) else None
+    db, manifest = load_existing(EngineEmbeddings(engine) if engine else embedder, full, chunker)
+    # Flat/SQ8 indexes are patched in place; other types, a fresh build or a
+    # changed spec rebuild the index, with unchanged vectors taken from the old one
+    in_place = db is not None and supports_incremental(spec) and manifest.get("index") == spec
+    changed, removed, hashes = diff_files(manifest, list_pdf_files(DATA_PATH), DATA_PATH)
+    if not changed and not removed and manifest.get("index") == spec:
+        print("Vector store is up to date.")
+        return
+    # The saved index knows the vector size, so the engine starts only on a cache miss
+    embeddings = embed_text(engine, dim=db.index.d if db is not None else None) if engine else embedder
+
+    files = manifest["files"]
+    stale = set()
+    for rel in removed:
+        stale.update(files.pop(rel)["chunks"])
+    previous = set()
+    for path in changed:
+        rel = os.path.relpath(path, DATA_PATH)
+        if rel in files:
+            previous.update(files[rel]["chunks"])
+        files[rel] = {"sha256": hashes[rel], "chunks": []}
+    stale |= previous
+
+    assign = ChunkIdAssigner(DATA_PATH)
+    pages = stream_pages(DATA_PATH, workers=workers, pages_per_task=pages_per_task, stats=stats, pdf_files=changed)
+
+    def new_chunks():
+        for chunk in stream_chunks(pages, get_text_splitter(chunker), stats=stats):
+            rel, cid = assign(chunk)
+            files[rel]["chunks"].append(cid)
+            if cid in previous:
+                stale.discard(cid)
+            else:
+                yield cid, chunk
+
+    # Vectors of the saved index in row order, so kept chunks are never embedded again
+    old_ids, old_vectors = [], None
+    if db is not None and (not in_place or spec["type"] in LOSSY_TYPES):
+        old_spec = manifest.get("index") or load_spec(vec_Path)
+        old_ids = [cid for _, cid in sorted(db.index_to_docstore_id.items())]
+        old_vectors = load_vectors(vec_Path, db.index, old_spec)
+
+    # Embed chunk batches as they arrive instead of all at once
+    new_ids, new_docs, new_vectors = [], [], []
+    for batch in batched(new_chunks(), batch_size):
+        ids = [cid for cid, _ in batch]
+        docs = [chunk for _, chunk in batch]
+        vectors = embed_documents_array(embeddings, [doc.page_content for doc in docs])
+        if in_place:
+            db.add_embeddings(zip([doc.page_content for doc in docs], vectors), [doc.metadata for doc in docs], ids=ids)
+        else:
+            new_docs.extend(docs)
+        new_ids.extend(ids)
+        new_vectors.append(vectors)
+        stats.embedded += len(batch)
+
+    stats.removed = len(stale)
+    vectors = None
+    if in_place:
+        if stale:
+            db.delete(list(stale))
+        if old_vectors is not None:
+            # Same row order as the patched index: survivors, then the new chunks
+            rows = {cid: row for row, cid in enumerate(old_ids + new_ids)}
+            combined = np.concatenate([old_vectors] + new_vectors)
+            vectors = combined[[rows[cid] for _, cid in sorted(db.index_to_docstore_id.items())]]
+    else:
+        kept_rows = [row for row, cid in enumerate(old_ids) if cid not in stale]
+        kept_ids = [old_ids[row] for row in kept_rows]
+        kept_docs = [db.docstore.search(cid) for cid in kept_ids]
+        if old_vectors is not None:
+            kept_vectors = [np.asarray(old_vectors[kept_rows])]
+        else:
+            # A lossy index saved without its vectors file: embed again, through the cache
+            if kept_docs:
+                print(f"No stored vectors for the {old_spec['type']} index, re-embedding {len(kept_docs)} kept chunks")
+            kept_vectors = [
+                embed_documents_array(embeddings, [doc.page_content for doc in batch])
+                for batch in batched(kept_docs, batch_size)
+            ]
+        if not kept_ids and not new_ids:
+            raise SystemExit(f"No PDF pages found in {DATA_PATH}")
+        vectors = np.concatenate(kept_vectors + new_vectors)
+        db = build_store(kept_ids + new_ids, kept_docs + new_docs, vectors, embeddings, spec)
+    manifest["index"] = spec
+    # Only indexes that cannot give their vectors back need the extra file
+    save_atomic(db, manifest, vec_Path, spec=spec, vectors=vectors if spec["type"] in LOSSY_TYPES else None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FAISS vector store from data/")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    parser.add_argument("--legacy", action="store_true", help="use the single-process DirectoryLoader path")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-embed everything")
+    parser.add_argument("--embed-workers", type=int, default=None, help="embedding processes (default: half the CPUs)")
+    parser.add_argument("--embed-batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--index", type=parse_spec, default="Flat",
+                        help=f"index type ({', '.join(DEFAULT_PARAMS)}), e.g. 'IVF-PQ:nlist=512,m=48' or 'HNSW:M=32'")
+    parser.add_argument("--chunker", choices=CHUNKERS, default="recursive",
+                        help="'structure' splits on headings and paragraphs; changing it rebuilds the store")
+    args = parser.parse_args()
+
+    stats = IngestStats()
+    if args.legacy:
+        # The baseline to compare against: one in-process model, no engine and no cache
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        db = build_legacy(stats, HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL))
+        # Save the vector store; no manifest, so the next incremental run starts fresh
+        save_atomic(db, None, vec_Path, spec=FLAT)
+    else:
+        with EmbeddingEngine(EMBEDDING_MODEL, workers=args.embed_workers, batch_size=args.embed_batch_size) as engine:
+            build_incremental(stats, engine, args.index, args.workers, args.pages_per_task, full=args.full,
+                              chunker=args.chunker)
+    print(stats.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Spread generation over a pool of text-generation endpoints.
+
+``PATHOCHAT_LLM_ENDPOINTS`` lists the pool, comma-separated: endpoint URLs, or
+model repo ids served by the Hugging Face inference API, each with an optional
+``*weight``:
+
+    PATHOCHAT_LLM_ENDPOINTS="http://tgi-a:8080*2,http://tgi-b:8080,mistralai/Mistral-7B-Instruct-v0.3"
+    PATHOCHAT_LLM_FALLBACK_ENDPOINTS="microsoft/Phi-3-mini-4k-instruct"
+
+Each call goes to the endpoint with the fewest requests in flight per unit of
+weight, ties broken by lower recent time to first token
+(``PATHOCHAT_LLM_ROUTING=least_outstanding``, the default), or in smooth weighted
+round-robin order (``weighted``). Endpoints whose circuit breaker is open are
+skipped, and a call that fails on one endpoint before its first token moves on to
+the next. Each endpoint takes at most ``PATHOCHAT_LLM_ENDPOINT_CONCURRENCY``
+requests per unit of weight at once (its rate limit, say); further calls queue.
+When ``PATHOCHAT_LLM_FALLBACK_QUEUE`` calls are already queued, or no primary
+endpoint is healthy, calls go to the fallback endpoints instead, typically a
+smaller, faster model.
+
+``astream`` routes the same way for asyncio callers; a queued coroutine waits
+for room without holding a thread.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from llm_client import DEADLINE, HF_INFERENCE_URL, LLMTimeout, LLMUnavailable, ResilientClient
+from metrics import LLM_OUTSTANDING, LLM_ROUTED, LLM_TTFT
+
+ENDPOINTS = os.getenv("PATHOCHAT_LLM_ENDPOINTS", "")
+FALLBACK_ENDPOINTS = os.getenv("PATHOCHAT_LLM_FALLBACK_ENDPOINTS", "")
+ROUTING = os.getenv("PATHOCHAT_LLM_ROUTING", "least_outstanding")
+# Requests in flight per endpoint and unit of weight; 0 for no limit
+ENDPOINT_CONCURRENCY = int(os.getenv("PATHOCHAT_LLM_ENDPOINT_CONCURRENCY", "8"))
+# Calls waiting for a primary endpoint before further calls overflow to the fallbacks
+FALLBACK_QUEUE = int(os.getenv("PATHOCHAT_LLM_FALLBACK_QUEUE", "4"))
+# Retries on one endpoint before the router tries another
+ENDPOINT_RETRIES = int(os.getenv("PATHOCHAT_LLM_ENDPOINT_RETRIES", "1"))
+# Weight of the newest sample in the time-to-first-token moving average
+TTFT_SMOOTHING = 0.2
+
+
+def parse_endpoints(spec):
+    """``[(url, weight)]`` from a comma-separated list of URLs or repo ids with optional ``*weight``."""
+    endpoints = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        target, _, weight = entry.partition("*")
+        url = target if target.startswith(("http://", "https://")) else f"{HF_INFERENCE_URL}/{target}"
+        endpoints.append((url, float(weight or 1)))
+    return endpoints
+
+
+class Endpoint:
+    """One member of the pool with its client, load and latency."""
+
+    def __init__(self, client, weight=1.0, tier="primary", concurrency=ENDPOINT_CONCURRENCY):
+        self.client = client
+        self.name = client.url
+        self.weight = weight
+        self.tier = tier
+        self.capacity = max(round(concurrency * weight), 1) if concurrency else None
+        self.outstanding = 0
+        self.calls = 0
+        self.failures = 0
+        # Moving average of time to first token, seconds; None until the first call
+        self.ttft = None
+        # Smooth weighted round-robin position
+        self.current = 0.0
+        LLM_OUTSTANDING.set_function(lambda: self.outstanding, endpoint=self.name)
+        LLM_TTFT.set_function(lambda: self.ttft or 0.0, endpoint=self.name)
+
+    def healthy(self):
+        return self.client.breaker.available()
+
+    def free(self):
+        return self.capacity is None or self.outstanding < self.capacity
+
+    def load(self):
+        return self.outstanding / self.weight
+
+    def stats(self):
+        return {
+            "endpoint": self.name, "tier": self.tier, "weight": self.weight, "state": self.client.breaker.state,
+            "outstanding": self.outstanding, "calls": self.calls, "failures": self.failures,
+            "ttft_ms": None if self.ttft is None else self.ttft * 1000,
+        }
+
+
+class LLMRouter:
+    """Same ``stream`` and ``astream`` as ``ResilientClient``, over a pool of them."""
+
+    def __init__(self, endpoints, fallbacks=(), routing=ROUTING, fallback_queue=FALLBACK_QUEUE, queue_timeout=DEADLINE):
+        if not endpoints:
+            raise ValueError("An LLM router needs at least one endpoint")
+        if routing not in ("least_outstanding", "weighted"):
+            raise ValueError(f"Unknown routing {routing!r}, expected least_outstanding or weighted")
+        self.endpoints = list(endpoints)
+        self.fallbacks = list(fallbacks)
+        self.routing = routing
+        self.fallback_queue = fallback_queue
+        self.queue_timeout = queue_timeout
+        # Calls waiting for an endpoint with room
+        self.waiting = 0
+        self.lock = threading.Lock()
+        self.freed = threading.Condition(self.lock)
+        # (loop, future) of coroutines waiting for an endpoint with room
+        self.async_waiters = []
+
+    def _weighted(self, candidates):
+        # nginx's smooth weighted round-robin: even spread, proportional to weight
+        total = sum(endpoint.weight for endpoint in candidates)
+        for endpoint in candidates:
+            endpoint.current += endpoint.weight
+        chosen = max(candidates, key=lambda endpoint: endpoint.current)
+        chosen.current -= total
+        return chosen
+
+    def _least_outstanding(self, candidates):
+        return min(candidates, key=lambda endpoint: (endpoint.load(), endpoint.ttft or 0.0))
+
+    def _choose(self, exclude):
+        primaries = [e for e in self.endpoints if e not in exclude and e.healthy()]
+        fallbacks = [e for e in self.fallbacks if e not in exclude and e.healthy()]
+        # Deep queue or no healthy primary: overflow to the smaller model
+        if fallbacks and (not primaries or self.waiting >= self.fallback_queue):
+            candidates = fallbacks
+        else:
+            candidates = primaries
+        if not candidates:
+            return None, False
+        candidates = [e for e in candidates if e.free()]
+        if not candidates:
+            return None, True
+        if self.routing == "weighted":
+            return self._weighted(candidates), False
+        return self._least_outstanding(candidates), False
+
+    def pick(self, exclude=()):
+        """Reserve the endpoint for the next call, waiting for room if all are busy.
+
+        None when every endpoint was tried or is down.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        with self.lock:
+            while True:
+                endpoint, busy = self._choose(exclude)
+                if not busy:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeout("Every LLM endpoint stayed busy until the deadline")
+                self.waiting += 1
+                try:
+                    self.freed.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            if endpoint is None:
+                return None
+            self._reserve(endpoint)
+        LLM_ROUTED.inc(endpoint=endpoint.name, tier=endpoint.tier)
+        return endpoint
+
+    async def apick(self, exclude=()):
+        """``pick`` for asyncio callers."""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            with self.lock:
+                endpoint, busy = self._choose(exclude)
+                if not busy:
+                    if endpoint is None:
+                        return None
+                    self._reserve(endpoint)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeout("Every LLM endpoint stayed busy until the deadline")
+                freed = loop.create_future()
+                self.async_waiters.append((loop, freed))
+                self.waiting += 1
+            try:
+                await asyncio.wait_for(freed, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+                    if (loop, freed) in self.async_waiters:
+                        self.async_waiters.remove((loop, freed))
+        LLM_ROUTED.inc(endpoint=endpoint.name, tier=endpoint.tier)
+        return endpoint
+
+    def _reserve(self, endpoint):
+        # Caller holds the lock
+        endpoint.outstanding += 1
+        endpoint.calls += 1
+
+    def _release(self, endpoint, failed=False):
+        with self.lock:
+            endpoint.outstanding -= 1
+            if failed:
+                endpoint.failures += 1
+            self.freed.notify_all()
+            for loop, freed in self.async_waiters:
+                try:
+                    loop.call_soon_threadsafe(lambda freed=freed: freed.done() or freed.set_result(None))
+                except RuntimeError:
+                    # That event loop is closed
+                    pass
+            self.async_waiters.clear()
+
+    def _record_ttft(self, endpoint, ttft):
+        with self.lock:
+            endpoint.ttft = ttft if endpoint.ttft is None else (
+                TTFT_SMOOTHING * ttft + (1 - TTFT_SMOOTHING) * endpoint.ttft
+            )
+
+    def stream(self, prompt, max_new_tokens=1024, temperature=0.5, stop=None, stream=True):
+        tried, error = [], None
+        while True:
+            endpoint = self.pick(tried)
+            if endpoint is None:
+                raise error or LLMUnavailable("No healthy LLM endpoint")
+            started = time.monotonic()
+            tokens = endpoint.client.stream(prompt, max_new_tokens, temperature, stop, stream)
+            try:
+                first = next(tokens, None)
+            except LLMUnavailable as e:
+                # Nothing was sent to the caller yet: try another endpoint
+                self._release(endpoint, failed=True)
+                tried.append(endpoint)
+                error = e
+                continue
+            except Exception:
+                self._release(endpoint, failed=True)
+                raise
+            self._record_ttft(endpoint, time.monotonic() - started)
+            try:
+                if first is not None:
+                    yield first
+                yield from tokens
+            except GeneratorExit:
+                # The caller stopped reading
+                tokens.close()
+                self._release(endpoint)
+                raise
+            except Exception:
+                self._release(endpoint, failed=True)
+                raise
+            self._release(endpoint)
+            return
+
+    async def astream(self, prompt, max_new_tokens=1024, temperature=0.5, stop=None, stream=True):
+        """``stream`` for asyncio callers."""
+        tried, error = [], None
+        while True:
+            endpoint = await self.apick(tried)
+            if endpoint is None:
+                raise error or LLMUnavailable("No healthy LLM endpoint")
+            started = time.monotonic()
+            tokens = endpoint.client.astream(prompt, max_new_tokens, temperature, stop, stream)
+            try:
+                first = await anext(tokens, None)
+            except LLMUnavailable as e:
+                # Nothing was sent to the caller yet: try another endpoint
+                self._release(endpoint, failed=True)
+                tried.append(endpoint)
+                error = e
+                continue
+            except asyncio.CancelledError:
+                await tokens.aclose()
+                self._release(endpoint)
+                raise
+            except Exception:
+                self._release(endpoint, failed=True)
+                raise
+            self._record_ttft(endpoint, time.monotonic() - started)
+            try:
+                if first is not None:
+                    yield first
+                async for text in tokens:
+                    yield text
+            except (GeneratorExit, asyncio.CancelledError):
+                # The caller stopped reading
+                await tokens.aclose()
+                self._release(endpoint)
+                raise
+            except Exception:
+                self._release(endpoint, failed=True)
+                raise
+            self._release(endpoint)
+            return
+
+    async def aclose(self):
+        """Close this event loop's aiohttp sessions, one per endpoint."""
+        for endpoint in self.endpoints + self.fallbacks:
+            await endpoint.client.aclose()
+
+    def stats(self):
+        with self.lock:
+            return [endpoint.stats() for endpoint in self.endpoints + self.fallbacks]
+
+
+def build_router(endpoints, fallbacks=(), token=None, routing=ROUTING, fallback_queue=FALLBACK_QUEUE,
+                 concurrency=ENDPOINT_CONCURRENCY, retries=ENDPOINT_RETRIES):
+    """Router over ``[(url, weight)]`` endpoints and fallbacks, one resilient client each."""
+    def endpoint(url, weight, tier):
+        return Endpoint(ResilientClient(url, token, retries=retries), weight, tier, concurrency)
+
+    return LLMRouter(
+        [endpoint(url, weight, "primary") for url, weight in endpoints],
+        [endpoint(url, weight, "fallback") for url, weight in fallbacks],
+        routing, fallback_queue
+    )
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def open_llm_router(token=None, max_new_tokens=1024, temperature=0.5):
+    # PATHOCHAT_LLM_ENDPOINTS unset: one endpoint, no router
+    global _router
+    if not ENDPOINTS.strip():
+        return None
+    from llm_client import ResilientEndpoint
+
+    with _router_lock:
+        if _router is None:
+            # One pool per process, shared by every session
+            _router = build_router(parse_endpoints(ENDPOINTS), parse_endpoints(FALLBACK_ENDPOINTS), token)
+    return ResilientEndpoint(client=_router, max_new_tokens=max_new_tokens, temperature=temperature)
@@ -0,0 +1,267 @@
+"""Counters and gauges of the chat service, exposed in Prometheus text format.
+
+Counters are a dict increment under a lock. Gauges that describe loaded
+state (FAISS vectors, index bytes, process memory) are callbacks evaluated only
+when ``/metrics`` is scraped, so nothing is computed for nobody.
+
+``PATHOCHAT_METRICS_PORT`` starts a sidecar HTTP server that serves these metrics
+and the stage histograms of tracing.py on ``/metrics``. ``PATHOCHAT_TRACE=prometheus``
+starts the same server on ``PATHOCHAT_TRACE_PORT``, and the API server has its
+own ``GET /metrics``.
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sidecar port for /metrics; unset or "off" leaves it closed
+METRICS_PORT = os.getenv("PATHOCHAT_METRICS_PORT", "off")
+# Errors set on a query's trace that are their own branch; anything else is an exception
+ERROR_BRANCHES = ("db_unavailable", "llm_unavailable")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """Samples keyed by label values; ``kind`` is the Prometheus type."""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.functions = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+            functions = dict(self.functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                # A gauge whose source went away is left out of the scrape
+                values.pop(key, None)
+        return sorted(values.items())
+
+    def text(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            labels = ",".join(f'{label}="{_escape(part)}"' for label, part in zip(self.labels, key))
+            value = value if isinstance(value, int) else f"{value:.6g}"
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, fn, **labels):
+        """Read the value from ``fn()`` at scrape time."""
+        key = self._key(labels)
+        with self.lock:
+            self.functions[key] = fn
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labels):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, labels)
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._get(Gauge, name, documentation, labels)
+
+    def text(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.text())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+QUERIES = REGISTRY.counter(
+    "pathochat_queries_total", "Queries submitted, by mode (local or api) and outcome (ok or error).", ("mode", "outcome")
+)
+ERRORS = REGISTRY.counter(
+    "pathochat_query_errors_total", "Failed queries by branch (db_unavailable, llm_unavailable, exception).",
+    ("branch", "type")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "pathochat_llm_tokens_total", "Tokens sent to (in) and generated by (out) the LLM.", ("direction",)
+)
+CACHE_RESOURCE = REGISTRY.counter(
+    "pathochat_cache_resource_total", "st.cache_resource calls by function and result (hit or miss).",
+    ("function", "result")
+)
+LOADS = REGISTRY.counter(
+    "pathochat_resource_loads_total", "Loads of the vector store and LLM endpoint by outcome.", ("resource", "outcome")
+)
+FAISS_VECTORS = REGISTRY.gauge("pathochat_faiss_vectors", "Vectors (ntotal) in the loaded FAISS index.")
+FAISS_BYTES = REGISTRY.gauge("pathochat_faiss_index_bytes", "On-disk size of the loaded vector store folder.")
+EMBEDDING_MODEL_BYTES = REGISTRY.gauge(
+    "pathochat_embedding_model_bytes", "Resident memory added by loading the embedding model."
+)
+RESIDENT_BYTES = REGISTRY.gauge("pathochat_process_resident_bytes", "Resident set size of this process.")
+LLM_CALLS = REGISTRY.counter(
+    "pathochat_llm_calls_total",
+    "LLM endpoint calls by outcome (ok, failed, rate_limited, timeout, rejected, circuit_open).", ("outcome",)
+)
+LLM_RETRIES = REGISTRY.counter("pathochat_llm_retries_total", "Retried LLM endpoint requests.")
+LLM_HEDGES = REGISTRY.counter(
+    "pathochat_llm_hedges_total", "Hedged LLM calls by the request that answered first (primary or hedge).",
+    ("winner",)
+)
+LLM_BREAKER = REGISTRY.gauge(
+    "pathochat_llm_circuit_state", "Circuit breaker of each LLM endpoint: 0 closed, 1 half-open, 2 open.",
+    ("endpoint",)
+)
+LLM_ROUTED = REGISTRY.counter(
+    "pathochat_llm_routed_total", "LLM calls routed to each pooled endpoint, by tier (primary or fallback).",
+    ("endpoint", "tier")
+)
+LLM_OUTSTANDING = REGISTRY.gauge(
+    "pathochat_llm_outstanding_requests", "LLM calls in flight on each pooled endpoint.", ("endpoint",)
+)
+LLM_TTFT = REGISTRY.gauge(
+    "pathochat_llm_ttft_seconds", "Moving average of time to first token of each pooled endpoint.", ("endpoint",)
+)
+FALLBACKS = REGISTRY.counter(
+    "pathochat_llm_fallbacks_total", "Answers served without the LLM, from the cache or the retrieved passages.",
+    ("kind",)
+)
+
+
+def resident_bytes():
+    """Current RSS from /proc, or 0 where it isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+RESIDENT_BYTES.set_function(resident_bytes)
+
+
+def dir_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def watch_vector_store(db, db_path):
+    """Report the index size of ``db`` from now on."""
+    FAISS_VECTORS.set_function(lambda: db.index.ntotal)
+    FAISS_BYTES.set_function(lambda: dir_bytes(db_path))
+
+
+def record_query(trace, mode):
+    """Count a finished query from its trace attributes (error, tokens, cache and fallback flags)."""
+    error = trace.attrs.get("error")
+    QUERIES.inc(mode=mode, outcome="error" if error else "ok")
+    if error:
+        branch = error if error in ERROR_BRANCHES else "exception"
+        ERRORS.inc(branch=branch, type="" if branch != "exception" else error)
+    if trace.attrs.get("fallback"):
+        FALLBACKS.inc(kind=trace.attrs["fallback"])
+    if trace.attrs.get("cache") != "hit" and not trace.attrs.get("fallback"):
+        if "prompt_tokens" in trace.attrs:
+            LLM_TOKENS.inc(trace.attrs["prompt_tokens"], direction="in")
+        if "completion_tokens" in trace.attrs:
+            LLM_TOKENS.inc(trace.attrs["completion_tokens"], direction="out")
+
+
+def render_metrics():
+    """Everything served on /metrics: these counters and gauges, then the stage histograms."""
+    from tracing import get_tracer
+
+    return REGISTRY.text() + get_tracer().prometheus_text()
+
+
+class MetricsServer:
+    """``/metrics`` on its own port from a daemon thread; text is rendered only when scraped."""
+
+    def __init__(self, port, host="0.0.0.0"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = render_metrics().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+_servers = {}
+# Ports that could not be bound: reported once, not retried on every rerun
+_failed_ports = set()
+_servers_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """The process's metrics server on ``port``, started on first call (Streamlit reruns call it again)."""
+    with _servers_lock:
+        server = _servers.get(port)
+        if server is None:
+            server = _servers[port] = MetricsServer(port, host)
+        return server
+
+
+def open_metrics_server(port=METRICS_PORT):
+    # PATHOCHAT_METRICS_PORT unset or off: no sidecar
+    if str(port).lower() in ("", "off", "none") or str(port) in _failed_ports:
+        return None
+    try:
+        return start_metrics_server(int(port))
+    except (OSError, ValueError) as e:
+        with _servers_lock:
+            if str(port) in _failed_ports:
+                return None
+            _failed_ports.add(str(port))
+        print(f"Metrics server could not start on port {port}: {e}")
+        return None
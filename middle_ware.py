@@ -1,72 +1,26 @@
 import os
-from langchain_huggingface import HuggingFaceEndpoint, HuggingFaceEmbeddings
-from langchain_core.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import FAISS
-
-# Load HF token from environment
-HF_TOKEN = os.getenv("HF_TOKEN")
-
-# Hugging Face model repo
-hf_rep_id = "mistralai/Mistral-7B-Instruct-v0.3"
-# Function to get Hugging Face endpoint
-def get_hf_endpoint(hf_rep_id):
-    llm = HuggingFaceEndpoint(
-        repo_id=hf_rep_id,
-        temperature=0.5,
-        provider="hf-inference",
-        max_new_tokens= 1024,
-        huggingfacehub_api_token=HF_TOKEN
-    )
-    return llm
-
-PROMPT_TEMPLATE = """
-You are a focused assistant. Your task is to generate accurate answers using only the context provided.
-- Do not include external knowledge.
-- Do not speculate. If the context lacks the answer, respond with: "I don't know."
-- No fluff, greetings, or commentary — jump straight to the answer.
-
-[Context]
-{context}
-
-[Question]
-{question}
-
-[Answer]
-"""
-# Function to create a prompt template
-def get_prompt(template):
-    return PromptTemplate(
-        template=template,
-        input_variables=["context", "question"]
-    )
-
-# Vector store path and embedding model
+
+from warmup import start_warmup
+
+# Hugging Face model repo; PATHOCHAT_LLM_ENDPOINTS spreads generation over a pool instead
+hf_rep_id = os.getenv("PATHOCHAT_HF_REPO_ID", "mistralai/Mistral-7B-Instruct-v0.3")
+
+# Vector store path
 db_path = "vector_store/faiss_database"
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-# Load FAISS vector DB
-db = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
-
-# Create the retriever and LLM
-retriever = db.as_retriever(search_kwargs={"k": 5})
-llm = get_hf_endpoint(hf_rep_id)
-prompt = get_prompt(PROMPT_TEMPLATE)
-
-# Final RetrievalQA setup
-retrieval_qa = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=retriever,
-    return_source_documents=True,
-    chain_type_kwargs={"prompt": prompt}
-)
-
-query = input("Enter your query: ")
-response = retrieval_qa.invoke({"query": query})
-
-print("Answer:", response["result"])
-#print("Source Documents:", response["source_documents"])
+
+def main():
+    # Model, index and endpoint load in the background while the query is typed
+    warmup = start_warmup(db_path, k=5, hf_rep_id=hf_rep_id)
+
+    query = input("Enter your query: ")
+    engine = warmup.wait("engine")
+    response = engine.answer(query)
+
+    print("Answer:", response["result"])
+    #print("Source Documents:", response["source_documents"])
+
+if __name__ == "__main__":
+    main()
 # import os
 # import streamlit as st
 # from langchain_huggingface import HuggingFaceEndpoint, HuggingFaceEmbeddings
@@ -0,0 +1,158 @@
+"""Compact, memory-mapped docstore saved next to the FAISS index.
+
+Each column is a blob of UTF-8 values plus an int64 offsets array, so a
+document is read by slicing the mapped blob instead of unpickling the whole
+docstore at startup. Workers on one host share these pages through the OS
+page cache.
+
+    python mmap_docstore.py vector_store/faiss_database   # convert an existing index
+"""
+import json
+import os
+import sys
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+COLUMNS = ("text", "meta", "ids")
+
+
+def _column_paths(db_path, column):
+    return (
+        os.path.join(db_path, f"docstore.{column}.bin"),
+        os.path.join(db_path, f"docstore.{column}.offsets.npy"),
+    )
+
+
+def _write_column(db_path, column, values):
+    bin_path, offsets_path = _column_paths(db_path, column)
+    offsets = [0]
+    with open(bin_path, "wb") as f:
+        for value in values:
+            f.write(value)
+            offsets.append(offsets[-1] + len(value))
+    np.save(offsets_path, np.asarray(offsets, dtype=np.int64))
+
+
+def write_mmap_docstore(db, db_path):
+    """Write the docstore of a LangChain FAISS store in FAISS row order."""
+    ids = [db.index_to_docstore_id[i] for i in range(db.index.ntotal)]
+    docs = [db.docstore.search(doc_id) for doc_id in ids]
+    _write_column(db_path, "text", (doc.page_content.encode("utf-8") for doc in docs))
+    _write_column(db_path, "meta", (json.dumps(doc.metadata, separators=(",", ":")).encode("utf-8") for doc in docs))
+    _write_column(db_path, "ids", (doc_id.encode("utf-8") for doc_id in ids))
+
+
+def has_mmap_docstore(db_path):
+    return all(os.path.exists(path) for column in COLUMNS for path in _column_paths(db_path, column))
+
+
+class BlobColumn:
+    def __init__(self, db_path, column):
+        bin_path, offsets_path = _column_paths(db_path, column)
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        # np.memmap refuses empty files
+        if os.path.getsize(bin_path):
+            self.blob = np.memmap(bin_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def get_many(self, rows):
+        # One fancy-indexing read of the offsets for the whole batch
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self.offsets[rows], self.offsets[rows + 1]
+        return [self.blob[start:end].tobytes().decode("utf-8") for start, end in zip(starts, ends)]
+
+
+class MmapDocstore(Docstore):
+    """Read-only docstore addressed by FAISS row number."""
+
+    def __init__(self, db_path):
+        self.text = BlobColumn(db_path, "text")
+        self.meta = BlobColumn(db_path, "meta")
+        self.ids = BlobColumn(db_path, "ids")
+
+    def __len__(self):
+        return len(self.text)
+
+    def get(self, row):
+        return Document(id=self.ids[row], page_content=self.text[row], metadata=json.loads(self.meta[row]))
+
+    def get_many(self, rows):
+        """Documents for FAISS rows ``rows``, in order."""
+        texts, metas, ids = self.text.get_many(rows), self.meta.get_many(rows), self.ids.get_many(rows)
+        return [
+            Document(id=doc_id, page_content=text, metadata=json.loads(meta))
+            for doc_id, text, meta in zip(ids, texts, metas)
+        ]
+
+    def search(self, search):
+        if isinstance(search, (int, np.integer)) and 0 <= search < len(self):
+            return self.get(int(search))
+        return f"ID {search} not found."
+
+
+class RowIds(Mapping):
+    """Stands in for ``index_to_docstore_id``: FAISS row i maps to docstore row i."""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self.count:
+            raise KeyError(i)
+        return i
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(range(self.count))
+
+
+def read_index_mmap(path, spec):
+    # IVF inverted lists and flat codes are mapped through different FAISS hooks
+    if spec["type"] in ("IVF-Flat", "IVF-PQ"):
+        flags = faiss.IO_FLAG_MMAP
+    else:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(path, flags | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Older FAISS builds cannot map every index type
+        return faiss.read_index(path)
+
+
+def load_mmap_store(db_path, embeddings, spec):
+    from langchain_community.vectorstores import FAISS
+
+    index = read_index_mmap(os.path.join(db_path, "index.faiss"), spec)
+    docstore = MmapDocstore(db_path)
+    if index.ntotal != len(docstore):
+        raise ValueError(f"{db_path}: index has {index.ntotal} vectors but docstore has {len(docstore)} rows")
+    return FAISS(embeddings, index, docstore, RowIds(len(docstore)))
+
+
+if __name__ == "__main__":
+    import pickle
+    from types import SimpleNamespace
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "vector_store/faiss_database"
+    # The pickle is only read here, once, to produce the compact format
+    with open(os.path.join(db_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    index = faiss.read_index(os.path.join(db_path, "index.faiss"))
+    store = SimpleNamespace(index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+    write_mmap_docstore(store, db_path)
+    print(f"Wrote memory-mapped docstore for {index.ntotal} rows to {db_path}")
@@ -0,0 +1,130 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+from langchain_core.documents import Document
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Pages handed to one worker task; large textbooks get split into many ranges
+PAGES_PER_TASK = 64
+
+
+def list_pdf_files(data):
+    return sorted(
+        os.path.join(data, name)
+        for name in os.listdir(data)
+        if name.lower().endswith(".pdf")
+    )
+
+
+def plan_page_ranges(pdf_files, pages_per_task=PAGES_PER_TASK):
+    # Split every PDF into (path, start, stop, total_pages) work items
+    ranges = []
+    for path in pdf_files:
+        total = len(PdfReader(path).pages)
+        for start in range(0, total, pages_per_task):
+            ranges.append((path, start, min(start + pages_per_task, total), total))
+    return ranges
+
+
+def _extract_range(task):
+    # Runs in a worker process: only plain tuples cross the process boundary
+    path, start, stop, total = task
+    reader = PdfReader(path)
+    pages = []
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text() or ""
+        pages.append((page_number, text))
+    return path, total, pages
+
+
+def stream_pages(data, workers=None, pages_per_task=PAGES_PER_TASK, stats=None, pdf_files=None):
+    """Yield PDF pages as Documents, extracted in parallel and in page order.
+
+    At most ``2 * workers`` page ranges are in flight, so memory stays bounded
+    by the consumer rather than by the size of the corpus. ``pdf_files``
+    restricts extraction to a subset of ``data``.
+    """
+    workers = workers or os.cpu_count() or 1
+    if pdf_files is None:
+        pdf_files = list_pdf_files(data)
+    tasks = iter(plan_page_ranges(pdf_files, pages_per_task))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(_extract_range, task))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            path, total, pages = pending.popleft().result()
+            next_task = next(tasks, None)
+            if next_task is not None:
+                pending.append(executor.submit(_extract_range, next_task))
+            for page_number, text in pages:
+                if stats is not None:
+                    stats.pages += 1
+                # Same metadata keys PyPDFLoader produces
+                yield Document(
+                    page_content=text,
+                    metadata={
+                        "source": path,
+                        "page": page_number,
+                        "page_label": str(page_number + 1),
+                        "total_pages": total,
+                    },
+                )
+
+
+def stream_chunks(pages, text_splitter, stats=None):
+    # The splitter works per document, so splitting page by page is equivalent
+    for page in pages:
+        for chunk in text_splitter.split_documents([page]):
+            if stats is not None:
+                stats.chunks += 1
+            yield chunk
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux; children covers the extraction workers
+    if resource is None:
+        return 0.0, 0.0
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+class IngestStats:
+    def __init__(self):
+        self.pages = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.removed = 0
+        self.started = time.perf_counter()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        own, children = peak_rss_mb()
+        rate = self.pages / elapsed if elapsed else 0.0
+        return (
+            f"{self.pages} pages, {self.chunks} chunks in {elapsed:.1f}s "
+            f"({rate:.1f} pages/sec), {self.embedded} chunks embedded, "
+            f"{self.removed} removed, peak RSS {own:.0f} MB "
+            f"(largest worker {children:.0f} MB)"
+        )
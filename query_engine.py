@@ -0,0 +1,373 @@
+import logging
+import os
+import time
+from collections import deque
+
+from langchain_core.prompts import PromptTemplate
+
+from context_packer import count_tokens
+from highlight import passage, query_terms
+from llm_client import HF_INFERENCE_URL, LLMUnavailable
+from retrieval import BatchRetriever
+from tracing import get_tracer
+
+log = logging.getLogger(__name__)
+
+# Load HF token from environment
+HF_TOKEN = os.getenv("HF_TOKEN")
+
+# Overrides the hosted inference API with a specific endpoint when set
+HF_ENDPOINT_URL = os.getenv("HF_ENDPOINT_URL")
+
+# Hugging Face model repo and embedding model
+HF_REPO_ID = os.getenv("PATHOCHAT_HF_REPO_ID", "mistralai/Mistral-7B-Instruct-v0.3")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# When the LLM is unavailable: similarity a cached answer to another question
+# needs to be served instead, else the top passages are shown, cut to this length
+FALLBACK_CACHE_THRESHOLD = float(os.getenv("PATHOCHAT_FALLBACK_CACHE_THRESHOLD", "0.85"))
+FALLBACK_PASSAGES = 3
+FALLBACK_PASSAGE_CHARS = 600
+
+PROMPT_TEMPLATE = """
+You are a focused assistant. Your task is to generate accurate answers using only the context provided.
+- Do not include external knowledge.
+- Do not speculate. If the context lacks the answer, respond with: "I don't know."
+- No fluff, greetings, or commentary — jump straight to the answer.
+
+[Context]
+{context}
+
+[Question]
+{question}
+
+[Answer]
+"""
+
+# Function to create a prompt template
+def get_prompt(template):
+    return PromptTemplate(
+        template=template,
+        input_variables=["context", "question"]
+    )
+
+# Function to get Hugging Face endpoint
+def get_hf_endpoint(hf_rep_id):
+    from llm_client import open_resilient_endpoint
+
+    # Pooled, retrying client with a circuit breaker (llm_client.py) unless PATHOCHAT_LLM_RESILIENT=off
+    llm = open_resilient_endpoint(HF_ENDPOINT_URL or f"{HF_INFERENCE_URL}/{hf_rep_id}", HF_TOKEN)
+    if llm is not None:
+        return llm
+
+    # langchain_huggingface is the slowest import of the query path
+    from langchain_huggingface import HuggingFaceEndpoint
+
+    if HF_ENDPOINT_URL:
+        # Dedicated or local TGI-compatible server, e.g. benchmarks/stub_endpoint.py
+        return HuggingFaceEndpoint(
+            endpoint_url=HF_ENDPOINT_URL,
+            temperature=0.5,
+            max_new_tokens=1024,
+            huggingfacehub_api_token=HF_TOKEN
+        )
+    llm = HuggingFaceEndpoint(
+        repo_id=hf_rep_id,
+        temperature=0.5,
+        provider="hf-inference",
+        max_new_tokens=1024,
+        huggingfacehub_api_token=HF_TOKEN
+    )
+    return llm
+
+
+def format_context(docs):
+    # Same joining as the "stuff" chain: page contents separated by blank lines
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def format_passages(docs):
+    # Retrieval-only answer: the top passages, each with where it comes from
+    passages = []
+    for i, doc in enumerate(docs[:FALLBACK_PASSAGES], 1):
+        text = " ".join(doc.page_content.split())
+        if len(text) > FALLBACK_PASSAGE_CHARS:
+            text = text[:FALLBACK_PASSAGE_CHARS].rsplit(" ", 1)[0] + " ..."
+        where = doc.metadata.get("section") or os.path.basename(str(doc.metadata.get("source", "")))
+        page = doc.metadata.get("page")
+        label = ", ".join(part for part in (where, None if page is None else f"page {page + 1}") if part)
+        passages.append(f"{i}. {text}" + (f" ({label})" if label else ""))
+    return (
+        "The language model is unavailable right now, so here are the most relevant passages "
+        "from the textbook:\n\n" + "\n\n".join(passages)
+    )
+
+
+class StreamingAnswer:
+    """Iterate to receive answer tokens as the LLM produces them.
+
+    ``source_documents`` is known up front; ``result``, ``time_to_first_token``
+    and ``total_time`` (seconds since the query started) are set while iterating.
+    If the LLM is unavailable before its first token, the answer is a fallback
+    and ``fallback`` says which ("cache" or "retrieval").
+    ``trace`` is finished when iteration ends unless the caller owns it.
+    """
+
+    def __init__(self, engine, query, vector, prompt, source_documents, started, cached=None, trace=None,
+                 owns_trace=False):
+        self.engine = engine
+        self.query = query
+        self.vector = vector
+        self.prompt = prompt
+        self.source_documents = source_documents
+        self.started = started
+        self.cached = cached is not None
+        self.result = cached
+        self.time_to_first_token = None
+        self.total_time = None
+        self.trace = trace
+        self.owns_trace = owns_trace
+        self.fallback = None
+
+    def _tokens(self):
+        if self.cached:
+            yield self.result
+            return
+        tokens = self.engine.llm.stream(self.prompt)
+        try:
+            first = next(tokens, None)
+        except LLMUnavailable as e:
+            self.result, self.source_documents, self.fallback = self.engine.fallback(
+                self.vector, self.source_documents, e
+            )
+            if self.trace is not None:
+                self.trace.set(fallback=self.fallback)
+            yield self.result
+            return
+        if first is not None:
+            yield first
+        yield from tokens
+
+    def __iter__(self):
+        tracer = self.engine.tracer
+        chunks = []
+        generation_started = time.perf_counter()
+        try:
+            for token in self._tokens():
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.perf_counter() - self.started
+                    self.engine.ttft_seconds.append(self.time_to_first_token)
+                    if not self.cached and not self.fallback:
+                        tracer.record("llm_first_token", time.perf_counter() - generation_started, self.trace,
+                                      generation_started)
+                chunks.append(token)
+                yield token
+            self.result = "".join(chunks)
+            self.total_time = time.perf_counter() - self.started
+            if not self.cached and not self.fallback:
+                tracer.record("llm", time.perf_counter() - generation_started, self.trace, generation_started)
+                if self.trace is not None:
+                    # Streamed chunks are single tokens on TGI endpoints
+                    self.trace.set(completion_tokens=len(chunks))
+                self.engine.remember(self.query, self.vector, self.result, self.source_documents, self.total_time)
+        finally:
+            if self.owns_trace and self.trace is not None:
+                tracer.finish(self.trace)
+
+
+class QueryEngine:
+    """Retriever, prompt and RetrievalQA chain, built once and reused per query."""
+
+    def __init__(self, db, llm, k=4, template=PROMPT_TEMPLATE, answer_cache=None, lexical=None, reranker=None,
+                 packer=None, tracer=None):
+        self.db = db
+        self.llm = llm
+        self.k = k
+        self.answer_cache = answer_cache
+        self.reranker = reranker
+        self.packer = packer
+        # Per-stage spans of each query (tracing.py)
+        self.tracer = tracer or get_tracer()
+        # Recent time-to-first-token samples of streamed answers
+        self.ttft_seconds = deque(maxlen=1000)
+        # Recent (before, after) prompt token counts of packed contexts
+        self.prompt_tokens = deque(maxlen=1000)
+        # Dense FAISS hits, fused with BM25 hits when a lexical index is given
+        # and reranked by a cross-encoder when a reranker is given
+        self.batch_retriever = BatchRetriever(db, k=k, lexical=lexical, tracer=self.tracer)
+        self.prompt = get_prompt(template)
+        self._retriever = None
+        self._chain = None
+
+    @property
+    def retriever(self):
+        # LangChain retriever and RetrievalQA chain for callers that compose
+        # chains; built on first use since langchain.chains is slow to import
+        if self._retriever is None:
+            from retrieval import ChainRetriever
+
+            self._retriever = ChainRetriever(retrieve=self.retrieve)
+        return self._retriever
+
+    @property
+    def chain(self):
+        if self._chain is None:
+            from langchain.chains import RetrievalQA
+
+            self._chain = RetrievalQA.from_chain_type(
+                llm=self.llm,
+                chain_type="stuff",
+                retriever=self.retriever,
+                return_source_documents=True,
+                chain_type_kwargs={"prompt": self.prompt}
+            )
+        return self._chain
+
+    def answer(self, query):
+        """Return ``{"result": str, "source_documents": [Document], "cached": bool, "fallback": str | None}``."""
+        with self.tracer.trace("query"):
+            started = time.perf_counter()
+            # One query embedding serves both the answer cache and the FAISS search
+            vector = self.embed_query(query)
+            hit = self.lookup(vector)
+            if hit is not None:
+                return {"result": hit["result"], "source_documents": hit["source_documents"], "cached": True,
+                        "fallback": None}
+            docs = self.retrieve_by_vector(vector, query=query)
+            # Same prompt the "stuff" chain would format from these documents
+            prompt = self.build_prompt(query, docs)
+            try:
+                with self.tracer.span("llm"):
+                    result = self.llm.invoke(prompt)
+            except LLMUnavailable as e:
+                result, docs, kind = self.fallback(vector, docs, e)
+                self.tracer.annotate(fallback=kind)
+                return {"result": result, "source_documents": docs, "cached": False, "fallback": kind}
+            self.tracer.annotate(completion_tokens=count_tokens(result))
+            self.remember(query, vector, result, docs, time.perf_counter() - started)
+            return {"result": result, "source_documents": docs, "cached": False, "fallback": None}
+
+    def embed_query(self, query):
+        with self.tracer.span("embed"):
+            return self.db.embedding_function.embed_query(query)
+
+    def retrieve_by_vector(self, vector, k=None, query=None):
+        if self.reranker is None or query is None:
+            return self.batch_retriever.search_vectors([vector], k, None if query is None else [query])[0]
+        # Over-fetch, then let the cross-encoder pick fewer, better chunks:
+        # top_n of them, or as many as the caller asked for
+        k = k or self.reranker.top_n
+        docs = self.batch_retriever.search_vectors([vector], max(k, self.reranker.fetch_k), [query])[0]
+        with self.tracer.span("rerank"):
+            return self.reranker.rerank(query, docs, k)
+
+    def retrieve(self, query, k=None):
+        return self.retrieve_by_vector(self.embed_query(query), k, query)
+
+    def search(self, query, k=None):
+        """Retrieval-only fast path: ranked passages for ``query`` without generation.
+
+        Returns ``{"passages": [dict], "source_documents": [Document]}``, passages
+        as built by ``highlight.passage``. Dense (and BM25) retrieval only: the
+        cross-encoder and the LLM are left out so results come back in milliseconds.
+        """
+        with self.tracer.trace("search"):
+            vector = self.embed_query(query)
+            docs = self.batch_retriever.search_vectors([vector], k, [query])[0]
+            with self.tracer.span("highlight"):
+                terms = query_terms(query)
+                passages = [passage(doc, rank, terms) for rank, doc in enumerate(docs, 1)]
+            self.tracer.annotate(passages=len(passages))
+            return {"passages": passages, "source_documents": docs}
+
+    def retrieve_many(self, queries, k=None):
+        """Top-k documents for each of ``queries`` from one batched search."""
+        return self.batch_retriever.search(queries, k)
+
+    def pack(self, query, docs):
+        """The chunks as they go into the prompt: merged, deduplicated and within the token budget."""
+        if self.packer is None:
+            return docs
+        with self.tracer.span("pack"):
+            packed = self.packer.pack(docs)
+            before = self.packer.count(self.prompt.format(context=format_context(docs), question=query))
+            after = self.packer.count(self.prompt.format(context=format_context(packed), question=query))
+        self.prompt_tokens.append((before, after))
+        self.tracer.annotate(unpacked_prompt_tokens=before, packed_prompt_tokens=after, packed_passages=len(packed))
+        return packed
+
+    def build_prompt(self, query, docs):
+        docs = self.pack(query, docs)
+        with self.tracer.span("prompt"):
+            prompt = self.prompt.format(context=format_context(docs), question=query)
+        self.tracer.annotate(prompt_tokens=count_tokens(prompt), chunks=len(docs))
+        return prompt
+
+    def lookup(self, vector):
+        if self.answer_cache is None:
+            return None
+        with self.tracer.span("cache_lookup"):
+            hit = self.answer_cache.lookup(vector)
+        self.tracer.annotate(cache="miss" if hit is None else "hit")
+        return hit
+
+    def fallback(self, vector, docs, error):
+        """Answer without the LLM: ``(result, source_documents, kind)``.
+
+        A cached answer to a similar enough question if there is one, else the
+        retrieved passages themselves. Without ``vector`` (passages the caller
+        chose) the answer is always those passages.
+        """
+        log.warning("LLM unavailable, answering without it: %s", error)
+        if self.answer_cache is not None and vector is not None:
+            # Counted as a fallback, not as an answer-cache hit or miss
+            hit = self.answer_cache.lookup(vector, threshold=FALLBACK_CACHE_THRESHOLD, count=False)
+            if hit is not None:
+                return hit["result"], hit["source_documents"], "cache"
+        return format_passages(docs), docs, "retrieval"
+
+    def remember(self, query, vector, result, docs, generation_seconds):
+        # No vector: the answer was built from passages the caller chose, so it is
+        # not what other users asking a similar question should get
+        if self.answer_cache is not None and vector is not None:
+            self.answer_cache.put(query, vector, result, docs, generation_seconds)
+
+    def stream_answer(self, query, docs=None):
+        """Retrieve context now and return a ``StreamingAnswer`` for the generation.
+
+        ``docs`` answers from passages already retrieved, e.g. by ``search``:
+        the answer cache is neither read nor written for them. Spans join the caller's active trace if there is one; otherwise the
+        answer starts its own, finished when streaming ends.
+        """
+        trace = self.tracer.current()
+        owns_trace = trace is None
+        if owns_trace:
+            trace = self.tracer.begin("query")
+        token = self.tracer.activate(trace)
+        try:
+            started = time.perf_counter()
+            vector = None
+            if docs is None:
+                vector = self.embed_query(query)
+                hit = self.lookup(vector)
+                if hit is not None:
+                    return StreamingAnswer(self, query, vector, None, hit["source_documents"], started,
+                                           cached=hit["result"], trace=trace, owns_trace=owns_trace)
+                docs = self.retrieve_by_vector(vector, query=query)
+            prompt = self.build_prompt(query, docs)
+            return StreamingAnswer(self, query, vector, prompt, docs, started, trace=trace, owns_trace=owns_trace)
+        except Exception as e:
+            trace.set(error=type(e).__name__)
+            if owns_trace:
+                self.tracer.finish(trace)
+            raise
+        finally:
+            self.tracer.deactivate(token)
+
+
+def load_query_engine(db_path, k=4, hf_rep_id=HF_REPO_ID):
+    from warmup import start_warmup
+
+    # Process-wide: embeddings, index and endpoint are loaded once per configuration,
+    # by the same background warmup the Streamlit app starts on its first page view
+    return start_warmup(db_path, k, hf_rep_id).wait("engine")
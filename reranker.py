@@ -0,0 +1,68 @@
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Cross-encoder used to rerank over-fetched hits; unset leaves reranking off
+RERANK_MODEL = os.getenv("PATHOCHAT_RERANKER")
+FETCH_K = int(os.getenv("PATHOCHAT_RERANK_FETCH_K", "50"))
+TOP_N = int(os.getenv("PATHOCHAT_RERANK_TOP_N", "3"))
+# Per-query scoring budget; past it the dense order is used instead
+BUDGET_MS = float(os.getenv("PATHOCHAT_RERANK_BUDGET_MS", "300"))
+BATCH_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def load_cross_encoder(model_name):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name, max_length=512)
+
+
+class Reranker:
+    """Scores (query, chunk) pairs with a cross-encoder and keeps the best ``top_n``.
+
+    Pairs are scored in batches of ``batch_size``; once the time spent passes
+    ``budget_ms``, after any batch including the last, scoring stops and the
+    caller's dense order is used instead.
+    """
+
+    def __init__(self, model, fetch_k=FETCH_K, top_n=TOP_N, budget_ms=BUDGET_MS, batch_size=BATCH_SIZE):
+        self.model = model
+        self.fetch_k = fetch_k
+        self.top_n = top_n
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.reranked = 0
+        self.fallbacks = 0
+        self.last_ms = 0.0
+
+    def rerank(self, query, docs, k=None):
+        """Best ``k`` (default ``top_n``) of ``docs`` for ``query``, or the first ``k`` if over budget."""
+        k = k or self.top_n
+        started = time.perf_counter()
+        scores = []
+        over_budget = False
+        for i in range(0, len(docs), self.batch_size):
+            batch = docs[i:i + self.batch_size]
+            scores.extend(self.model.predict([(query, doc.page_content) for doc in batch], batch_size=self.batch_size))
+            over_budget = time.perf_counter() - started > self.budget
+            if over_budget:
+                break
+        self.last_ms = (time.perf_counter() - started) * 1000
+        if over_budget:
+            self.fallbacks += 1
+            return docs[:k]
+        self.reranked += 1
+        order = np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")
+        return [docs[i] for i in order[:k]]
+
+    def metrics(self):
+        return {"reranked": self.reranked, "fallbacks": self.fallbacks, "last_ms": self.last_ms}
+
+
+def open_reranker(model_name=RERANK_MODEL):
+    if not model_name or model_name.lower() in ("off", "none"):
+        return None
+    return Reranker(load_cross_encoder(model_name))
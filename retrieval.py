@@ -0,0 +1,121 @@
+from typing import Any
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from embedding_cache import embed_queries_array
+from tracing import get_tracer
+
+# Reciprocal rank fusion constant, and hits taken from each ranking before fusing
+RRF_K = 60
+FUSION_DEPTH = 50
+
+
+def fetch_documents(db, rows):
+    """Documents for FAISS ``rows`` of a LangChain FAISS store, fetched once per distinct row."""
+    unique = np.unique(np.asarray(rows, dtype=np.int64))
+    if hasattr(db.docstore, "get_many"):
+        # Memory-mapped docstore: rows are docstore positions
+        docs = db.docstore.get_many(unique)
+    else:
+        docs = [db.docstore.search(db.index_to_docstore_id[int(row)]) for row in unique]
+    by_row = {}
+    for row, doc in zip(unique.tolist(), docs):
+        if not isinstance(doc, Document):
+            raise ValueError(f"Could not find document for FAISS row {row}, got {doc}")
+        by_row[row] = doc
+    return by_row
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked row lists into ``[(row, score)]``, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class BatchRetriever:
+    """Top-k search for many queries at once on a loaded FAISS store.
+
+    Queries are embedded as one matrix, searched with one ``index.search``
+    call and their documents fetched in bulk, so per-query overhead shrinks
+    as the batch grows. With a ``lexical`` BM25 index and the query texts,
+    dense and BM25 rankings are fused with reciprocal rank fusion and the
+    returned scores are fusion scores instead of distances.
+    """
+
+    def __init__(self, db, k=4, lexical=None, fusion_depth=FUSION_DEPTH, tracer=None):
+        self.db = db
+        self.k = k
+        self.lexical = lexical
+        self.fusion_depth = fusion_depth
+        self.tracer = tracer or get_tracer()
+
+    def search_vectors_with_scores(self, vectors, k=None, queries=None):
+        """``[[(Document, score)]]`` per row of an (n, dim) query matrix."""
+        k = k or self.k
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        if not len(vectors):
+            return []
+        if self.db._normalize_L2:
+            vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+        hybrid = self.lexical is not None and queries is not None
+        with self.tracer.span("faiss_search"):
+            scores, rows = self.db.index.search(vectors, max(k, self.fusion_depth) if hybrid else k)
+        if hybrid:
+            ranked = []
+            with self.tracer.span("bm25_fusion"):
+                for query, dense_rows in zip(queries, rows):
+                    lexical_rows, _ = self.lexical.search(query, self.fusion_depth)
+                    ranked.append(reciprocal_rank_fusion([dense_rows[dense_rows != -1].tolist(), lexical_rows.tolist()])[:k])
+        else:
+            ranked = [
+                [(int(row), float(score)) for row, score in zip(hit_rows, hit_scores) if row != -1]
+                for hit_rows, hit_scores in zip(rows, scores)
+            ]
+        with self.tracer.span("docstore"):
+            docs = fetch_documents(self.db, [row for hits in ranked for row, _ in hits])
+        return [[(docs[row], score) for row, score in hits] for hits in ranked]
+
+    def search_vectors(self, vectors, k=None, queries=None):
+        return [[doc for doc, _ in hits] for hits in self.search_vectors_with_scores(vectors, k, queries)]
+
+    def embed(self, queries):
+        return embed_queries_array(self.db.embedding_function, list(queries))
+
+    def search(self, queries, k=None):
+        """Top-k documents for each of ``queries``."""
+        queries = list(queries)
+        return self.search_vectors(self.embed(queries), k, queries)
+
+    def search_with_scores(self, queries, k=None):
+        queries = list(queries)
+        return self.search_vectors_with_scores(self.embed(queries), k, queries)
+
+
+def __getattr__(name):
+    # ChainRetriever is defined on first use: langchain_core.retrievers pulls
+    # in the callback manager and langsmith, which the query path never needs
+    if name == "ChainRetriever":
+        global ChainRetriever
+        ChainRetriever = _chain_retriever_class()
+        return ChainRetriever
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _chain_retriever_class():
+    from langchain_core.retrievers import BaseRetriever
+
+    class ChainRetriever(BaseRetriever):
+        """LangChain retriever over a retrieval function, for chains such as RetrievalQA."""
+
+        retrieve: Any
+
+        def _get_relevant_documents(self, query, *, run_manager):
+            return self.retrieve(query)
+
+    return ChainRetriever
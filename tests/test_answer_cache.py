@@ -0,0 +1,38 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+
+VECTOR = np.ones(8, dtype=np.float32)
+
+
+def open_cache(tmp_path, on_disk):
+    # Like open_answer_cache: the version loaded now, and a way to read it again later
+    return AnswerCache(str(tmp_path / "answer_cache.sqlite"), on_disk[0], current_version=lambda: on_disk[0])
+
+
+def test_uncounted_lookups_leave_hit_rate_alone(tmp_path):
+    cache = open_cache(tmp_path, ["v1"])
+    cache.put("q", VECTOR, "answer", [], 2.0)
+    assert cache.lookup(VECTOR, count=False)["result"] == "answer"
+    assert cache.lookup(-VECTOR, count=False) is None
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["saved_seconds"]) == (0, 0, 0.0)
+    assert cache.lookup(VECTOR)["result"] == "answer"
+    assert cache.metrics()["hits"] == 1
+
+
+def test_rebuilt_index_invalidates_running_cache(tmp_path):
+    on_disk = ["v1"]
+    cache = open_cache(tmp_path, on_disk)
+    cache.put("q", VECTOR, "answer", [], 2.0)
+    assert cache.lookup(VECTOR) is not None
+    on_disk[0] = "v2"
+    assert cache.lookup(VECTOR) is None
+    # Answers from the old index this process still serves are not stored either
+    cache.put("q", VECTOR, "stale answer", [], 2.0)
+    assert cache.metrics()["entries"] == 0
+    # A process that loaded the rebuilt index starts empty and fills the cache
+    fresh = open_cache(tmp_path, on_disk)
+    assert fresh.lookup(VECTOR) is None
+    fresh.put("q", VECTOR, "new answer", [], 2.0)
+    assert fresh.lookup(VECTOR)["result"] == "new answer"
@@ -0,0 +1,70 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake import FakeListLLM
+
+from answer_cache import AnswerCache
+from api_server import create_app
+from query_engine import QueryEngine
+
+TEXTS = [
+    "Coagulative necrosis preserves the tissue architecture.",
+    "Liquefactive necrosis is typical of bacterial infections and the brain.",
+    "Caseous necrosis is seen in tuberculosis.",
+]
+QUESTION = "What is coagulative necrosis?"
+CHOSEN = [{"page_content": "Planted passage.", "metadata": {"source": "client"}}]
+
+
+def make_engine(tmp_path):
+    db = FAISS.from_texts(TEXTS, DeterministicFakeEmbedding(size=32))
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite"), "v1")
+    return QueryEngine(db, FakeListLLM(responses=["Generated answer."]), k=2, answer_cache=cache)
+
+
+def post_query(engine, payload):
+    async def run():
+        async with TestClient(TestServer(create_app(engine))) as client:
+            response = await client.post("/query", json=payload)
+            assert response.status == 200
+            return await response.json()
+
+    return asyncio.run(run())
+
+
+def test_query_with_documents_leaves_answer_cache_unchanged(tmp_path):
+    engine = make_engine(tmp_path)
+    response = post_query(engine, {"query": QUESTION, "documents": CHOSEN})
+    assert response["source_documents"] == CHOSEN
+    assert not response["cached"]
+    assert engine.answer_cache.metrics()["entries"] == 0
+    # Nothing was planted: the next user still gets an answer from retrieval
+    response = post_query(engine, {"query": QUESTION})
+    assert not response["cached"]
+    assert response["source_documents"] != CHOSEN
+    assert engine.answer_cache.metrics()["entries"] == 1
+
+
+def test_query_with_documents_skips_cached_answer(tmp_path):
+    engine = make_engine(tmp_path)
+    vector = engine.embed_query(QUESTION)
+    engine.answer_cache.put(QUESTION, vector, "Cached answer.", [], 1.0)
+    response = post_query(engine, {"query": QUESTION, "documents": CHOSEN})
+    assert response["result"] == "Generated answer."
+    assert response["source_documents"] == CHOSEN
+    assert not response["cached"]
+    assert engine.answer_cache.metrics()["hits"] == 0
+
+
+def test_stream_answer_with_docs_bypasses_answer_cache(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.answer_cache.put(QUESTION, engine.embed_query(QUESTION), "Cached answer.", [], 1.0)
+    docs = engine.retrieve(QUESTION)
+    answer = engine.stream_answer(QUESTION, docs=docs)
+    assert "".join(answer) == "Generated answer."
+    assert not answer.cached
+    assert answer.source_documents == docs
+    metrics = engine.answer_cache.metrics()
+    assert (metrics["entries"], metrics["hits"], metrics["misses"]) == (1, 0, 0)
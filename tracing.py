@@ -0,0 +1,318 @@
+"""Per-stage latency tracing of the query path.
+
+Stages (query embedding, cache lookup, FAISS search, BM25 fusion, docstore
+fetch, reranking, context packing, prompt formatting, the LLM round trip and
+Streamlit rendering) are timed with ``span`` and always feed in-process
+histograms, which the admin panel and ``/metrics`` read. A query's spans,
+token counts and cache flag are collected on its ``Trace`` and handed to the
+exporters named in ``PATHOCHAT_TRACE`` when the query finishes:
+
+    log         one line per query on stdout (default)
+    prometheus  text exposition on http://0.0.0.0:$PATHOCHAT_TRACE_PORT/metrics (see metrics.py)
+    otel        OTLP/HTTP spans to $OTEL_EXPORTER_OTLP_ENDPOINT (needs opentelemetry-sdk)
+    off         histograms only
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Comma-separated exporters: log, prometheus, otel or off
+EXPORTERS = os.getenv("PATHOCHAT_TRACE", "log")
+# Port of the /metrics endpoint served by the prometheus exporter
+METRICS_PORT = int(os.getenv("PATHOCHAT_TRACE_PORT", "9464"))
+OTEL_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+RECENT_TRACES = 100
+
+_current = contextvars.ContextVar("pathochat_trace", default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram in milliseconds."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+    def quantile(self, q):
+        """Estimated ``q`` quantile, interpolated inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1] * 2
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+        }
+
+
+class Trace:
+    """Spans and attributes (cache flag, token counts, error) of one query.
+
+    Repeated spans of one stage, such as a render per streamed token, are
+    summed into a single entry ``[offset_s, seconds, calls]``.
+    """
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.stages = {}
+        self.wall_start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def add(self, name, seconds, started=None):
+        offset = (started if started is not None else time.perf_counter() - seconds) - self.started
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = [offset, seconds, 1]
+        else:
+            stage[1] += seconds
+            stage[2] += 1
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start": self.wall_start,
+            "total_ms": (self.duration or 0.0) * 1000,
+            "stages_ms": {name: seconds * 1000 for name, (_, seconds, _) in self.stages.items()},
+            **self.attrs,
+        }
+
+
+class LogExporter:
+    def export(self, trace):
+        # Stages in the order they started, in milliseconds
+        ordered = sorted(trace.stages.items(), key=lambda item: item[1][0])
+        stages = " ".join(f"{name}={seconds * 1000:.1f}" for name, (_, seconds, _) in ordered)
+        attrs = " ".join(f"{key}={value}" for key, value in trace.attrs.items())
+        print(f"Trace {trace.name} {trace.duration * 1000:.1f} ms | {stages} | {attrs}".rstrip(" |"))
+
+
+class PrometheusExporter:
+    """Serves the tracer's histograms, with the counters and gauges of metrics.py, on ``/metrics``.
+
+    Nothing is done per query; the text is rendered only when scraped.
+    """
+
+    def __init__(self, tracer, port=METRICS_PORT, host="0.0.0.0"):
+        from metrics import start_metrics_server
+
+        self.tracer = tracer
+        self.port = start_metrics_server(port, host).port
+
+    def export(self, trace):
+        pass
+
+
+class OtelExporter:
+    """Replays each finished trace as an OpenTelemetry span tree over OTLP/HTTP."""
+
+    def __init__(self, endpoint=OTEL_ENDPOINT):
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.trace import set_span_in_context
+
+        provider = TracerProvider(resource=Resource.create({"service.name": "pathochat"}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{endpoint.rstrip('/')}/v1/traces")))
+        self.provider = provider
+        self.otel = provider.get_tracer("pathochat")
+        self.set_span_in_context = set_span_in_context
+
+    def export(self, trace):
+        start_ns = int(trace.wall_start * 1e9)
+        root = self.otel.start_span(trace.name, start_time=start_ns, attributes=trace.attrs)
+        context = self.set_span_in_context(root)
+        for name, (offset, seconds, calls) in trace.stages.items():
+            begin = start_ns + int(offset * 1e9)
+            span = self.otel.start_span(name, context=context, start_time=begin, attributes={"calls": calls})
+            span.end(end_time=begin + int(seconds * 1e9))
+        root.end(end_time=start_ns + int(trace.duration * 1e9))
+
+
+class Tracer:
+    """Stage histograms, query counters and the exporters finished traces go to."""
+
+    def __init__(self, exporters=()):
+        self.exporters = list(exporters)
+        self.histograms = {}
+        # cache_hits, cache_misses, prompt_tokens, completion_tokens, errors
+        self.counters = {}
+        self.recent = deque(maxlen=RECENT_TRACES)
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds * 1000)
+
+    def record(self, stage, seconds, trace=None, started=None):
+        """Count ``seconds`` for ``stage`` and add it to ``trace`` or the active one."""
+        self.observe(stage, seconds)
+        trace = trace or _current.get()
+        if trace is not None:
+            trace.add(stage, seconds, started)
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, started=started)
+
+    def current(self):
+        return _current.get()
+
+    def annotate(self, **attrs):
+        trace = _current.get()
+        if trace is not None:
+            trace.set(**attrs)
+
+    def begin(self, name, **attrs):
+        return Trace(name, **attrs)
+
+    def activate(self, trace):
+        """Make ``trace`` the one spans attach to; returns a token for ``finish``."""
+        return _current.set(trace)
+
+    def deactivate(self, token):
+        _current.reset(token)
+
+    def finish(self, trace, token=None):
+        if token is not None:
+            self.deactivate(token)
+        if trace.duration is not None:
+            return
+        trace.duration = time.perf_counter() - trace.started
+        self.observe(trace.name, trace.duration)
+        with self.lock:
+            cache = trace.attrs.get("cache")
+            if cache is not None:
+                key = "cache_hits" if cache == "hit" else "cache_misses"
+                self.counters[key] = self.counters.get(key, 0) + 1
+            for key in ("prompt_tokens", "completion_tokens"):
+                if key in trace.attrs:
+                    self.counters[key] = self.counters.get(key, 0) + trace.attrs[key]
+            if "error" in trace.attrs:
+                self.counters["errors"] = self.counters.get("errors", 0) + 1
+            self.recent.append(trace.to_dict())
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                print(f"Trace export failed ({type(exporter).__name__}): {e}")
+
+    @contextmanager
+    def trace(self, name, **attrs):
+        """Trace a query; inside an already active trace this just yields that one."""
+        active = _current.get()
+        if active is not None:
+            yield active
+            return
+        trace = self.begin(name, **attrs)
+        token = self.activate(trace)
+        try:
+            yield trace
+        except Exception as e:
+            trace.set(error=type(e).__name__)
+            raise
+        finally:
+            self.finish(trace, token)
+
+    def stages(self):
+        """``{stage: summary}`` of every histogram, for the admin panel."""
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def buckets(self, stage):
+        """``[(upper bound in ms, count)]`` of one stage's histogram."""
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                return []
+            return list(zip([*histogram.buckets, float("inf")], histogram.counts))
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP pathochat_stage_seconds Latency of each stage of the query path.",
+            "# TYPE pathochat_stage_seconds histogram",
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip([*histogram.buckets, None], histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound is None else f"{bound / 1000:g}"
+                    lines.append(f'pathochat_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'pathochat_stage_seconds_sum{{stage="{stage}"}} {histogram.sum / 1000:.6f}')
+                lines.append(f'pathochat_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            counters = dict(self.counters)
+        lines.append("# HELP pathochat_trace_total Cache hits/misses, token totals and errors of traced queries.")
+        lines.append("# TYPE pathochat_trace_total counter")
+        for key, value in sorted(counters.items()):
+            lines.append(f'pathochat_trace_total{{event="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def open_tracer(exporters=EXPORTERS):
+    tracer = Tracer()
+    for name in filter(None, (part.strip().lower() for part in exporters.split(","))):
+        try:
+            if name == "log":
+                tracer.exporters.append(LogExporter())
+            elif name == "prometheus":
+                tracer.exporters.append(PrometheusExporter(tracer))
+            elif name == "otel":
+                tracer.exporters.append(OtelExporter())
+            elif name not in ("off", "none"):
+                print(f"Unknown trace exporter {name!r}, expected log, prometheus, otel or off")
+        except ImportError as e:
+            print(f"Trace exporter {name!r} unavailable: {e}")
+        except OSError as e:
+            print(f"Trace exporter {name!r} could not start: {e}")
+    return tracer
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """The process-wide tracer, created on first use from ``PATHOCHAT_TRACE``."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = open_tracer()
+    return _tracer
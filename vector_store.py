@@ -0,0 +1,45 @@
+import os
+
+from langchain_community.vectorstores import FAISS
+
+from index_spec import SPEC_FILE, apply_search_params, load_spec
+from mmap_docstore import has_mmap_docstore, load_mmap_store
+
+LOAD_MODE = os.getenv("PATHOCHAT_LOAD_MODE", "auto")
+
+
+def search_spec(db_path):
+    # The build records the index type; query-time knobs can be overridden per deploy
+    spec = load_spec(db_path)
+    if "nprobe" in spec and os.getenv("PATHOCHAT_NPROBE"):
+        spec["nprobe"] = int(os.getenv("PATHOCHAT_NPROBE"))
+    if "efSearch" in spec and os.getenv("PATHOCHAT_EF_SEARCH"):
+        spec["efSearch"] = int(os.getenv("PATHOCHAT_EF_SEARCH"))
+    return spec
+
+
+def load_faiss(db_path, embeddings, mode=LOAD_MODE):
+    """Load the FAISS store at ``db_path``.
+
+    ``mode`` is ``"mmap"`` (memory-map the index and the compact docstore),
+    ``"pickle"`` (read everything into memory, the LangChain default) or
+    ``"auto"``, which maps when the compact docstore files are present.
+    """
+    spec = search_spec(db_path)
+    if mode == "mmap" or (mode == "auto" and has_mmap_docstore(db_path)):
+        db = load_mmap_store(db_path, embeddings, spec)
+    else:
+        db = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
+    apply_search_params(db.index, spec)
+    return db
+
+
+def index_version(db_path):
+    # Changes whenever llm_database.py swaps in a rebuilt index
+    parts = []
+    for name in ("index.faiss", SPEC_FILE):
+        path = os.path.join(db_path, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
@@ -0,0 +1,223 @@
+"""Background warmup of the query path, so the UI is up before the models are.
+
+Heavy imports (langchain, FAISS, sentence-transformers), the embedding model,
+the FAISS index, the LLM endpoint, the optional reranker and the answer cache
+load one step at a time on a daemon thread, started by the first page view or
+CLI run. Callers block in ``wait(step)`` only once they need that result, and
+``ready`` is set when every step has run.
+
+Step times, and the time each heavy module adds to imports, make up the
+startup profile: it is logged as a ``startup`` trace (see tracing.py), shown in
+the admin panel and, with ``PATHOCHAT_STARTUP_PROFILE``, written as JSON.
+``PATHOCHAT_READY_FILE`` is created once the query engine is built, for exec
+readiness probes (``test -f``).
+"""
+import importlib
+import json
+import os
+import threading
+import time
+
+from tracing import get_tracer
+
+READY_FILE = os.getenv("PATHOCHAT_READY_FILE")
+PROFILE_PATH = os.getenv("PATHOCHAT_STARTUP_PROFILE")
+# Imported in this order; each entry is timed on top of the ones before it
+HEAVY_MODULES = (
+    "numpy", "faiss", "langchain_core.documents", "langchain_core.prompts", "langchain_community.vectorstores",
+    "langchain_huggingface", "sentence_transformers", "query_engine", "vector_store", "embedding_cache",
+)
+
+
+def process_uptime():
+    """Seconds since this process started, or None off Linux."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (starttime) counts clock ticks since boot; fields restart after the command name
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Warmup:
+    """Runs ``steps``, ``(name, fn)`` pairs called as ``fn(warmup)``, in order on a daemon thread.
+
+    A failed step keeps its exception for ``wait``; later steps still run.
+    """
+
+    def __init__(self, steps, name="startup"):
+        self.steps = list(steps)
+        self.name = name
+        self.results = {}
+        self.errors = {}
+        self.seconds = {}
+        self.imports = {}
+        self.done = {step: threading.Event() for step, _ in self.steps}
+        self.ready = threading.Event()
+        self.started = time.perf_counter()
+        self.ready_seconds = None
+        self.thread = threading.Thread(target=self.run, name=f"pathochat-{name}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        tracer = get_tracer()
+        trace = tracer.begin(self.name)
+        for step, fn in self.steps:
+            started = time.perf_counter()
+            try:
+                self.results[step] = fn(self)
+            except Exception as e:
+                self.errors[step] = e
+                print(f"Warmup step {step} failed: {e}")
+            self.seconds[step] = time.perf_counter() - started
+            trace.add(step, self.seconds[step], started)
+            self.done[step].set()
+        self.ready_seconds = time.perf_counter() - self.started
+        uptime = process_uptime()
+        if uptime is not None:
+            trace.set(process_uptime_s=round(uptime, 2))
+        if self.errors:
+            trace.set(error=",".join(self.errors))
+        tracer.finish(trace)
+        self.ready.set()
+        self.write_signals()
+
+    def wait(self, step, timeout=None):
+        """Result of ``step`` once it has run; re-raises the step's exception."""
+        if not self.done[step].wait(timeout):
+            raise TimeoutError(f"Warmup step {step} still running after {timeout} s")
+        if step in self.errors:
+            raise self.errors[step]
+        return self.results[step]
+
+    def get(self, step):
+        """Result of ``step`` if it has finished without error, else None; never blocks."""
+        return self.results.get(step)
+
+    def status(self):
+        if not self.ready.is_set():
+            return "warming"
+        return "failed" if "engine" in self.errors else "ready"
+
+    def current_step(self):
+        return next((step for step, _ in self.steps if not self.done[step].is_set()), None)
+
+    def profile(self):
+        return {
+            "status": self.status(),
+            "ready_s": self.ready_seconds,
+            "process_uptime_s": process_uptime(),
+            "steps_s": dict(self.seconds),
+            "imports_s": dict(self.imports),
+            "errors": {step: f"{type(e).__name__}: {e}" for step, e in self.errors.items()},
+        }
+
+    def write_signals(self):
+        if PROFILE_PATH:
+            try:
+                with open(PROFILE_PATH, "w", encoding="utf-8") as f:
+                    json.dump(self.profile(), f, indent=2)
+            except OSError as e:
+                print(f"Could not write startup profile: {e}")
+        if READY_FILE and self.status() == "ready":
+            try:
+                with open(READY_FILE, "w") as f:
+                    f.write(f"{self.ready_seconds:.3f}\n")
+            except OSError as e:
+                print(f"Could not write ready file: {e}")
+
+
+def import_modules(warmup, modules=HEAVY_MODULES):
+    for module in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"Warmup import of {module} failed: {e}")
+            continue
+        warmup.imports[module] = time.perf_counter() - started
+
+
+def query_path_steps(db_path, k=4, hf_rep_id=None):
+    """Steps that build the same engine as ``query_engine.load_query_engine``."""
+
+    def answer_cache(warmup):
+        from answer_cache import open_answer_cache
+
+        return open_answer_cache(db_path)
+
+    def embeddings(warmup):
+        from embedding_cache import get_cached_embeddings
+        from metrics import EMBEDDING_MODEL_BYTES, resident_bytes
+        from query_engine import EMBEDDING_MODEL
+
+        # Loads the model and runs it once for the cache's dimension probe;
+        # modules were imported by the previous step, so the RSS growth is the model
+        before = resident_bytes()
+        embeddings = get_cached_embeddings(EMBEDDING_MODEL)
+        EMBEDDING_MODEL_BYTES.set(max(resident_bytes() - before, 0))
+        return embeddings
+
+    def vector_store(warmup):
+        from vector_store import load_faiss
+
+        return load_faiss(db_path, warmup.wait("embeddings"))
+
+    def llm(warmup):
+        from llm_backends import open_llm
+
+        # The hosted endpoint, or a local model with PATHOCHAT_LLM_BACKEND=llamacpp
+        return open_llm(hf_rep_id)
+
+    def reranker(warmup):
+        from reranker import open_reranker
+
+        return open_reranker()
+
+    def retriever(warmup):
+        from bm25_index import open_bm25_index
+        from context_packer import open_context_packer
+        from query_engine import QueryEngine
+
+        # The engine before its LLM: enough for retrieval-only search, which
+        # then works while the LLM loads or if it fails to
+        return QueryEngine(
+            warmup.wait("vector_store"), None, k=k, answer_cache=warmup.get("answer_cache"),
+            lexical=open_bm25_index(db_path), packer=open_context_packer()
+        )
+
+    def engine(warmup):
+        # A failed reranker leaves the engine without one
+        engine = warmup.wait("retriever")
+        engine.llm = warmup.wait("llm")
+        engine.reranker = warmup.get("reranker")
+        return engine
+
+    return [
+        ("imports", import_modules), ("answer_cache", answer_cache), ("embeddings", embeddings),
+        ("vector_store", vector_store), ("retriever", retriever), ("llm", llm), ("reranker", reranker),
+        ("engine", engine),
+    ]
+
+
+_warmups = {}
+_warmups_lock = threading.Lock()
+
+
+def start_warmup(db_path, k=4, hf_rep_id=None):
+    """The process-wide warmup of one engine configuration, started on first call."""
+    key = (db_path, k, hf_rep_id)
+    with _warmups_lock:
+        warmup = _warmups.get(key)
+        if warmup is None:
+            if READY_FILE and not _warmups and os.path.exists(READY_FILE):
+                # Left over from an earlier process
+                os.remove(READY_FILE)
+            warmup = _warmups[key] = Warmup(query_path_steps(db_path, k, hf_rep_id)).start()
+    return warmup